@@ -0,0 +1,154 @@
+"""
+Objective         -   Compare the WSGI ingest path (`wsgi.py` -> ExtractDataView) against the
+                      native async path (`asgi.py` -> ExtractDataAsyncView) under concurrent load.
+
+                      Both applications are driven in-process, without sockets:
+                        wsgi    -   a thread pool of --threads workers calling the WSGI callable,
+                                    like a threaded gunicorn worker.
+                        asgi    -   --concurrency requests in flight on one event loop calling
+                                    the ASGI callable, like a single uvicorn worker.
+                      Every request targets its own site folder so the runs measure request
+                      handling, not contention on one scroll lock.
+
+Usage (from web_extractor/):
+    python -m benchmarks.asgi_vs_wsgi --requests 200 --concurrency 64 --threads 8
+
+Modules / Functions:
+    run_wsgi    -   Post bodies through the WSGI application from a thread pool.
+    run_asgi    -   Post bodies through the ASGI application concurrently on one loop.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import (compare_results, peak_rss_bytes, reset_caches, setup_django,
+                     summarize, write_results)
+from .replay import load_captures
+
+
+def _bodies(count, sites=None):
+    captures = load_captures(sites=sites)
+    if not captures:
+        raise SystemExit("No captures found in Outputs/ to build payloads from")
+    bodies = []
+    for i in range(count):
+        _, _, payload = captures[i % len(captures)]
+        bodies.append(json.dumps(dict(payload, website=f"bench{i}.example")).encode())
+    return bodies
+
+
+def run_wsgi(bodies, threads, path="/api/extract/"):
+    from web_extractor.wsgi import application
+
+    def call(body):
+        environ = {
+            "REQUEST_METHOD": "POST", "PATH_INFO": path, "SCRIPT_NAME": "",
+            "QUERY_STRING": "", "SERVER_NAME": "testserver", "SERVER_PORT": "80",
+            "HTTP_HOST": "testserver", "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)), "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http", "wsgi.version": (1, 0),
+            "wsgi.multithread": True, "wsgi.multiprocess": False, "wsgi.run_once": False,
+        }
+        status_holder = []
+        started = time.perf_counter()
+        chunks = application(environ, lambda status, headers, exc_info=None: status_holder.append(status))
+        b"".join(chunks)
+        return time.perf_counter() - started, status_holder[0].startswith("200")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(call, bodies))
+    wall = time.perf_counter() - started
+    return results, wall
+
+
+def run_asgi(bodies, concurrency, path="/api/extract-async/"):
+    from web_extractor.asgi import application
+
+    async def call(body, gate):
+        async with gate:
+            messages = [{"type": "http.request", "body": body, "more_body": False}]
+            status_holder = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await asyncio.Event().wait()  # no disconnect while the view runs
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status_holder.append(message["status"])
+
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+                "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+                "query_string": b"", "root_path": "", "server": ("testserver", 80),
+                "client": ("127.0.0.1", 50000),
+                "headers": [(b"host", b"testserver"), (b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode())],
+            }
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            return time.perf_counter() - started, status_holder[0] == 200
+
+    async def main():
+        gate = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(call(body, gate) for body in bodies))
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    wall = time.perf_counter() - started
+    return results, wall
+
+
+def _summary(results, wall):
+    summary = summarize([latency for latency, _ in results], wall)
+    summary["failures"] = sum(1 for _, ok in results if not ok)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=8, help="WSGI worker threads")
+    parser.add_argument("--concurrency", type=int, default=64, help="In-flight ASGI requests")
+    parser.add_argument("--sites", nargs="*", help="Capture folders to build payloads from")
+    parser.add_argument("--output", help="Result JSON path (default benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    bodies = _bodies(args.requests, args.sites)
+    results = {"requests": args.requests, "threads": args.threads, "concurrency": args.concurrency}
+    cwd = os.getcwd()
+    try:
+        for name, runner, arg in (("wsgi", run_wsgi, args.threads),
+                                  ("asgi", run_asgi, args.concurrency)):
+            # Views write to a relative ./Outputs/; keep each run in a scratch directory
+            with tempfile.TemporaryDirectory(prefix=f"{name}_") as workdir:
+                os.chdir(workdir)
+                os.makedirs("Outputs", exist_ok=True)
+                reset_caches()
+                results[name] = _summary(*runner(bodies, arg))
+                os.chdir(cwd)
+            summary = results[name]
+            print(f"{name}: p50={summary['p50_ms']:.1f}ms p99={summary['p99_ms']:.1f}ms "
+                  f"throughput={summary['throughput_rps']:.1f} req/s failures={summary['failures']}")
+    finally:
+        os.chdir(cwd)
+    results["peak_rss_bytes"] = peak_rss_bytes()
+    print(f"results written to {write_results('asgi_vs_wsgi', results, args.output)}")
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
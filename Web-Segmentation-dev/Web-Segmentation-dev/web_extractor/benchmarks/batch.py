@@ -0,0 +1,188 @@
+"""
+Objective         -   Measure the per-batch cost of the ingest path's table handling at the
+                      sizes the extension posts (100 to 500 elements per scroll batch).
+
+                      Reported per size, for the pandas steps the ingest path used
+                      (DataFrame, astype(str) merge diff, projected xpath frame, to_csv) and
+                      for extractor.batch.ElementBatch doing the same work: latency of the
+                      initial save (parse, clean, three CSVs) and of a recapture (parse,
+                      read previous, diff, modified and current CSVs), and the memory
+                      allocated per batch (tracemalloc). End-to-end ingest_scroll_batch
+                      latency is measured with the indexes and built-in segmenters off, and
+                      with all of them on, in a scratch directory.
+
+Usage (from web_extractor/):
+    python -m benchmarks.batch --sizes 100 250 500 --repeat 200
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from .common import compare_results, peak_rss_bytes, setup_django, summarize, write_results
+from .synthetic import element_payload, generate_page
+
+XPATH_COLUMNS = ["webElementId", "original_xpath", "xpath", "text"]
+
+
+def pandas_diff(current, previous):
+    """
+    Rows of `current` with no identical row (on the shared columns) in `previous`,
+    compared as strings: the merge the ingest path used before extractor.batch.diff.
+    """
+    curr_cmp = current.astype(str)
+    prev_cmp = previous.astype(str)
+    diff = curr_cmp.merge(prev_cmp.drop_duplicates(), how="left", indicator=True)
+    return diff[diff["_merge"] != "both"].drop(columns=["_merge"])
+
+
+def pandas_initial(elements, folder):
+    import pandas as pd
+    from extractor.views import clean_xpath
+
+    df = pd.DataFrame(elements)
+    df.to_csv(os.path.join(folder, "uncleaned.csv"), index=False, encoding="utf-8")
+    df["original_xpath"] = df["xpath"]
+    df["xpath"] = df["xpath"].apply(clean_xpath)
+    df.to_csv(os.path.join(folder, "cleaned.csv"), index=False, encoding="utf-8")
+    df[XPATH_COLUMNS].to_csv(os.path.join(folder, "xpath.csv"), index=False, encoding="utf-8")
+
+
+def pandas_recapture(elements, folder):
+    import pandas as pd
+
+    df = pd.DataFrame(elements)
+    modified = pandas_diff(df, pd.read_csv(os.path.join(folder, "xpath.csv"), dtype=str))
+    modified["flagged_scroll_index"] = 0
+    modified.drop(columns=["scrollIndex"], inplace=True)
+    modified.to_csv(os.path.join(folder, "modified.csv"), index=False, encoding="utf-8")
+    df.to_csv(os.path.join(folder, "current.csv"), index=False, encoding="utf-8")
+
+
+def batch_initial(elements, folder):
+    from extractor import batch
+    from extractor.views import clean_xpath
+
+    current = batch.ElementBatch.from_records(elements)
+    current.to_csv(os.path.join(folder, "uncleaned.csv"))
+    current["original_xpath"] = current["xpath"]
+    current["xpath"] = [clean_xpath(xpath) for xpath in current["xpath"]]
+    current.to_csv(os.path.join(folder, "cleaned.csv"))
+    current.to_csv(os.path.join(folder, "xpath.csv"), columns=XPATH_COLUMNS)
+
+
+def batch_recapture(elements, folder):
+    from extractor import batch
+
+    current = batch.ElementBatch.from_records(elements)
+    modified = batch.diff(current, batch.read_csv(os.path.join(folder, "xpath.csv")))
+    modified["flagged_scroll_index"] = 0
+    modified.drop(["scrollIndex"])
+    modified.to_csv(os.path.join(folder, "modified.csv"))
+    current.to_csv(os.path.join(folder, "current.csv"))
+
+
+def _measure(fn, elements, folder, repeat):
+    latency = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(elements, folder)
+        latency.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    fn(elements, folder)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {**summarize(latency), "peak_alloc_bytes": peak}
+
+
+def _ingest(size, repeat, label):
+    from extractor import views
+
+    payloads = [element_payload(generate_page(nodes=size + 1, seed=seed), scroll_index=seed)
+                for seed in range(repeat)]
+    initial, recapture = [], []
+    for scroll, payload in enumerate(payloads):
+        for samples in (initial, recapture):
+            t0 = time.perf_counter()
+            views.ingest_scroll_batch(f"bench.batch.{label}.{size}", scroll, payload, segment=False)
+            samples.append(time.perf_counter() - t0)
+    return {"initial": summarize(initial), "recapture": summarize(recapture)}
+
+
+def run(sizes, repeat):
+    from django.conf import settings
+
+    results = {}
+    for size in sizes:
+        elements = element_payload(generate_page(nodes=size + 1, seed=size))
+        folder = tempfile.mkdtemp(prefix="batch-")
+        entry = {}
+        for name, initial, recapture in (("pandas", pandas_initial, pandas_recapture),
+                                         ("batch", batch_initial, batch_recapture)):
+            entry[name] = {
+                "initial": _measure(initial, elements, folder, repeat),
+                "recapture": _measure(recapture, elements, folder, repeat),
+            }
+        shutil.rmtree(folder, ignore_errors=True)
+
+        # End to end, first with only the table handling, then with every index and
+        # built-in segmenter on
+        saved = {name: getattr(settings, name, {}) for name in
+                 ("EXTRACTOR_IDENTITY", "EXTRACTOR_SEARCH", "EXTRACTOR_SIMILAR",
+                  "EXTRACTOR_SEGMENTATION", "EXTRACTOR_HISTORY")}
+        for label, flag in (("tables_only", False), ("all", True)):
+            for name, value in saved.items():
+                setattr(settings, name, {**value, "ENABLED": flag, "STRUCTURAL": flag,
+                                         "VISUAL": flag, "FUSION": flag})
+            entry[f"ingest_{label}"] = _ingest(size, max(1, repeat // 4), label)
+        for name, value in saved.items():
+            setattr(settings, name, value)
+        results[size] = entry
+
+        print(f"{size} elements:")
+        for name in ("pandas", "batch"):
+            for step in ("initial", "recapture"):
+                stats = entry[name][step]
+                print(f"  {name:6} {step:9} p50={stats['p50_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms "
+                      f"alloc={stats['peak_alloc_bytes'] / 1024:.0f}KiB")
+        for name in ("ingest_tables_only", "ingest_all"):
+            print(f"  {name}: initial p50={entry[name]['initial']['p50_ms']:.2f}ms, "
+                  f"recapture p50={entry[name]['recapture']['p50_ms']:.2f}ms")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 250, 500])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", help="Result JSON path (default benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from extractor import views
+
+    # Views write to a relative ./Outputs/; keep the run in a scratch directory
+    cwd = os.getcwd()
+    folder = tempfile.mkdtemp(prefix="batch-")
+    os.chdir(folder)
+    os.makedirs(views.OUTPUT_DIR, exist_ok=True)
+    try:
+        results = {
+            "batch": run(args.sizes, args.repeat),
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder, ignore_errors=True)
+    print(f"results written to {write_results('batch', results, args.output)}")
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
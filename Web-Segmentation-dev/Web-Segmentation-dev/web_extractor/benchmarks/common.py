@@ -0,0 +1,142 @@
+"""
+Objective         -   Shared helpers for the benchmark scripts: Django bootstrap, latency
+                      statistics, peak RSS, and JSON result files that can be compared
+                      between commits.
+
+Modules / Functions:
+    setup_django        -   Configure settings and make the project importable.
+    reset_caches        -   Clear Django caches (e.g. remembered batch responses) between runs.
+    percentile          -   Nearest-rank percentile of a list of samples.
+    summarize           -   p50/p99/mean/max and throughput for latency samples.
+    peak_rss_bytes      -   Peak resident set size of the current process.
+    git_revision        -   Short hash of the checked-out commit, if any.
+    write_results       -   Store a result document under benchmarks/results/.
+    compare_results     -   Print relative change of matching metrics against a baseline file.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(PROJECT_DIR, "benchmarks", "results")
+
+
+def setup_django():
+    """
+    Make `web_extractor` importable from any working directory and initialise Django
+    with the test environment (so the test client's host is allowed).
+    """
+    if PROJECT_DIR not in sys.path:
+        sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "web_extractor.settings")
+    import django
+    from django.test.utils import setup_test_environment
+    django.setup()
+    setup_test_environment()
+
+
+def reset_caches():
+    """
+    Forget remembered batch responses so replayed payloads are processed again
+    instead of being answered by the idempotency layer.
+    """
+    from django.core.cache import caches
+    for cache in caches.all():
+        cache.clear()
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def summarize(samples, wall_seconds=None):
+    """
+    Latency summary in milliseconds; throughput is requests per wall-clock second.
+    """
+    if not samples:
+        return {"count": 0}
+    wall = wall_seconds if wall_seconds is not None else sum(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+        "throughput_rps": len(samples) / wall if wall else None,
+    }
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(name, results, path=None):
+    """
+    Write results as JSON, tagged with the commit and time. Returns the file path.
+    """
+    document = {
+        "benchmark": name,
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(
+            RESULTS_DIR, f"{name}_{document['revision']}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        )
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    return path
+
+
+def compare_results(baseline_path, results):
+    """
+    Print the relative change of every numeric leaf present in both result trees.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (revision {baseline.get('revision')}):")
+    for key, old, new in _numeric_pairs(baseline.get("results", {}), results):
+        change = (new - old) / old * 100 if old else float("nan")
+        print(f"  {key:<60} {old:>12.3f} -> {new:>12.3f}  ({change:+.1f}%)")
+
+
+def _numeric_pairs(old, new, prefix=""):
+    for key, old_value in old.items():
+        if key not in new:
+            continue
+        new_value = new[key]
+        name = f"{prefix}{key}"
+        if isinstance(old_value, dict) and isinstance(new_value, dict):
+            yield from _numeric_pairs(old_value, new_value, name + ".")
+        elif (isinstance(old_value, (int, float)) and isinstance(new_value, (int, float))
+              and not isinstance(old_value, bool)):
+            yield name, float(old_value), float(new_value)
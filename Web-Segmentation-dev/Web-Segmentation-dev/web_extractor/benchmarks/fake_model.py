@@ -0,0 +1,105 @@
+"""
+Objective         -   Local stand-in for the segmentation model, so windowed LLM segmentation
+                      (extractor/segmentation/windows.py) can be run and measured offline.
+
+                      Serves POST /v1/chat/completions (OpenAI-compatible). The prompt's rows are
+                      decoded with prompt.decode_rows and every element is put in the segment of
+                      its xpath cut to --depth steps; the reply uses the `<segment>: <rows>`
+                      format prompt.parse_reply reads. The answer for a row depends only on that
+                      row, so a windowed run should agree with fake_segments over the whole
+                      table. --latency adds a fixed delay per request, like a real model.
+
+Usage (from web_extractor/):
+    python -m benchmarks.fake_model --port 8765 --latency 0.5
+    # then EXTRACTOR_SEGMENTATION["LLM_URL"] = "http://127.0.0.1:8765/v1/chat/completions"
+
+Modules / Functions:
+    fake_segments   -   Segment key of every xpath, as the fake model assigns them.
+    reply_for       -   Reply text to one prompt.
+    serve           -   Start the server on a background thread.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from .common import setup_django
+
+
+def fake_segments(xpaths, depth: int = 4) -> pd.Series:
+    """
+    The first `depth` steps of each xpath, the fake model's segment key.
+    """
+    return pd.Series(xpaths).str.split("/").str[:depth + 1].str.join("/")
+
+
+def reply_for(text: str, depth: int = 4) -> str:
+    from extractor.segmentation import prompt
+
+    rows = prompt.decode_rows(text)
+    keys = fake_segments(rows["xpath"], depth)
+    return "\n".join(f"{i + 1}: " + ",".join(map(str, rows["index"][keys == key]))
+                     for i, key in enumerate(keys.unique()))
+
+
+def _handler(latency: float, depth: int):
+    class Handler(BaseHTTPRequestHandler):
+        requests = 0
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            time.sleep(latency)
+            content = reply_for(body["messages"][-1]["content"], depth)
+            Handler.requests += 1
+            data = json.dumps({
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int = 0, latency: float = 0.0, depth: int = 4) -> ThreadingHTTPServer:
+    """
+    Start the fake model on 127.0.0.1:`port` (0 picks a free one) in a daemon thread;
+    the chat completions URL is f"http://127.0.0.1:{server.server_port}/v1/chat/completions".
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _handler(latency, depth))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-model").start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every reply")
+    parser.add_argument("--depth", type=int, default=4, help="Xpath steps that key a segment")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    server = serve(args.port, args.latency, args.depth)
+    print(f"fake model on http://127.0.0.1:{server.server_port}/v1/chat/completions")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Objective         -   Measure grounding lookups (extractor/grounding.py) on a synthetic site of
+                      --scrolls scrolls of --elements elements each, saved through the real
+                      ingest path in a scratch directory.
+
+                      Reported: the cold load of the site index, and warm latency of point,
+                      region, text and text-in-region lookups over the whole site, each called
+                      directly and through GET api/ground/.
+
+Usage (from web_extractor/):
+    python -m benchmarks.grounding --scrolls 20 --elements 5000 --queries 2000
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from .common import compare_results, peak_rss_bytes, setup_django, summarize, write_results
+from .synthetic import WORDS, element_payload, generate_page
+
+VIEWPORT_HEIGHT = 912
+
+
+def run(scrolls, elements, queries):
+    from django.test import Client
+    from extractor import grounding, views
+
+    for scroll in range(scrolls):
+        payload = element_payload(generate_page(nodes=elements + 1, seed=scroll), scroll_index=scroll)
+        for element in payload:
+            element["y"] += scroll * VIEWPORT_HEIGHT
+        views.ingest_scroll_batch("bench.grounding", scroll, payload, segment=False)
+    site_folder = os.path.join(views.OUTPUT_DIR, "bench_grounding")
+
+    started = time.perf_counter()
+    grounding.site_index(site_folder)
+    cold = time.perf_counter() - started
+    print(f"cold load: {scrolls * elements} elements in {cold * 1000:.0f}ms")
+
+    rng = random.Random(0)
+    height = scrolls * VIEWPORT_HEIGHT
+    kinds = {
+        "point": lambda: {"x": rng.uniform(0, 1920), "y": rng.uniform(0, height)},
+        "region": lambda: {"x": rng.uniform(0, 1500), "y": rng.uniform(0, height), "width": 400, "height": 300},
+        "text": lambda: {"q": " ".join(rng.sample(WORDS, 2))},
+        "text_region": lambda: {"q": rng.choice(WORDS), "x": 0, "y": rng.uniform(0, height),
+                                "width": 1920, "height": VIEWPORT_HEIGHT},
+    }
+    client = Client()
+    results = {"elements": scrolls * elements, "cold_load_ms": cold * 1000}
+    for kind, make in kinds.items():
+        direct, http = [], []
+        for _ in range(queries):
+            params = make()
+            region = None
+            if "x" in params:
+                region = (params["x"], params["y"], params["x"] + params.get("width", 0),
+                          params["y"] + params.get("height", 0))
+            t0 = time.perf_counter()
+            grounding.ground(site_folder, None, region, params.get("q"))
+            direct.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            client.get("/api/ground/", {"site": "bench.grounding", **params})
+            http.append(time.perf_counter() - t0)
+        results[kind] = {"direct": summarize(direct), "http": summarize(http)}
+        print(f"{kind}: direct p50={results[kind]['direct']['p50_ms']:.2f}ms "
+              f"p99={results[kind]['direct']['p99_ms']:.2f}ms, "
+              f"http p50={results[kind]['http']['p50_ms']:.2f}ms p99={results[kind]['http']['p99_ms']:.2f}ms")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scrolls", type=int, default=20)
+    parser.add_argument("--elements", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--output", help="Result JSON path (default benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+    from extractor import views
+
+    # Views write to a relative ./Outputs/; keep the run in a scratch directory
+    cwd = os.getcwd()
+    folder = tempfile.mkdtemp(prefix="grounding-")
+    os.chdir(folder)
+    os.makedirs(views.OUTPUT_DIR, exist_ok=True)
+    # Only the grounding index is measured; skip the others at ingest
+    settings.EXTRACTOR_SEARCH = {**getattr(settings, "EXTRACTOR_SEARCH", {}), "ENABLED": False}
+    settings.EXTRACTOR_SIMILAR = {**getattr(settings, "EXTRACTOR_SIMILAR", {}), "ENABLED": False}
+    try:
+        results = {
+            "grounding": run(args.scrolls, args.elements, args.queries),
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder, ignore_errors=True)
+    print(f"results written to {write_results('grounding', results, args.output)}")
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Objective         -   Measure windowed LLM segmentation (extractor/segmentation/windows.py)
+                      against the local fake model (benchmarks/fake_model.py), offline.
+
+                      For each of --sizes synthetic elements and each --concurrency, the whole
+                      path runs: window planning, prompt serialization, concurrent requests over
+                      HTTP, reply parsing and stitching. Reported per run: wall time, number of
+                      windows, and agreement with the fake model's answer for the whole table
+                      (share of neighbouring row pairs both put in the same / different
+                      segments), which checks the stitching.
+
+Usage (from web_extractor/):
+    python -m benchmarks.llm_windows --sizes 2000 10000 --concurrency 1 4 16 --latency 0.2
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import argparse
+import asyncio
+import time
+
+import numpy as np
+import pandas as pd
+
+from .common import compare_results, peak_rss_bytes, setup_django, write_results
+from .fake_model import fake_segments, serve
+from .synthetic import element_payload, generate_page
+
+
+def agreement(labels: np.ndarray, reference: np.ndarray) -> float:
+    """
+    Share of neighbouring rows that both labelings put together or both put apart.
+    """
+    if len(labels) < 2:
+        return 1.0
+    same = labels[1:] == labels[:-1]
+    expected = reference[1:] == reference[:-1]
+    return float((same == expected).mean())
+
+
+def run(sizes, concurrencies, budget, depth):
+    from extractor.segmentation import windows
+
+    results = {}
+    for size in sizes:
+        table = pd.DataFrame(element_payload(generate_page(nodes=size + 1, seed=size)))
+        reference = pd.factorize(fake_segments(table["xpath"], depth))[0]
+        spans = windows.plan_windows(table, budget)
+        for concurrency in concurrencies:
+            started = time.perf_counter()
+            result = asyncio.run(windows.segment(table, budget, concurrency))
+            wall = time.perf_counter() - started
+            key = f"{size}_c{concurrency}"
+            results[key] = {
+                "wall_ms": wall * 1000,
+                "windows": len(spans),
+                "agreement": agreement(result["segmentId"].to_numpy(), reference),
+            }
+            print(f"windows {key}: {wall * 1000:.0f}ms windows={len(spans)} "
+                  f"agreement={results[key]['agreement']:.4f}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 10000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--budget", type=int, default=None, help="Prompt token budget (default PROMPT_BUDGET)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake model seconds per request")
+    parser.add_argument("--depth", type=int, default=4, help="Fake model segment depth")
+    parser.add_argument("--output", help="Result JSON path (default benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+
+    server = serve(latency=args.latency, depth=args.depth)
+    settings.EXTRACTOR_SEGMENTATION = {
+        **getattr(settings, "EXTRACTOR_SEGMENTATION", {}),
+        "LLM_URL": f"http://127.0.0.1:{server.server_port}/v1/chat/completions",
+    }
+    try:
+        results = {
+            "windows": run(args.sizes, args.concurrency, args.budget, args.depth),
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+    finally:
+        server.shutdown()
+    print(f"results written to {write_results('llm_windows', results, args.output)}")
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
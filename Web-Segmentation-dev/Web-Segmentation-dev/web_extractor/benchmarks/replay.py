@@ -0,0 +1,170 @@
+"""
+Objective         -   Replay real captures from Outputs/ through ExtractDataView to measure ingest
+                      performance reproducibly between commits.
+
+                      For every `Outputs/<site>/scroll_<n>/` the `api/extract/` payload is rebuilt
+                      from `uncleaned_<site>_<n>.csv` and the scroll screenshot (re-encoded as a
+                      PNG data URL). Each iteration posts every batch into a fresh, empty output
+                      directory (initial path) and then posts a perturbed copy (recapture path).
+
+Usage (from web_extractor/):
+    python -m benchmarks.replay --iterations 5
+    python -m benchmarks.replay --sites amazon_com --compare benchmarks/results/<old>.json
+
+Modules / Functions:
+    load_captures       -   Rebuild request payloads from captured scroll folders.
+    perturb             -   Copy a payload with a fraction of element texts changed.
+    run                 -   Replay payloads and collect latency / throughput / RSS results.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import argparse
+import base64
+import glob
+import json
+import os
+import re
+import tempfile
+import time
+
+from .common import (PROJECT_DIR, compare_results, peak_rss_bytes, reset_caches,
+                     setup_django, summarize, write_results)
+
+
+CAPTURES_DIR = os.path.join(PROJECT_DIR, "Outputs")
+
+
+def load_captures(captures_dir=CAPTURES_DIR, sites=None):
+    """
+    Return a list of (site, scroll_index, payload) rebuilt from captured scroll folders.
+    """
+    import pandas as pd
+
+    payloads = []
+    for site_dir in sorted(glob.glob(os.path.join(captures_dir, "*"))):
+        site = os.path.basename(site_dir)
+        if not os.path.isdir(site_dir) or (sites and site not in sites):
+            continue
+        for scroll_dir in glob.glob(os.path.join(site_dir, "scroll_*")):
+            match = re.fullmatch(r"scroll_(\d+)", os.path.basename(scroll_dir))
+            uncleaned = os.path.join(scroll_dir, f"uncleaned_{site}_{match.group(1)}.csv") if match else None
+            if not uncleaned or not os.path.exists(uncleaned):
+                continue
+            scroll_index = int(match.group(1))
+            df = pd.read_csv(uncleaned, dtype=str, keep_default_na=False)
+            elements = df.to_dict("records")
+            for element in elements:
+                for key in ("webElementId", "scrollIndex"):
+                    if element.get(key, "").lstrip("-").isdigit():
+                        element[key] = int(element[key])
+            payloads.append((site, scroll_index, {
+                "website": site,
+                "scroll_index": scroll_index,
+                "screenshot": _screenshot_data_url(scroll_dir, site, scroll_index),
+                "elements": elements,
+            }))
+    payloads.sort(key=lambda item: (item[0], item[1]))
+    return payloads
+
+
+def perturb(payload, fraction=0.1):
+    """
+    Copy a payload and change the text of every ceil(1/fraction)-th element so the
+    recapture diff has work to do.
+    """
+    step = max(1, int(round(1 / fraction))) if fraction else 0
+    elements = [dict(element) for element in payload["elements"]]
+    if step:
+        for element in elements[::step]:
+            element["text"] = f"{element.get('text', '')} (recaptured)"
+    return dict(payload, elements=elements)
+
+
+def run(payloads, iterations=3, recapture_fraction=0.1):
+    """
+    Replay all payloads `iterations` times through the Django test client.
+    """
+    from django.test import Client
+
+    client = Client()
+    bodies = [(json.dumps(p), json.dumps(perturb(p, recapture_fraction))) for _, _, p in payloads]
+    request_bytes = sum(len(initial) for initial, _ in bodies)
+    latencies = {"initial": [], "recapture": []}
+    wall = {"initial": 0.0, "recapture": 0.0}
+    failures = 0
+    cwd = os.getcwd()
+    try:
+        for _ in range(iterations):
+            # ExtractDataView writes to a relative ./Outputs/, so a fresh working
+            # directory per iteration keeps every first post on the initial path.
+            with tempfile.TemporaryDirectory(prefix="replay_") as workdir:
+                os.chdir(workdir)
+                os.makedirs("Outputs", exist_ok=True)
+                reset_caches()
+                for path, column in (("initial", 0), ("recapture", 1)):
+                    started = time.perf_counter()
+                    for body in (pair[column] for pair in bodies):
+                        t0 = time.perf_counter()
+                        response = client.post("/api/extract/", body, content_type="application/json")
+                        latencies[path].append(time.perf_counter() - t0)
+                        failures += response.status_code != 200
+                    wall[path] += time.perf_counter() - started
+                os.chdir(cwd)
+    finally:
+        os.chdir(cwd)
+
+    return {
+        "batches": len(payloads),
+        "iterations": iterations,
+        "elements_per_pass": sum(len(p["elements"]) for _, _, p in payloads),
+        "request_bytes_per_pass": request_bytes,
+        "failures": failures,
+        "initial": summarize(latencies["initial"], wall["initial"]),
+        "recapture": summarize(latencies["recapture"], wall["recapture"]),
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def _screenshot_data_url(scroll_dir, site, scroll_index):
+    """
+    Re-encode the scroll screenshot (or, if missing, the latest modification
+    screenshot) as a PNG data URL, matching what `captureVisibleTab` sends.
+    """
+    candidates = [os.path.join(scroll_dir, f"{site}_{scroll_index}.png")]
+    candidates += sorted(glob.glob(os.path.join(scroll_dir, f"{site}_modified_{scroll_index}_*.png")))[-1:]
+    for path in candidates:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return "data:image/png;base64," + base64.b64encode(f.read()).decode("ascii")
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--captures", default=CAPTURES_DIR, help="Outputs directory to replay")
+    parser.add_argument("--sites", nargs="*", help="Only replay these site folders")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--recapture-fraction", type=float, default=0.1,
+                        help="Fraction of elements whose text changes on recapture")
+    parser.add_argument("--output", help="Result JSON path (default benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    payloads = load_captures(os.path.abspath(args.captures), args.sites)
+    if not payloads:
+        parser.error(f"No captures found in {args.captures}")
+    results = run(payloads, args.iterations, args.recapture_fraction)
+
+    for path in ("initial", "recapture"):
+        summary = results[path]
+        print(f"{path:<10} n={summary['count']:<5} p50={summary['p50_ms']:.2f}ms "
+              f"p99={summary['p99_ms']:.2f}ms throughput={summary['throughput_rps']:.1f} req/s")
+    print(f"peak RSS: {results['peak_rss_bytes'] / 2**20:.1f} MiB, failures: {results['failures']}")
+    print(f"results written to {write_results('replay', results, args.output)}")
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Objective         -   Measure how the extraction and ingest code paths scale with page size on
+                      synthetic DOMs (1k to 200k nodes) and plot the scaling curves.
+
+                      Paths timed per size:
+                        xpath_extension / xpath_extension_naive   -   extractor.js `getXPath`
+                        xpath_relative / xpath_relative_naive     -   Selenium `get_relative_xpath`
+                        clean_rowwise / clean_vectorized          -   `clean_xpath` via apply vs str.replace
+                        diff / diff_pandas                        -   `batch.diff` (ingest path) and the former
+                                                                      pandas merge against a 5% perturbed copy
+                        write_csv / write_columnar                -   to_csv vs Parquet (if pyarrow is installed)
+                      Naive variants are quadratic and only run up to --naive-max nodes.
+
+Usage (from web_extractor/):
+    python -m benchmarks.scaling --sizes 1000 10000 50000 200000 --plot scaling.png
+
+Modules / Functions:
+    run_size    -   Time every path for one synthetic page size.
+    run         -   Sweep sizes and collect results.
+    plot        -   Log-log scaling curves per path (requires matplotlib).
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import argparse
+import os
+import tempfile
+import time
+
+from .batch import pandas_diff
+from .common import compare_results, peak_rss_bytes, setup_django, write_results
+from . import synthetic
+
+
+DEFAULT_SIZES = (1000, 5000, 20000, 50000, 200000)
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def run_size(nodes, depth, class_pool, text_density, naive_max, workdir):
+    import pandas as pd
+    from extractor import batch
+    from extractor.views import clean_xpath
+
+    timings = {}
+    page, timings["generate"] = _timed(
+        synthetic.generate_page, nodes, depth, class_pool, 0.05, text_density
+    )
+    html, timings["render_html"] = _timed(synthetic.render_html, page)
+
+    xpaths, timings["xpath_extension"] = _timed(synthetic.extension_xpaths, page)
+    _, timings["xpath_relative"] = _timed(synthetic.relative_xpaths, page)
+    if nodes <= naive_max:
+        naive, timings["xpath_extension_naive"] = _timed(synthetic.extension_xpaths_naive, page)
+        assert naive == xpaths, "naive and top-down xpath generation disagree"
+        _, timings["xpath_relative_naive"] = _timed(synthetic.relative_xpaths_naive, page)
+
+    elements = synthetic.element_payload(page, xpaths)
+    df, timings["dataframe"] = _timed(pd.DataFrame, elements)
+
+    cleaned, timings["clean_rowwise"] = _timed(lambda s: s.apply(clean_xpath), df["xpath"])
+    vectorized, timings["clean_vectorized"] = _timed(
+        lambda s: s.str.replace(r"\[\d+\]", "", regex=True).str.replace(r"/\d+", "", regex=True),
+        df["xpath"],
+    )
+    assert cleaned.equals(vectorized), "row-wise and vectorized cleaning disagree"
+
+    # The previous snapshot is read back from CSV, so its values are strings
+    current = batch.ElementBatch.from_records(elements)
+    previous = batch.ElementBatch(current.columns, {name: current.text(name) for name in current.columns})
+    previous["text"] = ["changed" if i % 20 == 0 else text for i, text in enumerate(previous["text"])]
+    modified, timings["diff"] = _timed(batch.diff, current, previous)
+    previous_df = df.copy()
+    previous_df.loc[previous_df.index[::20], "text"] = "changed"
+    modified_df, timings["diff_pandas"] = _timed(pandas_diff, df, previous_df)
+    assert len(modified) == len(modified_df), "batch and pandas diffs disagree"
+
+    csv_path = os.path.join(workdir, f"synthetic_{nodes}.csv")
+    _, timings["write_csv"] = _timed(lambda: df.to_csv(csv_path, index=False, encoding="utf-8"))
+    try:
+        import pyarrow  # noqa: F401  (optional dependency)
+        parquet_path = os.path.join(workdir, f"synthetic_{nodes}.parquet")
+        _, timings["write_columnar"] = _timed(lambda: df.to_parquet(parquet_path, index=False))
+    except ImportError:
+        pass
+
+    return {
+        "nodes": nodes,
+        "html_bytes": len(html),
+        "rows_modified": len(modified),
+        "seconds": timings,
+    }
+
+
+def run(sizes, depth=12, class_pool=50, text_density=0.4, naive_max=20000):
+    results = []
+    with tempfile.TemporaryDirectory(prefix="scaling_") as workdir:
+        for nodes in sizes:
+            result = run_size(nodes, depth, class_pool, text_density, naive_max, workdir)
+            results.append(result)
+            print(f"{nodes:>8} nodes  " + "  ".join(
+                f"{name}={seconds * 1000:.1f}ms" for name, seconds in result["seconds"].items()
+            ))
+    return {
+        "parameters": {"depth": depth, "class_pool": class_pool,
+                       "text_density": text_density, "naive_max": naive_max},
+        "sizes": {str(r["nodes"]): r for r in results},
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def plot(results, path):
+    """
+    Log-log plot of seconds vs node count, one line per path.
+    """
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed; skipping plot")
+        return None
+    series = {}
+    for entry in results["sizes"].values():
+        for name, seconds in entry["seconds"].items():
+            series.setdefault(name, []).append((entry["nodes"], seconds))
+    fig, ax = plt.subplots(figsize=(9, 6))
+    for name, points in sorted(series.items()):
+        points.sort()
+        ax.plot([p[0] for p in points], [p[1] for p in points], marker="o", label=name)
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel("nodes")
+    ax.set_ylabel("seconds")
+    ax.set_title("Extraction / ingest scaling on synthetic pages")
+    ax.grid(True, which="both", alpha=0.3)
+    ax.legend(fontsize="small")
+    fig.savefig(path, dpi=120, bbox_inches="tight")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--depth", type=int, default=12)
+    parser.add_argument("--class-pool", type=int, default=50,
+                        help="Distinct class names; lower means more repetition")
+    parser.add_argument("--text-density", type=float, default=0.4)
+    parser.add_argument("--naive-max", type=int, default=20000,
+                        help="Largest size to run the quadratic reference implementations on")
+    parser.add_argument("--plot", help="Write scaling curves to this image path")
+    parser.add_argument("--output", help="Result JSON path (default benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    results = run(args.sizes, args.depth, args.class_pool, args.text_density, args.naive_max)
+    print(f"results written to {write_results('scaling', results, args.output)}")
+    if args.plot and plot(results, args.plot):
+        print(f"plot written to {args.plot}")
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Objective         -   Measure indexing throughput and query latency of the element full-text
+                      index (extractor/search.py) at millions of rows.
+
+                      Synthetic pages (benchmarks/synthetic.py) are indexed as scrolls of
+                      --scroll-size elements spread over --sites sites, into a scratch database.
+                      Element text is drawn from a Zipf-distributed vocabulary of --vocabulary
+                      words, like real UI text, and queries sample words from the same
+                      distribution; a mix of single / two-word, prefix, site-filtered and
+                      deep-page queries is timed. Ranking is O(matching rows), so the words
+                      shared by a large fraction of all rows are the slow case.
+
+Usage (from web_extractor/):
+    python -m benchmarks.search --rows 2000000 --queries 200
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+from .common import compare_results, peak_rss_bytes, setup_django, summarize, write_results
+from .synthetic import element_payload, generate_page
+
+
+class Vocabulary:
+    """
+    Zipf-distributed synthetic words ("w0" most frequent).
+    """
+    def __init__(self, size, seed=0):
+        self.words = [f"w{i}" for i in range(size)]
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(size)))
+        self.rng = random.Random(seed)
+
+    def sample(self, k):
+        return self.rng.choices(self.words, cum_weights=self.cum_weights, k=k)
+
+
+def build_index(rows, scroll_size, sites, vocabulary):
+    from extractor import search
+
+    page = generate_page(nodes=scroll_size + 1, text_density=0.9, seed=1)
+    table = pd.DataFrame(element_payload(page))
+    scrolls = max(1, rows // scroll_size)
+    started = time.perf_counter()
+    for n in range(scrolls):
+        table["text"] = [" ".join(vocabulary.sample(vocabulary.rng.randint(1, 5)))
+                         for _ in range(len(table))]
+        search.index_scroll(f"site{n % sites}", n // sites, table)
+    elapsed = time.perf_counter() - started
+    indexed = scrolls * len(table)
+    return {"rows": indexed, "seconds": elapsed, "rows_per_second": indexed / elapsed}
+
+
+def run_queries(count, sites, vocabulary):
+    from extractor import search
+
+    rng = vocabulary.rng
+    word = lambda: vocabulary.sample(1)[0]
+    kinds = {
+        "word": lambda: (search.match_expression(word()), None, 0),
+        "two_words": lambda: (search.match_expression(" ".join(vocabulary.sample(2))), None, 0),
+        "prefix": lambda: (search.match_expression(word()[:4], prefix=True), None, 0),
+        "site": lambda: (search.match_expression(word()), f"site{rng.randrange(sites)}", 0),
+        "deep_page": lambda: (search.match_expression(word()), None, 200),
+    }
+    results = {}
+    for kind, make in kinds.items():
+        samples = []
+        for _ in range(count):
+            expression, site, offset = make()
+            started = time.perf_counter()
+            list(search.search(expression, site, limit=21, offset=offset))
+            samples.append(time.perf_counter() - started)
+        results[kind] = summarize(samples)
+        print(f"{kind}: p50={results[kind]['p50_ms']:.2f}ms p99={results[kind]['p99_ms']:.2f}ms")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--scroll-size", type=int, default=1000)
+    parser.add_argument("--sites", type=int, default=20)
+    parser.add_argument("--vocabulary", type=int, default=50000, help="Distinct words in element text")
+    parser.add_argument("--queries", type=int, default=100, help="Queries per kind")
+    parser.add_argument("--output", help="Result JSON path (default benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+
+    with tempfile.TemporaryDirectory(prefix="search_") as workdir:
+        settings.EXTRACTOR_SEARCH = dict(settings.EXTRACTOR_SEARCH, DB=os.path.join(workdir, "search.sqlite3"))
+        vocabulary = Vocabulary(args.vocabulary)
+        results = {"index": build_index(args.rows, args.scroll_size, args.sites, vocabulary)}
+        print(f"indexed {results['index']['rows']} rows at {results['index']['rows_per_second']:.0f} rows/s")
+        results["queries"] = run_queries(args.queries, args.sites, vocabulary)
+        results["db_bytes"] = os.path.getsize(settings.EXTRACTOR_SEARCH["DB"])
+    results["peak_rss_bytes"] = peak_rss_bytes()
+    print(f"results written to {write_results('search', results, args.output)}")
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Objective         -   Measure the built-in segmenters (extractor/segmentation/) at the sizes they
+                      have to handle inline with ingest.
+
+                      structural    -   structural.segment on synthetic pages of --sizes elements,
+                                        with and without bbox columns.
+                      visual        -   visual.segment_image on a rendered synthetic viewport
+                                        (boxes of the page's first screen drawn with PIL) and on
+                                        any --screenshot given, with the elements' boxes joined.
+                      fusion        -   fusion.fuse of the structural segmentation and a synthetic
+                                        visual grouping (horizontal page bands) of --sizes elements.
+                      prompt        -   prompt.serialize / prompt.fit of --sizes elements, with the
+                                        token counts of the prompt and of the raw xpath CSV.
+                      embedding     -   embedding.segment of --sizes elements, with and without
+                                        bbox columns.
+
+Usage (from web_extractor/):
+    python -m benchmarks.segmentation --sizes 1000 10000 50000 --screenshot Outputs/amazon_com/scroll_1/amazon_com_1.png
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import argparse
+import time
+
+import pandas as pd
+
+from .common import compare_results, peak_rss_bytes, setup_django, summarize, write_results
+from .synthetic import element_payload, generate_page
+
+
+BBOX_COLUMNS = ["x", "y", "width", "height"]
+
+
+def _time(fn, repeat):
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def render_viewport(table, size=(1920, 912)):
+    """
+    Draw the boxes that start inside the first viewport, like a wireframe screenshot;
+    page-sized containers are left out, as their outlines would frame everything.
+    """
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    area = table["width"] * table["height"]
+    visible = table[(table["y"] < size[1]) & (table["width"] > 2) & (table["height"] > 2)
+                    & (area < size[0] * size[1] / 16)]
+    for i, (x, y, w, h) in enumerate(visible[BBOX_COLUMNS].itertuples(index=False, name=None)):
+        shade = 200 - (i * 37) % 160
+        draw.rectangle([x, y, x + w - 1, y + h - 1], outline=(shade, shade, shade))
+    return image
+
+
+def run_structural(sizes, repeat):
+    from extractor.segmentation import structural
+
+    results = {}
+    for size in sizes:
+        table = pd.DataFrame(element_payload(generate_page(nodes=size + 1, seed=size)))
+        for variant, frame in (("xpath", table.drop(columns=BBOX_COLUMNS)), ("xpath_bbox", table)):
+            key = f"{variant}_{size}"
+            results[key] = _time(lambda: structural.segment(frame), repeat)
+            segments = structural.segment(frame)["segmentId"].nunique()
+            results[key]["segments"] = int(segments)
+            print(f"structural {key}: p50={results[key]['p50_ms']:.1f}ms segments={segments}")
+    return results
+
+
+def run_visual(screenshots, repeat):
+    from PIL import Image
+    from extractor.segmentation import visual
+
+    table = pd.DataFrame(element_payload(generate_page(nodes=2001, seed=7)))
+    images = {"synthetic": render_viewport(table)}
+    for path in screenshots:
+        images[path] = Image.open(path)
+        images[path].load()
+
+    results = {}
+    for name, image in images.items():
+        results[name] = _time(lambda: visual.segment_image(image, table, 0), repeat)
+        groups = visual.segment_image(image, table, 0)["Group"].nunique()
+        results[name]["groups"] = int(groups)
+        print(f"visual {name}: p50={results[name]['p50_ms']:.1f}ms groups={groups}")
+    return results
+
+
+def run_embedding(sizes, repeat):
+    from extractor.segmentation import embedding
+
+    results = {}
+    for size in sizes:
+        table = pd.DataFrame(element_payload(generate_page(nodes=size + 1, seed=size)))
+        for variant, frame in (("xpath", table.drop(columns=BBOX_COLUMNS)), ("xpath_bbox", table)):
+            key = f"{variant}_{size}"
+            results[key] = _time(lambda: embedding.segment(frame), repeat)
+            segments = embedding.segment(frame)["segmentId"].nunique()
+            results[key]["segments"] = int(segments)
+            print(f"embedding {key}: p50={results[key]['p50_ms']:.1f}ms segments={segments}")
+    return results
+
+
+def run_fusion(sizes, repeat, band=300):
+    from extractor.segmentation import fusion, structural
+
+    results = {}
+    for size in sizes:
+        table = pd.DataFrame(element_payload(generate_page(nodes=size + 1, seed=size)))
+        structural_table = structural.segment(table)
+        visual_table = pd.DataFrame({"Web Element ID": table["webElementId"],
+                                     "Group": (table["y"] // band).astype(int) + 1})
+        key = str(size)
+        results[key] = _time(lambda: fusion.fuse(structural_table, visual_table), repeat)
+        segments = fusion.fuse(structural_table, visual_table)["segmentId"].nunique()
+        results[key]["segments"] = int(segments)
+        print(f"fusion {key}: p50={results[key]['p50_ms']:.1f}ms segments={segments}")
+    return results
+
+
+def run_prompt(sizes, repeat):
+    from extractor.segmentation import prompt
+
+    results = {}
+    for size in sizes:
+        table = pd.DataFrame(element_payload(generate_page(nodes=size + 1, seed=size)))
+        key = str(size)
+        results[key] = _time(lambda: prompt.serialize(table, grid=8), repeat)
+        results[key]["fit"] = _time(lambda: prompt.fit(table), repeat)
+        raw = prompt.count_tokens(table.drop(columns=["scrollIndex"]).to_csv(index=False))
+        results[key]["raw_tokens"] = raw
+        results[key]["prompt_tokens"] = prompt.serialize(table, grid=8).tokens
+        print(f"prompt {key}: p50={results[key]['p50_ms']:.1f}ms fit p50={results[key]['fit']['p50_ms']:.1f}ms "
+              f"tokens={results[key]['prompt_tokens']} (raw csv {raw})")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--screenshot", action="append", default=[], help="Scroll PNG to segment (repeatable)")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="Result JSON path (default benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    results = {
+        "structural": run_structural(args.sizes, args.repeat),
+        "visual": run_visual(args.screenshot, args.repeat),
+        "fusion": run_fusion(args.sizes, args.repeat),
+        "prompt": run_prompt(args.sizes, args.repeat),
+        "embedding": run_embedding(args.sizes, args.repeat),
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    print(f"results written to {write_results('segmentation', results, args.output)}")
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Objective         -   Measure the similar-element store and index (extractor/similar.py) at
+                      --elements synthetic elements spread over sites of --page-size elements.
+
+                      Reported: ingest throughput (embedding plus append), index build time,
+                      query latency through the IVF index for --queries stored elements, the
+                      latency of an exact scan over every vector for comparison, and recall@k
+                      of the index against that scan. The store is written to a temporary
+                      folder and removed afterwards.
+
+Usage (from web_extractor/):
+    python -m benchmarks.similar --elements 1000000 --page-size 5000 --queries 500
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from .common import compare_results, peak_rss_bytes, setup_django, summarize, write_results
+from .synthetic import element_payload, generate_page
+
+
+def run(elements, page_size, queries, k, nprobe):
+    from extractor import similar
+
+    sites = max(1, elements // page_size)
+    started = time.perf_counter()
+    for site in range(sites):
+        table = pd.DataFrame(element_payload(generate_page(nodes=page_size + 1, seed=site)))
+        similar.index_scroll(f"site_{site}", 0, table)
+    ingest = time.perf_counter() - started
+    print(f"ingest: {sites * page_size} elements in {ingest:.1f}s")
+
+    started = time.perf_counter()
+    indexed = similar.build()
+    build = time.perf_counter() - started
+    print(f"build: {indexed} vectors in {build:.1f}s")
+
+    state = similar._current()
+    rng = np.random.default_rng(0)
+    picks = rng.choice(state["n"], queries, replace=False)
+    index_latency, scan_latency, recall = [], [], []
+    for number, id_ in enumerate(picks.tolist()):
+        vector = np.asarray(state["vectors"][id_], dtype=np.float32)
+        t0 = time.perf_counter()
+        found = similar.query(vector, k, exclude=id_, nprobe=nprobe)
+        index_latency.append(time.perf_counter() - t0)
+        # The exact scan is slow at scale; a tenth of the queries estimate recall
+        if number % 10:
+            continue
+        t0 = time.perf_counter()
+        scores = np.asarray(state["vectors"], dtype=np.float32) @ vector
+        scores[id_] = -np.inf
+        best = np.argpartition(-scores, k)[:k]
+        scan_latency.append(time.perf_counter() - t0)
+        # Ties make the exact neighbours ambiguous: count hits by score, not identity
+        threshold = np.min(scores[best]) - 1e-3
+        recall.append(sum(match["score"] >= threshold for match in found) / k)
+
+    results = {
+        "elements": sites * page_size,
+        "ingest_elements_per_s": sites * page_size / ingest,
+        "build_s": build,
+        "nlist": int(len(state["centroids"])),
+        "query_index": summarize(index_latency),
+        "query_scan": summarize(scan_latency),
+        f"recall_at_{k}": float(np.mean(recall)),
+    }
+    print(f"query: index p50={results['query_index']['p50_ms']:.2f}ms "
+          f"p99={results['query_index']['p99_ms']:.2f}ms, "
+          f"scan p50={results['query_scan']['p50_ms']:.1f}ms, "
+          f"recall@{k}={results[f'recall_at_{k}']:.3f}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--elements", type=int, default=1000000)
+    parser.add_argument("--page-size", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=None, help="Lists read per query (default NPROBE)")
+    parser.add_argument("--output", help="Result JSON path (default benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+
+    folder = tempfile.mkdtemp(prefix="similar-")
+    # Builds are run explicitly, not in the background during ingest
+    settings.EXTRACTOR_SIMILAR = {**getattr(settings, "EXTRACTOR_SIMILAR", {}),
+                                  "DIR": folder, "REBUILD_TAIL": float("inf")}
+    try:
+        results = {
+            "similar": run(args.elements, args.page_size, args.queries, args.k, args.nprobe),
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    print(f"results written to {write_results('similar', results, args.output)}")
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Objective         -   Measure worker start-up: how long `python manage.py check` takes, and how
+                      long a fresh process needs to create the WSGI application and answer
+                      its first api/extract/ request, for each EXTRACTOR_STARTUP mode:
+                        lazy        -   no warm-up; the first request imports what it needs.
+                        warm        -   WARM_UP before the application is returned.
+                        background  -   WARM_UP on a background thread; the first request is
+                                        sent right away.
+                      Every sample is a new interpreter started in a scratch directory. The
+                      first request is a 300-element scroll batch posted through the WSGI
+                      callable; the second (another scroll) shows the warm latency.
+
+Usage (from web_extractor/):
+    python -m benchmarks.startup --runs 5
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from .common import PROJECT_DIR, compare_results, setup_django, summarize, write_results
+
+MODES = {
+    "lazy": {"WARM_UP": False},
+    "warm": {"WARM_UP": True, "BACKGROUND": False},
+    "background": {"WARM_UP": True, "BACKGROUND": True},
+}
+
+
+def _post(application, path, body):
+    environ = {
+        "REQUEST_METHOD": "POST", "PATH_INFO": path, "SCRIPT_NAME": "",
+        "QUERY_STRING": "", "SERVER_NAME": "testserver", "SERVER_PORT": "80",
+        "HTTP_HOST": "testserver", "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(body)), "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http", "wsgi.version": (1, 0),
+        "wsgi.multithread": True, "wsgi.multiprocess": False, "wsgi.run_once": False,
+    }
+    status_holder = []
+    started = time.perf_counter()
+    b"".join(application(environ, lambda status, headers, exc_info=None: status_holder.append(status)))
+    elapsed = time.perf_counter() - started
+    if not status_holder[0].startswith("200"):
+        raise SystemExit(f"{path} answered {status_holder[0]}")
+    return elapsed
+
+
+def child(mode):
+    """
+    One start-up sample, run in a fresh interpreter; prints its timings as JSON.
+    """
+    started = time.perf_counter()
+    setup_django()
+    from django.conf import settings
+    settings.EXTRACTOR_STARTUP = MODES[mode]
+    from web_extractor.wsgi import application
+    boot = time.perf_counter() - started
+
+    from .synthetic import element_payload, generate_page
+    bodies = [
+        json.dumps({"website": "bench.startup", "scroll_index": scroll,
+                    "elements": element_payload(generate_page(nodes=301, seed=scroll),
+                                                scroll_index=scroll)}).encode()
+        for scroll in range(2)
+    ]
+    first = _post(application, "/api/extract/", bodies[0])
+    second = _post(application, "/api/extract/", bodies[1])
+    print(json.dumps({"boot": boot, "first_request": first, "second_request": second,
+                      "modules": len(sys.modules)}))
+
+
+def _spawn(args, folder):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_DIR, os.environ.get("PYTHONPATH")])))
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, *args], cwd=folder, env=env,
+                               capture_output=True, text=True, check=True)
+    return time.perf_counter() - started, completed.stdout
+
+
+def run(runs):
+    results = {}
+    check = []
+    for _ in range(runs):
+        folder = tempfile.mkdtemp(prefix="startup-")
+        try:
+            elapsed, _ = _spawn([os.path.join(PROJECT_DIR, "manage.py"), "check"], folder)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+        check.append(elapsed)
+    results["manage_py_check"] = summarize(check)
+    print(f"manage.py check: p50={results['manage_py_check']['p50_ms']:.0f}ms")
+
+    for mode in MODES:
+        samples = {"process": [], "boot": [], "first_request": [], "second_request": []}
+        for _ in range(runs):
+            folder = tempfile.mkdtemp(prefix="startup-")
+            try:
+                elapsed, stdout = _spawn(["-m", "benchmarks.startup", "--child", mode], folder)
+            finally:
+                shutil.rmtree(folder, ignore_errors=True)
+            # Other output (e.g. a print from the LLM segmenter) is on its own lines
+            timings = json.loads(next(line for line in stdout.splitlines() if line.startswith("{")))
+            samples["process"].append(elapsed)
+            for key in ("boot", "first_request", "second_request"):
+                samples[key].append(timings[key])
+        results[mode] = {key: summarize(values) for key, values in samples.items()}
+        print(f"{mode}: boot p50={results[mode]['boot']['p50_ms']:.0f}ms, "
+              f"first request p50={results[mode]['first_request']['p50_ms']:.0f}ms, "
+              f"second request p50={results[mode]['second_request']['p50_ms']:.0f}ms, "
+              f"process p50={results[mode]['process']['p50_ms']:.0f}ms")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement")
+    parser.add_argument("--child", choices=sorted(MODES), help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Result JSON path (default benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.child)
+        return
+
+    results = {"startup": run(args.runs)}
+    print(f"results written to {write_results('startup', results, args.output)}")
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
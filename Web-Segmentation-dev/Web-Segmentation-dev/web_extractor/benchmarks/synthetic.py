@@ -0,0 +1,213 @@
+"""
+Objective         -   Generate synthetic DOM trees of configurable size and shape, render them as
+                      HTML pages and as `api/extract/` element payloads, and provide the XPath
+                      generation strategies used by the extractors so they can be benchmarked
+                      without a browser.
+
+Modules / Functions:
+    SyntheticPage           -   Column-oriented DOM tree (parent, tag, id, class, text, bbox).
+    generate_page           -   Build a SyntheticPage from size / depth / repetition / text knobs.
+    render_html             -   Serialize a SyntheticPage to an HTML document.
+    element_payload         -   Build the element list the extension posts for a page.
+    extension_xpaths        -   Top-down (linear) version of `getXPath` in extractor.js.
+    extension_xpaths_naive  -   Per-element walk-up with sibling scans, as extractor.js runs it.
+    relative_xpaths         -   Indexed version of `get_relative_xpath` (views-only-till-body.py).
+    relative_xpaths_naive   -   Per-element class-uniqueness scan, as the Selenium views run it.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import random
+from collections import Counter
+from html import escape
+
+
+TAGS = ("div", "span", "a", "li", "ul", "button", "img", "input", "p", "section")
+WORDS = ("deal", "cart", "prime", "search", "account", "orders", "video", "shorts",
+         "subscribe", "home", "next", "price", "rating", "delivery", "music")
+
+
+class SyntheticPage:
+    """
+    A DOM tree stored as parallel lists indexed by node number; node 0 is <body>.
+    """
+    __slots__ = ("parent", "tag", "id", "cls", "text", "bbox", "children")
+
+    def __init__(self):
+        self.parent, self.tag, self.id, self.cls = [], [], [], []
+        self.text, self.bbox, self.children = [], [], []
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self, parent, tag, id_="", cls="", text="", bbox=(0, 0, 0, 0)):
+        node = len(self.parent)
+        self.parent.append(parent)
+        self.tag.append(tag)
+        self.id.append(id_)
+        self.cls.append(cls)
+        self.text.append(text)
+        self.bbox.append(bbox)
+        self.children.append([])
+        if parent >= 0:
+            self.children[parent].append(node)
+        return node
+
+
+def generate_page(nodes=1000, max_depth=12, class_pool=50, id_fraction=0.05,
+                  text_density=0.4, viewport=(1920, 912), seed=0):
+    """
+    Build a random page with `nodes` elements.
+
+    max_depth       -   Maximum nesting depth below <body>.
+    class_pool      -   Number of distinct class names; smaller means more repetition.
+    id_fraction     -   Fraction of elements carrying an id attribute.
+    text_density    -   Fraction of elements with direct text.
+    """
+    rng = random.Random(seed)
+    page = SyntheticPage()
+    page.add(-1, "body", bbox=(0, 0, viewport[0], viewport[1]))
+    depth = [0]
+    classes = [f"c{i} {rng.choice(('row', 'card', 'nav', 'item'))}" for i in range(max(1, class_pool))]
+    # Attaching to one of the most recent nodes keeps subtrees contiguous like real markup
+    window = 64
+    for node in range(1, nodes):
+        parent = rng.randrange(max(0, node - window), node)
+        while depth[parent] >= max_depth:
+            parent = page.parent[parent]
+        depth.append(depth[parent] + 1)
+        px, py, pw, ph = page.bbox[parent]
+        w = max(1, int(pw * rng.uniform(0.2, 0.9)))
+        h = max(1, int(ph * rng.uniform(0.1, 0.6)))
+        bbox = (px + rng.randrange(0, max(1, pw - w + 1)), py + rng.randrange(0, max(1, ph - h + 1)), w, h)
+        page.add(
+            parent,
+            rng.choice(TAGS),
+            id_=f"el-{node}" if rng.random() < id_fraction else "",
+            cls=rng.choice(classes) if rng.random() < 0.8 else "",
+            text=" ".join(rng.choices(WORDS, k=rng.randint(1, 4))) if rng.random() < text_density else "",
+            bbox=bbox,
+        )
+    return page
+
+
+def render_html(page):
+    parts = ["<!DOCTYPE html><html><head><meta charset=\"utf-8\"></head>"]
+
+    def open_tag(node):
+        attrs = ""
+        if page.id[node]:
+            attrs += f' id="{escape(page.id[node])}"'
+        if page.cls[node]:
+            attrs += f' class="{escape(page.cls[node])}"'
+        return f"<{page.tag[node]}{attrs}>{escape(page.text[node])}"
+
+    # Iterative pre-order walk; deep synthetic trees would overflow recursion
+    stack = [(0, False)]
+    while stack:
+        node, closing = stack.pop()
+        if closing:
+            parts.append(f"</{page.tag[node]}>")
+            continue
+        parts.append(open_tag(node))
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(page.children[node]))
+    parts.append("</html>")
+    return "".join(parts)
+
+
+def element_payload(page, xpaths=None, scroll_index=0):
+    """
+    Element records in the shape `extractor.js` posts, plus page-space bbox columns.
+    """
+    xpaths = xpaths or extension_xpaths(page)
+    return [
+        {
+            "webElementId": node,
+            "xpath": xpaths[node],
+            "text": page.text[node],
+            "scrollIndex": scroll_index,
+            "x": page.bbox[node][0], "y": page.bbox[node][1],
+            "width": page.bbox[node][2], "height": page.bbox[node][3],
+        }
+        for node in range(1, len(page))
+    ]
+
+
+# ---------------------------------- XPath generation -----------------------------------
+def extension_xpaths(page):
+    """
+    XPaths as produced by `getXPath` in extractor.js, computed top-down so each node
+    costs O(1) beyond its parent's string.
+    """
+    xpaths = [""] * len(page)
+    xpaths[0] = "/body[1]"
+    for node in range(len(page)):
+        seen = Counter()
+        for child in page.children[node]:
+            seen[page.tag[child]] += 1
+            if page.id[child]:
+                xpaths[child] = f'//*[@id="{page.id[child]}"]'
+            else:
+                xpaths[child] = f"{xpaths[node]}/{page.tag[child]}[{seen[page.tag[child]]}]"
+    return xpaths
+
+
+def extension_xpaths_naive(page):
+    """
+    XPaths computed per element by walking up and scanning siblings, as extractor.js
+    does in the browser: O(depth x siblings) per element.
+    """
+    xpaths = [""] * len(page)
+    for node in range(len(page)):
+        if page.id[node]:
+            xpaths[node] = f'//*[@id="{page.id[node]}"]'
+            continue
+        segments = []
+        current = node
+        while current >= 0:
+            if page.id[current]:
+                xpaths[node] = f'//*[@id="{page.id[current]}"]' + "".join(reversed(segments))
+                break
+            parent = page.parent[current]
+            if parent < 0:
+                segments.append(f"/{page.tag[current]}[1]")
+                xpaths[node] = "".join(reversed(segments))
+                break
+            index = 1
+            for sibling in page.children[parent]:
+                if sibling == current:
+                    break
+                if page.tag[sibling] == page.tag[current]:
+                    index += 1
+            segments.append(f"/{page.tag[current]}[{index}]")
+            current = parent
+    return xpaths
+
+
+def relative_xpaths(page):
+    """
+    `get_relative_xpath` from the Selenium views with the (tag, class) uniqueness
+    check answered from one precomputed count table instead of a page-wide query.
+    """
+    counts = Counter(zip(page.tag, page.cls))
+    return [_relative_xpath(page, node, lambda tag, cls: counts[(tag, cls)] == 1)
+            for node in range(len(page))]
+
+
+def relative_xpaths_naive(page):
+    """
+    `get_relative_xpath` issuing a page-wide `//tag[@class=...]` scan per element,
+    which makes the whole pass O(n^2).
+    """
+    def unique(tag, cls):
+        return sum(1 for t, c in zip(page.tag, page.cls) if t == tag and c == cls) == 1
+    return [_relative_xpath(page, node, unique) for node in range(len(page))]
+
+
+def _relative_xpath(page, node, is_unique):
+    tag = page.tag[node]
+    if page.id[node]:
+        return f"//{tag}[@id='{page.id[node]}']"
+    if page.cls[node] and is_unique(tag, page.cls[node]):
+        return f"//{tag}[@class='{page.cls[node]}']"
+    return f"//{tag}"
@@ -6,6 +6,8 @@ from selenium.webdriver.chrome.service import Service as ChromeService
 from webdriver_manager.chrome import ChromeDriverManager
 import pandas as pd
 
+from extractor import styles
+
 html_content = """<!DOCTYPE html>
 <html lang="en">
 <head>
@@ -66,6 +68,9 @@ html_content = """<!DOCTYPE html>
 </html>
 """
 
+STYLE_PROPERTIES = ("background-color", "font-size", "color")
+style_table = styles.StyleTable()
+
 def is_visible(element):
     return element.is_displayed() and element.size["width"] > 0 and element.size["height"] > 0
 
@@ -92,6 +97,7 @@ try:
         elements.extend(driver.find_elements(By.TAG_NAME, tag))
 
     data = []
+    kept = []
     for elem in elements:
         if is_visible(elem):
             try:
@@ -104,14 +110,17 @@ try:
                     "y": elem.location["y"],
                     "Width": elem.size["width"],
                     "Height": elem.size["height"],
-                    "Background Color": elem.value_of_css_property("background-color"),
-                    "Font Size": elem.value_of_css_property("font-size"),
-                    "Font Color": elem.value_of_css_property("color"),
                 })
+                kept.append(elem)
             except Exception as e:
                 print(f"Error processing element: {e}")
 
     df = pd.DataFrame(data)
+    # Computed styles in one script call, stored as ids into a table of distinct styles
+    distinct, local = styles.capture(driver, kept, STYLE_PROPERTIES)
+    style_ids = style_table.register(distinct)
+    df["Style ID"] = [style_ids[i] for i in local]
     print(df)  # Display the extracted data
+    print(style_table.frame())
 finally:
     driver.quit()
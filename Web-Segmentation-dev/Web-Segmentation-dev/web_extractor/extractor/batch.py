@@ -0,0 +1,159 @@
+"""
+Objective         -   Columnar element batch for the hot ingest path, without pandas.
+
+                      A scroll batch of a few hundred elements used to become a DataFrame
+                      right away, followed by string copies of both sides for the diff, a
+                      merge, a projected copy for the xpath CSV and one to_csv per file; for
+                      such small tables the pandas overhead is most of the request. An
+                      ElementBatch keeps one plain list per column (in the order
+                      pd.DataFrame(records) would give them) and covers what the ingest path
+                      does with the table: parse, clean xpaths, diff against the previous
+                      snapshot and write CSVs. The DataFrame is only built, once, when an
+                      analytics step (identity, search, similar, segmentation, history
+                      deltas) asks for it.
+
+                      CSVs are written the way DataFrame.to_csv(index=False) writes them:
+                      same column order, missing values empty, and integer columns with gaps
+                      or mixed with floats written as floats.
+
+Modules / Functions:
+    ElementBatch        -   Column lists of one batch, with to_csv and a lazy frame().
+    read_csv            -   ElementBatch of a CSV file, every value a string.
+    diff                -   Rows of a batch without an identical row in a previous snapshot.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import csv
+import os
+
+
+class ElementBatch:
+    """
+    Element table as {column: list of values}. Columns are read and replaced like
+    DataFrame columns (`batch["xpath"]`, `batch["original_xpath"] = [...]`); a new
+    column is appended at the end.
+    """
+    __slots__ = ("columns", "data", "_frame")
+
+    def __init__(self, columns: list, data: dict):
+        self.columns = list(columns)
+        self.data = data
+        self._frame = None
+
+    @classmethod
+    def from_records(cls, records: list) -> "ElementBatch":
+        """
+        Batch of element dicts as posted; keys missing from a record are None.
+        """
+        order = {}
+        keys = None
+        for record in records:
+            # Payloads repeat the same keys, so the union is only updated on a change
+            if record.keys() != keys:
+                keys = record.keys()
+                order.update(dict.fromkeys(keys))
+        return cls(order, {name: [record.get(name) for record in records] for name in order})
+
+    def __len__(self) -> int:
+        return len(self.data[self.columns[0]]) if self.columns else 0
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    def __getitem__(self, name: str) -> list:
+        return self.data[name]
+
+    def __setitem__(self, name: str, values) -> None:
+        if not isinstance(values, list):
+            values = [values] * len(self)
+        if name not in self.data:
+            self.columns.append(name)
+        self.data[name] = values
+        self._frame = None
+
+    def drop(self, names) -> None:
+        for name in names:
+            if name in self.data:
+                self.columns.remove(name)
+                del self.data[name]
+        self._frame = None
+
+    def text(self, name: str) -> list:
+        """
+        Values of a column as to_csv writes them.
+        """
+        values = self.data[name]
+        numeric = has_float = has_missing = False
+        for value in values:
+            if value is None:
+                has_missing = True
+            elif type(value) is float:
+                has_float = numeric = True
+            elif type(value) is int:
+                numeric = True
+            else:
+                # Any other type makes it an object column: str() of each value
+                numeric = False
+                break
+        else:
+            if numeric and (has_float or has_missing):
+                return ["" if value is None or value != value else repr(float(value))
+                        for value in values]
+        return ["" if value is None or (type(value) is float and value != value) else str(value)
+                for value in values]
+
+    def to_csv(self, path: str, columns: list = None, index: bool = False,
+               encoding: str = "utf-8") -> None:
+        """
+        Write the batch (or `columns` of it) as DataFrame.to_csv(index=False) would.
+        """
+        if index:
+            raise ValueError("ElementBatch has no index to write")
+        columns = list(columns or self.columns)
+        texts = [self.text(name) for name in columns]
+        with open(path, "w", encoding=encoding, newline="") as f:
+            writer = csv.writer(f, lineterminator=os.linesep)
+            writer.writerow(columns)
+            writer.writerows(zip(*texts))
+
+    def frame(self) -> "pd.DataFrame":
+        """
+        The batch as a DataFrame, built on first use and kept until a column changes.
+        """
+        if self._frame is None:
+            import pandas as pd
+            self._frame = pd.DataFrame(self.data, columns=self.columns)
+        return self._frame
+
+
+def read_csv(path: str, encoding: str = "utf-8") -> ElementBatch:
+    """
+    ElementBatch of a CSV written by to_csv; every value is a string, empty when missing.
+    """
+    with open(path, encoding=encoding, newline="") as f:
+        reader = csv.reader(f)
+        columns = next(reader, [])
+        rows = list(reader)
+    width = len(columns)
+    rows = [row if len(row) == width else (row + [""] * width)[:width] for row in rows]
+    values = list(zip(*rows)) if rows else [()] * width
+    return ElementBatch(columns, {name: list(column) for name, column in zip(columns, values)})
+
+
+def diff(current: ElementBatch, previous: ElementBatch) -> ElementBatch:
+    """
+    Rows of `current` with no identical row in `previous` on the shared columns,
+    compared as their CSV text. The result has the columns of `current` followed by
+    those only in `previous` (empty), all values as strings.
+    """
+    shared = [name for name in current.columns if name in previous.data]
+    texts = {name: current.text(name) for name in current.columns}
+    seen = set(zip(*(previous[name] for name in shared))) if shared else set()
+    keep = [i for i, key in enumerate(zip(*(texts[name] for name in shared)))
+            if key not in seen] if shared else list(range(len(current)))
+
+    data = {name: [values[i] for i in keep] for name, values in texts.items()}
+    extra = [name for name in previous.columns if name not in current.data]
+    data.update({name: [""] * len(keep) for name in extra})
+    return ElementBatch(current.columns + extra, data)
@@ -0,0 +1,138 @@
+"""
+Objective         -   Versioned per-scroll state for the delta upload protocol.
+
+                      Every full upload (initial or recapture) records the scroll's current
+                      element table and screenshot in `state_<site>_<n>.json` together with a
+                      version token. A client holding the latest token may then send only the
+                      rows added / changed / removed since that version (keyed by
+                      `webElementId`) plus an optional changed-region image patch; the server
+                      applies them to the stored state and hands out the next token.
+
+Modules / Functions:
+    DeltaConflict       -   Raised when a delta does not apply to the stored version.
+    state_path          -   Path of the state file of a scroll folder.
+    load_state          -   Read a scroll's state (or None before the first full upload).
+    store_state         -   Record a new current element table / screenshot and bump the version.
+    read_elements       -   Read a stored element table as strings.
+    apply_rows          -   Apply added / changed / removed rows to an element table.
+    patch_image         -   The current screenshot with a base64 PNG patch pasted on.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import base64
+import json
+import os
+from io import BytesIO
+
+import pandas as pd
+from PIL import Image
+
+from .storage import atomic_path
+
+
+ID_COLUMN = "webElementId"
+
+
+class DeltaConflict(Exception):
+    """
+    The delta's base version is not the scroll's current version (or there is no
+    baseline yet); the client must fall back to a full upload.
+    """
+    def __init__(self, message, current_version=None):
+        super().__init__(message)
+        self.current_version = current_version
+
+
+def state_path(scroll_folder: str, site_clean: str, scroll_index: int) -> str:
+    return os.path.join(scroll_folder, f"state_{site_clean}_{scroll_index}.json")
+
+
+def load_state(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def store_state(path: str, elements_csv: str, screenshot=None) -> str:
+    """
+    Point the scroll's state at a new current element CSV (and screenshot, if given)
+    and return the new version token. Caller holds the scroll lock.
+    """
+    previous = load_state(path) or {}
+    version = int(previous.get("version", 0)) + 1
+    state = {
+        "version": version,
+        "token": f"v{version}",
+        "elements_csv": elements_csv,
+        "screenshot": screenshot or previous.get("screenshot"),
+    }
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+    return state["token"]
+
+
+def read_elements(elements_csv: str) -> pd.DataFrame:
+    return pd.read_csv(elements_csv, dtype=str, keep_default_na=False)
+
+
+def apply_rows(current: pd.DataFrame, added=(), changed=(), removed=()):
+    """
+    Apply a delta to an element table; rows are matched on webElementId and changed rows
+    may be partial (they only overwrite the columns they carry).
+    Returns (new table, change rows) where change rows carry a `change` column of
+    "added", "changed" or "removed".
+    """
+    removed_ids = {str(i) for i in removed}
+    records = {}
+    order = []
+    changes = []
+    for row in current.to_dict("records"):
+        key = row[ID_COLUMN]
+        if key in removed_ids:
+            changes.append(dict(row, change="removed"))
+        else:
+            records[key] = row
+            order.append(key)
+
+    for row in list(changed) + list(added):
+        if ID_COLUMN not in row:
+            raise ValueError(f"Delta row without {ID_COLUMN}: {row}")
+        row = {k: "" if v is None else str(v) for k, v in row.items()}
+        key = row[ID_COLUMN]
+        if key in records:
+            records[key].update(row)
+            changes.append(dict(records[key], change="changed"))
+        else:
+            records[key] = row
+            order.append(key)
+            changes.append(dict(row, change="added"))
+
+    columns = list(dict.fromkeys(
+        list(current.columns) + [c for r in changes for c in r if c != "change"]
+    ))
+    table = pd.DataFrame([records[k] for k in order], columns=columns).fillna("")
+    change_rows = pd.DataFrame(changes, columns=columns + ["change"]).fillna("")
+    return table, change_rows
+
+
+def patch_image(screenshot_path: str, patch: dict, current_version: str = None) -> Image.Image:
+    """
+    The image at screenshot_path with `patch` ({"x", "y", "data": PNG data URL}) pasted
+    on, not saved yet. Raises DeltaConflict (carrying `current_version`) without a stored
+    screenshot and ValueError on patch data that does not decode.
+    """
+    if not screenshot_path or not os.path.exists(screenshot_path):
+        raise DeltaConflict("No stored screenshot to apply the image patch to", current_version)
+    try:
+        data = patch["data"].split(",", 1)[-1]
+        region = Image.open(BytesIO(base64.b64decode(data)))
+        region.load()
+        offset = (int(patch.get("x", 0)), int(patch.get("y", 0)))
+    except (KeyError, TypeError, AttributeError, ValueError, OSError) as e:
+        raise ValueError(f"Invalid image_patch: {e}") from e
+    with Image.open(screenshot_path) as base:
+        img = base.copy()
+    img.paste(region, offset)
+    return img
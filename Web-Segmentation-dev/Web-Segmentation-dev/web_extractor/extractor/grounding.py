@@ -0,0 +1,294 @@
+"""
+Objective         -   Answer "what is here / where is it" for agents without reading CSVs and
+                      screenshots: the elements of a site that contain a page-space point,
+                      intersect a region and/or match a text query, with xpath, bbox and
+                      segment id, in about a millisecond.
+
+                      Every scroll of a site is loaded once into memory: its current element
+                      table (the delta state's elements CSV, else the cleaned CSV), the
+                      segment ids of its published segmentation (else fused, else structural),
+                      a band index over y (each element listed in every BAND-pixel band its
+                      box spans, as CSR arrays) and a token -> rows dict for the text. Sites
+                      are kept in an LRU cache of at most MAX_SITES sites and MAX_ELEMENTS
+                      elements. A cached site is checked at most every REFRESH seconds: a
+                      scroll is reloaded when its folder's mtime changed (every artifact is
+                      renamed into place, which updates it), so ingest from any worker
+                      process is picked up without invalidation messages.
+
+                      Ranking: more query words matched first; then, for a point, the
+                      innermost (smallest) element first, for a region the element with the
+                      largest share of its box inside the region first. Without a scroll,
+                      elements captured by several scrolls (same xpath) are returned once.
+
+Configuration (settings.EXTRACTOR_GROUNDING, all keys optional):
+    MAX_SITES       -   Sites kept in memory (default 16).
+    MAX_ELEMENTS    -   Elements kept in memory over all cached sites (default 2000000).
+    REFRESH         -   Seconds between checks of a cached site for new scrolls (default 1.0).
+    BAND            -   Height in pixels of the y bands of the spatial index (default 256).
+
+Modules / Functions:
+    ScrollIndex         -   In-memory arrays of one scroll.
+    load_scroll         -   ScrollIndex of one scroll folder.
+    site_index          -   Scroll indexes of a site, from the cache.
+    ground              -   Matching elements of a site, best first.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from . import delta
+
+
+BBOX_COLUMNS = ("x", "y", "width", "height")
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+SCROLL_RE = re.compile(r"scroll_(\d+)$")
+SEGMENT_SUFFIXES = ("_segmented.csv", "_fused_segmented.csv", "_structural_segmented.csv")
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_GROUNDING", {}) or {}
+
+
+class ScrollIndex:
+    """
+    Elements of one scroll as arrays: ids, xpaths, texts, boxes (n x 4, NaN without a
+    bbox), segments (-1 without one), the y band CSR index and the text postings.
+    """
+
+    def __init__(self, scroll_index: int, table: pd.DataFrame, segments: dict, band: int):
+        n = len(table)
+        self.scroll_index = scroll_index
+        self.ids = table["webElementId"].astype(str).tolist()
+        xpaths = table["original_xpath"] if "original_xpath" in table.columns else table["xpath"]
+        self.xpaths = xpaths.astype(str).tolist()
+        self.texts = (table["text"].astype(str).tolist() if "text" in table.columns else [""] * n)
+        self.segments = np.array([segments.get(id_, -1) for id_ in self.ids], dtype=np.int64)
+        if all(col in table.columns for col in BBOX_COLUMNS):
+            self.boxes = table[list(BBOX_COLUMNS)].apply(pd.to_numeric, errors="coerce").to_numpy(np.float64)
+        else:
+            self.boxes = np.full((n, 4), np.nan)
+        self.area = self.boxes[:, 2] * self.boxes[:, 3]
+
+        # Every element with a box is listed in each band from its top to its bottom
+        self.band = band
+        valid = np.flatnonzero(~np.isnan(self.boxes).any(axis=1))
+        top = np.maximum(self.boxes[valid, 1] // band, 0).astype(np.int64)
+        bottom = np.maximum((self.boxes[valid, 1] + np.maximum(self.boxes[valid, 3], 0)) // band, 0).astype(np.int64)
+        counts = bottom - top + 1
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        bands = np.repeat(top, counts) + np.arange(counts.sum()) - first
+        order = np.argsort(bands, kind="stable")
+        self.band_rows = np.repeat(valid, counts)[order]
+        self.band_offsets = np.searchsorted(bands[order], np.arange((bottom.max() + 2) if len(valid) else 1))
+
+        postings = defaultdict(list)
+        for row, text in enumerate(self.texts):
+            for token in set(TOKEN_RE.findall(text.lower())):
+                postings[token].append(row)
+        self.postings = {token: np.array(rows, dtype=np.int64) for token, rows in postings.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def in_region(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """
+        Rows whose box intersects [x0, x1] x [y0, y1] (bounds included).
+        """
+        last = len(self.band_offsets) - 2
+        b0, b1 = max(int(y0 // self.band), 0), min(int(y1 // self.band), last)
+        if b0 > b1:
+            return np.zeros(0, dtype=np.int64)
+        rows = self.band_rows[self.band_offsets[b0]:self.band_offsets[b1 + 1]]
+        if b1 > b0:
+            rows = np.unique(rows)
+        x, y, w, h = self.boxes[rows].T
+        return rows[(x <= x1) & (x + w >= x0) & (y <= y1) & (y + h >= y0)]
+
+    def matches(self, tokens: list):
+        """
+        (rows, number of tokens matched) of the rows holding at least one token.
+        """
+        hits = [self.postings[token] for token in tokens if token in self.postings]
+        if not hits:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(hits), return_counts=True)
+
+
+def _read(path: str, **kwargs):
+    try:
+        return pd.read_csv(path, dtype=str, keep_default_na=False, **kwargs)
+    except (FileNotFoundError, pd.errors.EmptyDataError):
+        return None
+
+
+def load_scroll(scroll_folder: str, site_clean: str, scroll_index: int, band: int = None):
+    """
+    ScrollIndex of the current state of a scroll folder, or None if it has no element table.
+    """
+    state = delta.load_state(delta.state_path(scroll_folder, site_clean, scroll_index))
+    table = _read(state["elements_csv"]) if state else None
+    if table is None:
+        table = _read(os.path.join(scroll_folder, f"cleaned_{site_clean}_{scroll_index}.csv"))
+    if table is None or "webElementId" not in table.columns:
+        return None
+    segments = {}
+    for suffix in SEGMENT_SUFFIXES:
+        segmented = _read(os.path.join(scroll_folder, f"xpath_{site_clean}_{scroll_index}{suffix}"),
+                          usecols=["webElementId", "segmentId"])
+        if segmented is not None:
+            segments = dict(zip(segmented["webElementId"], pd.to_numeric(segmented["segmentId"])))
+            break
+    return ScrollIndex(scroll_index, table, segments, band or _config().get("BAND", 256))
+
+
+def _scan(site_folder: str) -> dict:
+    folders = {}
+    try:
+        entries = list(os.scandir(site_folder))
+    except FileNotFoundError:
+        return folders
+    for entry in entries:
+        match = SCROLL_RE.match(entry.name)
+        if match and entry.is_dir():
+            folders[int(match.group(1))] = entry.stat().st_mtime_ns
+    return folders
+
+
+def _evict(config) -> None:
+    max_sites = config.get("MAX_SITES", 16)
+    max_elements = config.get("MAX_ELEMENTS", 2000000)
+    total = sum(entry["elements"] for entry in _cache.values())
+    # The most recently used site is kept even when it alone is over the limit
+    while len(_cache) > 1 and (len(_cache) > max_sites or total > max_elements):
+        _, entry = _cache.popitem(last=False)
+        total -= entry["elements"]
+
+
+def site_index(site_folder: str) -> dict:
+    """
+    {scroll_index: ScrollIndex} of the site stored under `site_folder`, loaded or
+    refreshed as needed.
+    """
+    config = _config()
+    site_clean = os.path.basename(os.path.normpath(site_folder))
+    with _lock:
+        entry = _cache.get(site_folder)
+        if entry is not None:
+            _cache.move_to_end(site_folder)
+            if time.monotonic() - entry["checked"] < config.get("REFRESH", 1.0):
+                return entry["scrolls"]
+    # Loading runs outside the lock so other sites stay served meanwhile
+    mtimes = _scan(site_folder)
+    old = entry["scrolls"] if entry else {}
+    old_mtimes = entry["mtimes"] if entry else {}
+    scrolls = {}
+    for scroll_index, mtime in sorted(mtimes.items()):
+        if old_mtimes.get(scroll_index) == mtime and scroll_index in old:
+            scrolls[scroll_index] = old[scroll_index]
+            continue
+        loaded = load_scroll(os.path.join(site_folder, f"scroll_{scroll_index}"), site_clean, scroll_index)
+        if loaded is not None:
+            scrolls[scroll_index] = loaded
+    with _lock:
+        _cache[site_folder] = {
+            "scrolls": scrolls,
+            "mtimes": mtimes,
+            "checked": time.monotonic(),
+            "elements": sum(len(scroll) for scroll in scrolls.values()),
+        }
+        _cache.move_to_end(site_folder)
+        _evict(config)
+    return scrolls
+
+
+def _chunks(order: np.ndarray, size: int):
+    for start in range(0, len(order), size):
+        yield from order[start:start + size].tolist()
+
+
+def ground(site_folder: str, scroll_index: int = None, region: tuple = None, text: str = None,
+           limit: int = 20) -> list:
+    """
+    Elements of a site matching a page-space `region` (x0, y0, x1, y1; a point has
+    x0 == x1 and y0 == y1) and/or `text`, best first, as dicts with scroll_index,
+    webElementId, xpath, text, bbox (or None) and segmentId (or None). Without either
+    filter, the elements in document order.
+    """
+    scrolls = site_index(site_folder)
+    if scroll_index is not None:
+        scrolls = {scroll_index: scrolls[scroll_index]} if scroll_index in scrolls else {}
+    tokens = TOKEN_RE.findall(text.lower()) if text else []
+    point = region is not None and region[0] == region[2] and region[1] == region[3]
+
+    parts = []
+    for scroll in scrolls.values():
+        rows = score = None
+        if tokens:
+            rows, score = scroll.matches(tokens)
+        if region is not None:
+            inside = scroll.in_region(*region)
+            if rows is None:
+                rows, score = inside, np.zeros(len(inside), dtype=np.int64)
+            else:
+                keep = np.isin(rows, inside)
+                rows, score = rows[keep], score[keep]
+        if rows is None:
+            rows = np.arange(len(scroll))
+            score = np.zeros(len(rows), dtype=np.int64)
+        if len(rows):
+            parts.append((scroll, rows, score))
+    if not parts:
+        return []
+
+    # Ranked over all scrolls: words matched, then box fit, then document order
+    owner = np.concatenate([np.full(len(rows), i) for i, (_, rows, _) in enumerate(parts)])
+    rows = np.concatenate([rows for _, rows, _ in parts])
+    score = np.concatenate([score for _, _, score in parts])
+    area = np.concatenate([scroll.area[r] for scroll, r, _ in parts])
+    if region is None:
+        fit = np.zeros(len(rows))
+    elif point:
+        fit = np.nan_to_num(area, nan=np.inf)
+    else:
+        x0, y0, x1, y1 = region
+        boxes = np.concatenate([scroll.boxes[r] for scroll, r, _ in parts])
+        overlap = ((np.minimum(boxes[:, 0] + boxes[:, 2], x1) - np.maximum(boxes[:, 0], x0))
+                   * (np.minimum(boxes[:, 1] + boxes[:, 3], y1) - np.maximum(boxes[:, 1], y0)))
+        fit = -np.nan_to_num(overlap / np.where(area > 0, area, np.inf), nan=0.0)
+    # Candidates are in (scroll, row) order already, which stable sorts keep for ties
+    order = np.arange(len(rows)) if region is None else np.argsort(fit, kind="stable")
+    if tokens:
+        order = order[np.argsort(-score[order], kind="stable")]
+
+    results, seen = [], set()
+    for i in _chunks(order, 4 * limit):
+        scroll, row = parts[owner[i]][0], int(rows[i])
+        xpath = scroll.xpaths[row]
+        if scroll_index is None:
+            if xpath in seen:
+                continue
+            seen.add(xpath)
+        x, y, w, h = scroll.boxes[row].tolist()
+        segment = int(scroll.segments[row])
+        results.append({
+            "scroll_index": scroll.scroll_index,
+            "webElementId": scroll.ids[row],
+            "xpath": xpath,
+            "text": scroll.texts[row],
+            "bbox": None if np.isnan(x) else {"x": x, "y": y, "width": w, "height": h},
+            "segmentId": None if segment < 0 else segment,
+        })
+        if len(results) == limit:
+            break
+    return results
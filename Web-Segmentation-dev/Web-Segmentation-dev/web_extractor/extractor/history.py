@@ -0,0 +1,241 @@
+"""
+Objective         -   Versioned history of every scroll's element table, so the page state at
+                      any past time can be reconstructed without replaying all modification files.
+
+                      Each scroll folder gets a `history/` directory holding an append-only
+                      `changes.jsonl` (one record per saved state: either a full snapshot or the
+                      rows upserted / removed since the previous state, keyed by webElementId),
+                      the snapshot CSVs and an `index.json` with the timestamp, sequence number
+                      and byte offset of every snapshot record. Materializing the state as of a
+                      time loads the last snapshot at or before it and replays only the records
+                      that follow it, so the cost is O(changes since the last snapshot). A new
+                      snapshot is taken every SNAPSHOT_EVERY delta records (or when a delta
+                      touches most of the table); `compact_history` drops everything before a
+                      retained snapshot. Each record is appended with a single write and fsynced;
+                      a line left unterminated by a crash is ignored by readers and cut off
+                      before the next append.
+
+Configuration (settings.EXTRACTOR_HISTORY, all keys optional):
+    ENABLED         -   Record history on ingest (default False).
+    SNAPSHOT_EVERY  -   Delta records between snapshots (default 20).
+
+Modules / Functions:
+    HistoryUnavailable  -   No history (or none old enough) for a requested scroll / time.
+    history_dir         -   History directory of a scroll folder.
+    record              -   Append the new state of a scroll (snapshot or delta).
+    materialize         -   Element rows of a scroll as of a timestamp.
+    compact             -   Drop records before the last snapshot at or before a cutoff.
+    parse_timestamp     -   Epoch seconds from an ISO-8601 string or a number.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import bisect
+import json
+import os
+import time
+from datetime import datetime
+
+import pandas as pd
+from django.conf import settings
+
+from .storage import atomic_path, write_csv_atomic
+
+
+ID_COLUMN = "webElementId"
+CHANGES_FILE = "changes.jsonl"
+INDEX_FILE = "index.json"
+
+
+class HistoryUnavailable(Exception):
+    pass
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_HISTORY", {}) or {}
+
+
+def enabled() -> bool:
+    return _config().get("ENABLED", False)
+
+
+def history_dir(scroll_folder: str) -> str:
+    return os.path.join(scroll_folder, "history")
+
+
+def _load_index(folder: str) -> dict:
+    path = os.path.join(folder, INDEX_FILE)
+    if not os.path.exists(path):
+        return {"seq": 0, "since_snapshot": 0, "snapshots": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _store_index(folder: str, index: dict) -> None:
+    with atomic_path(os.path.join(folder, INDEX_FILE)) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+
+
+def _rows(table: pd.DataFrame) -> dict:
+    """
+    webElementId -> row dict with every value as a string.
+    """
+    table = table.fillna("").astype(str)
+    return {row[ID_COLUMN]: row for row in table.to_dict("records")}
+
+
+def _append(path: str, entry: dict) -> int:
+    """
+    Append one record to a changes file and return the offset after it. A torn last
+    line is truncated first, so the new record starts on a line of its own.
+    """
+    line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+    fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o666)
+    try:
+        end = os.fstat(fd).st_size
+        if end and os.pread(fd, 1, end - 1) != b"\n":
+            # Cut back to just after the last complete line
+            while end > 0:
+                start = max(0, end - 65536)
+                newline = os.pread(fd, end - start, start).rfind(b"\n")
+                end = start + newline + 1 if newline >= 0 else start
+                if newline >= 0:
+                    break
+            os.ftruncate(fd, end)
+        os.write(fd, line)
+        os.fsync(fd)
+        return os.lseek(fd, 0, os.SEEK_END)
+    finally:
+        os.close(fd)
+
+
+def _lines(f):
+    """
+    Complete lines of a changes file; an unterminated last line (a torn append) is skipped.
+    """
+    for line in f:
+        if not line.endswith("\n"):
+            return
+        yield line
+
+
+def record(scroll_folder: str, table: pd.DataFrame, previous: pd.DataFrame = None,
+           ts: float = None) -> int:
+    """
+    Append the scroll's new element table to its history and return the record's
+    sequence number. Without `previous` (or without webElementIds to key rows on) the
+    table is stored as a snapshot. Caller holds the scroll lock.
+    """
+    folder = history_dir(scroll_folder)
+    os.makedirs(folder, exist_ok=True)
+    index = _load_index(folder)
+    seq = index["seq"] + 1
+    ts = time.time() if ts is None else ts
+
+    entry = None
+    if previous is not None and ID_COLUMN in table.columns and ID_COLUMN in previous.columns:
+        old, new = _rows(previous), _rows(table)
+        upsert = [row for key, row in new.items() if old.get(key) != row]
+        remove = [key for key in old if key not in new]
+        if index["since_snapshot"] + 1 < _config().get("SNAPSHOT_EVERY", 20) \
+                and len(upsert) + len(remove) <= len(new) // 2:
+            entry = {"seq": seq, "ts": ts, "type": "delta", "upsert": upsert, "remove": remove}
+
+    changes_path = os.path.join(folder, CHANGES_FILE)
+    if entry is None:
+        snapshot = f"snapshot_{seq:06d}.csv"
+        write_csv_atomic(table, os.path.join(folder, snapshot))
+        entry = {"seq": seq, "ts": ts, "type": "snapshot", "file": snapshot}
+
+    offset = _append(changes_path, entry)
+
+    index["seq"] = seq
+    if entry["type"] == "snapshot":
+        # Replay for this snapshot starts right after its own record
+        index["snapshots"].append([ts, seq, offset, entry["file"]])
+        index["since_snapshot"] = 0
+    else:
+        index["since_snapshot"] += 1
+    _store_index(folder, index)
+    return seq
+
+
+def materialize(scroll_folder: str, as_of: float = None):
+    """
+    Return (rows, seq, ts) for the last state recorded at or before `as_of` (default:
+    latest). Raises HistoryUnavailable when there is no such state.
+    """
+    folder = history_dir(scroll_folder)
+    index = _load_index(folder)
+    snapshots = index["snapshots"]
+    as_of = float("inf") if as_of is None else as_of
+    position = bisect.bisect_right([s[0] for s in snapshots], as_of) - 1
+    if position < 0:
+        raise HistoryUnavailable(f"No history recorded for {scroll_folder} at or before {as_of}")
+
+    snap_ts, seq, offset, snapshot = snapshots[position]
+    table = pd.read_csv(os.path.join(folder, snapshot), dtype=str, keep_default_na=False)
+    rows = {row[ID_COLUMN]: row for row in table.to_dict("records")} \
+        if ID_COLUMN in table.columns else dict(enumerate(table.to_dict("records")))
+    ts = snap_ts
+
+    with open(os.path.join(folder, CHANGES_FILE), encoding="utf-8") as f:
+        f.seek(offset)
+        for line in _lines(f):
+            entry = json.loads(line)
+            if entry["ts"] > as_of or entry["type"] == "snapshot":
+                break
+            for key in entry["remove"]:
+                rows.pop(key, None)
+            for row in entry["upsert"]:
+                rows[row[ID_COLUMN]] = row
+            seq, ts = entry["seq"], entry["ts"]
+    return list(rows.values()), seq, ts
+
+
+def compact(scroll_folder: str, before: float = None) -> int:
+    """
+    Drop the snapshots and records preceding the last snapshot at or before `before`
+    (default: the latest snapshot); states older than that can no longer be
+    materialized. Returns the number of records dropped. Caller holds the scroll lock.
+    """
+    folder = history_dir(scroll_folder)
+    index = _load_index(folder)
+    snapshots = index["snapshots"]
+    before = float("inf") if before is None else before
+    keep = bisect.bisect_right([s[0] for s in snapshots], before) - 1
+    if keep <= 0:
+        return 0
+
+    changes_path = os.path.join(folder, CHANGES_FILE)
+    kept_seq = snapshots[keep][1]
+    dropped = 0
+    with open(changes_path, encoding="utf-8") as src, atomic_path(changes_path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as dst:
+            new_snapshots = []
+            for line in _lines(src):
+                entry = json.loads(line)
+                if entry["seq"] < kept_seq:
+                    dropped += 1
+                    continue
+                dst.write(line)
+                if entry["type"] == "snapshot":
+                    new_snapshots.append([entry["ts"], entry["seq"], dst.tell(), entry["file"]])
+
+    for snapshot in snapshots[:keep]:
+        path = os.path.join(folder, snapshot[3])
+        if os.path.exists(path):
+            os.remove(path)
+    index["snapshots"] = new_snapshots
+    _store_index(folder, index)
+    return dropped
+
+
+def parse_timestamp(value) -> float:
+    """
+    Epoch seconds from a number or an ISO-8601 string (naive times are local time).
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
@@ -0,0 +1,83 @@
+"""
+Objective         -   Skip re-processing of scroll batches the extension sends more than once
+                      (re-sent batches on user actions, `background.js` retries).
+
+                      A batch is identified by a client-supplied key (`Idempotency-Key` header
+                      or `content_hash` field) or, failing that, by a SHA-256 over the
+                      canonical JSON of the elements and a digest of the screenshot; either is
+                      scoped to the website and scroll index, so the same key on another
+                      scroll is a different batch. Responses of processed batches are kept in a Django cache,
+                      which bounds the store (MAX_ENTRIES) and expires entries (TIMEOUT); a
+                      shared backend (Redis, file-based) makes duplicates visible across workers.
+
+                      A stored response is only replayed while the scroll is still at the
+                      version it reported. Once another upload has moved the scroll (batches
+                      A, B, then A again: the page was reverted), the batch is processed again.
+
+Configuration (settings.EXTRACTOR_IDEMPOTENCY, all keys optional):
+    ENABLED     -   Turn the layer on (default True).
+    CACHE       -   Cache alias holding recent batch responses (default "default").
+    TIMEOUT     -   Seconds a response is remembered (default 600).
+
+Modules / Functions:
+    enabled         -   Whether the idempotency layer is on.
+    batch_key       -   Idempotency key of a request / payload.
+    lookup          -   Previously stored response body for a key (at a scroll version), or None.
+    remember        -   Store the response body for a key.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+HEADER = "Idempotency-Key"
+KEY_PREFIX = "extractor:batch:"
+_ANY_VERSION = object()
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_IDEMPOTENCY", {}) or {}
+
+
+def enabled() -> bool:
+    return _config().get("ENABLED", True)
+
+
+def batch_key(request, data: dict, scroll_index: int, elements: list) -> str:
+    """
+    Return a key of the website, the scroll index and the client-supplied key if
+    present, else a content hash of the batch. `request` is None for batches of a bulk
+    upload, which can only carry content_hash.
+    """
+    digest = hashlib.sha256()
+    digest.update(str(data.get("website", "")).encode("utf-8"))
+    digest.update(b"\0%d\0" % scroll_index)
+    supplied = (request.headers.get(HEADER) if request is not None else None) or data.get("content_hash")
+    if supplied:
+        digest.update(str(supplied).encode("utf-8"))
+        return f"client:{digest.hexdigest()}"
+    digest.update(json.dumps(elements, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8"))
+    screenshot = data.get("screenshot") or ""
+    digest.update(b"\0")
+    digest.update(hashlib.sha256(screenshot.encode("ascii", "replace")).digest())
+    return f"sha256:{digest.hexdigest()}"
+
+
+def lookup(key: str, version=_ANY_VERSION):
+    """
+    Stored response body for `key`; with `version` (the scroll's current version token),
+    only a body that reported that version.
+    """
+    body = caches[_config().get("CACHE", "default")].get(KEY_PREFIX + key)
+    if body is not None and version is not _ANY_VERSION and body.get("version") != version:
+        return None
+    return body
+
+
+def remember(key: str, body: dict) -> None:
+    config = _config()
+    caches[config.get("CACHE", "default")].set(KEY_PREFIX + key, body, config.get("TIMEOUT", 600))
@@ -0,0 +1,228 @@
+"""
+Objective         -   Give every element a stable, site-wide id across scroll folders, so rows of
+                      overlapping viewports and sticky elements (e.g. Amazon's nav bar) that were
+                      captured in several `scroll_<n>` folders reference one canonical element.
+
+                      An element's identity key is a hash of its cleaned XPath, its original
+                      XPath and, when the batch carries page-space bbox columns (x, y, width,
+                      height), the bbox quantized to BBOX_GRID pixels. Keys map to global ids in
+                      an in-memory dict per site, so lookups are O(1) per row. New keys are
+                      appended to `Outputs/<site>/identity.jsonl` under the site folder's lock;
+                      other processes pick them up by reading the file from their last offset.
+                      Each ingested scroll gets an `identity_<site>_<n>.csv` mapping its
+                      webElementIds to global ids, flagging rows first seen in another scroll
+                      as duplicates.
+
+                      Segmenters skip the duplicates (split_duplicates) when their first
+                      scroll has been segmented: those rows take the segment of their
+                      canonical element instead, i.e. duplicates whose canonical elements
+                      share a segment form one segment of their own scroll
+                      (restore_duplicates).
+
+Configuration (settings.EXTRACTOR_IDENTITY, all keys optional):
+    ENABLED     -   Maintain the index on ingest (default False).
+    BBOX_GRID   -   Quantization step of bbox coordinates in pixels (default 16).
+
+Modules / Functions:
+    SiteIdentityIndex   -   Identity key -> (global id, first scroll) map of one site.
+    identity_key        -   Hash key of one element.
+    assign              -   Resolve / register the elements of a scroll and write its identity CSV.
+    split_duplicates    -   Rows of a scroll to segment, and the canonical segments of the rest.
+    restore_duplicates  -   Segmentation of a whole scroll from that of its split rows.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+from django.conf import settings
+
+from . import batch
+from .storage import scroll_lock, write_csv_atomic
+
+
+INDEX_FILE = "identity.jsonl"
+BBOX_COLUMNS = ("x", "y", "width", "height")
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_IDENTITY", {}) or {}
+
+
+def enabled() -> bool:
+    return _config().get("ENABLED", False)
+
+
+def identity_key(clean_xpath: str, original_xpath: str, bbox=None) -> str:
+    """
+    bbox is an already quantized (x, y, width, height) tuple or None.
+    """
+    parts = [str(clean_xpath), str(original_xpath)]
+    if bbox is not None:
+        parts.append(",".join(map(str, bbox)))
+    return hashlib.blake2b("\0".join(parts).encode("utf-8"), digest_size=12).hexdigest()
+
+
+class SiteIdentityIndex:
+    """
+    In-memory view of a site's identity.jsonl. refresh() and register() must run with
+    the site folder's lock held.
+    """
+    __slots__ = ("path", "ids", "offset")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ids = {}
+        self.offset = 0
+
+    def refresh(self) -> None:
+        # Entries appended by other processes since the last read
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                entry = json.loads(line)
+                self.ids[entry["key"]] = (entry["id"], entry["scroll"])
+            self.offset = f.tell()
+
+    def register(self, keys, scroll_index: int) -> list:
+        """
+        Return (global id, first scroll) for each key, registering unknown keys as
+        first seen in `scroll_index`.
+        """
+        resolved = []
+        new_lines = []
+        for key in keys:
+            found = self.ids.get(key)
+            if found is None:
+                found = (len(self.ids), scroll_index)
+                self.ids[key] = found
+                new_lines.append(json.dumps(
+                    {"id": found[0], "key": key, "scroll": scroll_index}, separators=(",", ":")
+                ))
+            resolved.append(found)
+        if new_lines:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(new_lines) + "\n")
+                f.flush()
+                self.offset = f.tell()
+        return resolved
+
+
+def _index(site_folder: str) -> SiteIdentityIndex:
+    path = os.path.join(site_folder, INDEX_FILE)
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(path)
+        if index is None or (index.offset and not os.path.exists(path)):
+            index = _INDEXES[path] = SiteIdentityIndex(path)
+        return index
+
+
+def _quantized_bboxes(table: pd.DataFrame, grid: int):
+    if not all(col in table.columns for col in BBOX_COLUMNS):
+        return [None] * len(table)
+    values = table[list(BBOX_COLUMNS)].apply(pd.to_numeric, errors="coerce")
+    quantized = (values // grid).astype("Int64")
+    return [None if any(pd.isna(v) for v in row) else tuple(int(v) for v in row)
+            for row in quantized.itertuples(index=False, name=None)]
+
+
+def assign(site_folder: str, scroll_folder: str, site_clean: str, scroll_index: int,
+           table: pd.DataFrame, cleaned_xpaths, original_xpaths) -> dict:
+    """
+    Resolve the elements of one scroll to global ids, registering new ones, and write
+    `identity_<site>_<n>.csv`. Returns counts of new and duplicate rows.
+    """
+    grid = _config().get("BBOX_GRID", 16)
+    keys = [identity_key(c, o, b) for c, o, b in
+            zip(cleaned_xpaths, original_xpaths, _quantized_bboxes(table, grid))]
+
+    index = _index(site_folder)
+    with scroll_lock(site_folder):
+        index.refresh()
+        resolved = index.register(keys, scroll_index)
+
+    mapping = pd.DataFrame({
+        "webElementId": table["webElementId"].to_numpy(),
+        "global_id": [gid for gid, _ in resolved],
+        "first_scroll": [first for _, first in resolved],
+    })
+    mapping["duplicate"] = mapping["first_scroll"] != scroll_index
+    write_csv_atomic(mapping, os.path.join(scroll_folder, f"identity_{site_clean}_{scroll_index}.csv"))
+    duplicates = int(mapping["duplicate"].sum())
+    return {"rows_new": len(mapping) - duplicates, "rows_duplicate": duplicates}
+
+
+def _scroll_file(site_folder: str, site_clean: str, scroll_index, prefix: str, suffix: str) -> str:
+    return os.path.join(site_folder, f"scroll_{scroll_index}", f"{prefix}{site_clean}_{scroll_index}{suffix}")
+
+
+def split_duplicates(table: pd.DataFrame, xpath_csv: str, suffix: str):
+    """
+    Take the rows of a scroll's table first captured in another scroll out of it, when
+    that scroll's segmentation (`xpath_<site>_<n><suffix>`) has their canonical element.
+    Returns (rows to segment, {webElementId: (first scroll, segmentId there)}); the
+    table itself and {} when there is nothing to take out.
+    """
+    scroll_folder, name = os.path.split(xpath_csv)
+    identity_csv = os.path.join(scroll_folder, "identity_" + name[len("xpath_"):])
+    if not os.path.exists(identity_csv):
+        return table, {}
+    site_folder = os.path.dirname(scroll_folder)
+    scroll_index = os.path.basename(scroll_folder)[len("scroll_"):]
+    site_clean = name[len("xpath_"):-len(f"_{scroll_index}.csv")]
+
+    mapping = batch.read_csv(identity_csv)
+    wanted = {}
+    for element, global_id, first, duplicate in zip(mapping["webElementId"], mapping["global_id"],
+                                                    mapping["first_scroll"], mapping["duplicate"]):
+        if duplicate == "True":
+            wanted.setdefault(first, {})[global_id] = element
+
+    copied = {}
+    for first, elements in wanted.items():
+        first_identity = _scroll_file(site_folder, site_clean, first, "identity_", ".csv")
+        first_segments = _scroll_file(site_folder, site_clean, first, "xpath_", suffix)
+        if not (os.path.exists(first_identity) and os.path.exists(first_segments)):
+            continue
+        segments = batch.read_csv(first_segments)
+        segment_of = dict(zip(segments["webElementId"], segments["segmentId"]))
+        canonical = batch.read_csv(first_identity)
+        for element, global_id, duplicate in zip(canonical["webElementId"], canonical["global_id"],
+                                                 canonical["duplicate"]):
+            if duplicate == "False" and global_id in elements and element in segment_of:
+                copied[elements[global_id]] = (first, segment_of[element])
+    if not copied:
+        return table, {}
+    return table[~table["webElementId"].astype(str).isin(copied).to_numpy()], copied
+
+
+def restore_duplicates(table: pd.DataFrame, segmented: pd.DataFrame, copied: dict) -> pd.DataFrame:
+    """
+    webElementId / segmentId of every row of `table`, from the segmentation of the rows
+    split_duplicates kept and the canonical segments of the others; segment ids are
+    renumbered 1-based in order of first appearance.
+    """
+    if not copied:
+        return segmented
+    own = dict(zip(segmented["webElementId"].astype(str), segmented["segmentId"].astype(str)))
+    rows, keys = [], []
+    for row, element in enumerate(table["webElementId"].astype(str)):
+        if element in own:
+            keys.append("own:" + own[element])
+        elif element in copied:
+            keys.append("copy:%s:%s" % copied[element])
+        else:
+            continue
+        rows.append(row)
+    return pd.DataFrame({
+        "webElementId": table["webElementId"].to_numpy()[rows],
+        "segmentId": pd.factorize(pd.Series(keys, dtype=object))[0] + 1,
+    })
@@ -0,0 +1,51 @@
+"""
+Objective         -   Prune scroll histories (extractor/history.py): drop the records and
+                      snapshots preceding the last snapshot at or before a cutoff.
+
+Usage:
+    python manage.py compact_history [--site amazon_com] [--before 2025-01-31T00:00] [--snapshot]
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import glob
+import os
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from extractor import history
+from extractor.storage import scroll_lock
+
+
+class Command(BaseCommand):
+    help = "Drop scroll history older than the last snapshot at or before a cutoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--outputs", default="./Outputs/", help="Output directory of the extractor")
+        parser.add_argument("--site", help="Only compact this site folder (e.g. amazon_com)")
+        parser.add_argument("--before", help="Cutoff, ISO-8601 or epoch seconds (default: now)")
+        parser.add_argument("--snapshot", action="store_true",
+                            help="Snapshot the latest state first, so everything before it can go")
+
+    def handle(self, *args, **options):
+        before = None
+        if options["before"]:
+            try:
+                before = history.parse_timestamp(options["before"])
+            except ValueError:
+                raise CommandError(f"Invalid --before: {options['before']}")
+
+        pattern = os.path.join(options["outputs"], options["site"] or "*", "scroll_*")
+        total = 0
+        for scroll_folder in sorted(glob.glob(pattern)):
+            if not os.path.isdir(history.history_dir(scroll_folder)):
+                continue
+            with scroll_lock(scroll_folder):
+                if options["snapshot"]:
+                    rows, _, _ = history.materialize(scroll_folder)
+                    history.record(scroll_folder, pd.DataFrame(rows))
+                dropped = history.compact(scroll_folder, before)
+            total += dropped
+            if dropped:
+                self.stdout.write(f"{scroll_folder}: dropped {dropped} records")
+        self.stdout.write(self.style.SUCCESS(f"Compaction done, {total} records dropped"))
@@ -0,0 +1,263 @@
+"""
+Objective         -   Record per-stage ingest latencies, payload sizes, element counts and
+                      batch outcomes in process, and expose them in the Prometheus text format.
+                      Read-only query endpoints are timed in a histogram of their own, so
+                      they do not skew the ingest stages.
+
+Modules / Functions:
+    Counter             -   Monotonic counter keyed by label values.
+    Histogram           -   Fixed-bucket histogram keyed by label values.
+    StageTimer          -   Per-request recorder of stage durations.
+    start_request       -   Create a StageTimer and make it current until the request finishes.
+    current_timer       -   Return the StageTimer of the running request, if any.
+    stage               -   Context manager timing one named stage of the running request.
+    query               -   Context manager timing one read-only query.
+    render_prometheus   -   Render every registered metric as Prometheus exposition text.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# ---------------------------------- Bucket boundaries ----------------------------------
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576,
+                4194304, 16777216, 67108864)
+COUNT_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+_REGISTRY = []
+
+
+class Counter:
+    """
+    Monotonic counter. Each distinct tuple of label values is a separate series.
+    """
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} counter"]
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Histogram with fixed upper bounds. Observations only touch one bucket slot;
+    cumulative counts are computed at render time.
+    """
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def observe(self, value, *labelvalues):
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} histogram"]
+        bucket_names = self.labelnames + ("le",)
+        for labelvalues, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else _format_bound(bound)
+                lines.append(
+                    f"{self.name}_bucket{_labels(bucket_names, labelvalues + (le,))} {cumulative}"
+                )
+            label_str = _labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{label_str} {total}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+# ------------------------------------ Ingest metrics -----------------------------------
+INGEST_STAGE_SECONDS = Histogram(
+    "extractor_ingest_stage_seconds",
+    "Time spent in each stage of scroll batch ingest.",
+    LATENCY_BUCKETS, ("stage",),
+)
+INGEST_REQUEST_SECONDS = Histogram(
+    "extractor_ingest_request_seconds",
+    "End-to-end ingest request latency by outcome.",
+    LATENCY_BUCKETS, ("outcome",),
+)
+INGEST_PAYLOAD_BYTES = Histogram(
+    "extractor_ingest_payload_bytes",
+    "Size of ingest request bodies in bytes.",
+    SIZE_BUCKETS,
+)
+INGEST_ELEMENTS = Histogram(
+    "extractor_ingest_elements",
+    "Number of elements per ingested scroll batch.",
+    COUNT_BUCKETS,
+)
+INGEST_BATCHES_TOTAL = Counter(
+    "extractor_ingest_batches_total",
+    "Ingested scroll batches by outcome (initial, recapture, unchanged, rejected, error).",
+    ("outcome",),
+)
+
+
+# ------------------------------------ Query metrics ------------------------------------
+QUERY_SECONDS = Histogram(
+    "extractor_query_seconds",
+    "Time spent answering read-only queries (history, search, similar, ground).",
+    LATENCY_BUCKETS, ("query",),
+)
+
+
+# ------------------------------------ Stage timing -------------------------------------
+_current = contextvars.ContextVar("extractor_stage_timer", default=None)
+
+
+class StageTimer:
+    """
+    Collects (stage, seconds) pairs for one request, in the order they ran. It is the
+    current timer from start_request until finish() or close().
+    """
+    __slots__ = ("started", "stages", "token")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.token = None
+
+    def record(self, name, seconds):
+        self.stages.append((name, seconds))
+        INGEST_STAGE_SECONDS.observe(seconds, name)
+
+    def finish(self, outcome, payload_bytes=None, element_count=None):
+        """
+        Record end-to-end latency and the request-level observations.
+        """
+        INGEST_REQUEST_SECONDS.observe(time.perf_counter() - self.started, outcome)
+        INGEST_BATCHES_TOTAL.inc(outcome)
+        if payload_bytes is not None:
+            INGEST_PAYLOAD_BYTES.observe(payload_bytes)
+        if element_count is not None:
+            INGEST_ELEMENTS.observe(element_count)
+        self.close()
+
+    def close(self):
+        """
+        Stop being the current timer, so later stages on this thread (e.g. of a
+        non-ingest view) are not recorded here.
+        """
+        if self.token is None:
+            return
+        try:
+            _current.reset(self.token)
+        except ValueError:
+            # Finished from another context than the one it was started in
+            if _current.get() is self:
+                _current.set(None)
+        self.token = None
+
+
+def start_request(request=None):
+    """
+    Create a StageTimer and make it the current one for this thread / task until its
+    finish() or close(). It is also kept as `request.stage_timer`, for wrappers that
+    read it after the handler returned (profiling.py).
+    """
+    timer = StageTimer()
+    timer.token = _current.set(timer)
+    if request is not None:
+        request.stage_timer = timer
+    return timer
+
+
+def current_timer():
+    return _current.get()
+
+
+@contextmanager
+def stage(name):
+    """
+    Time the enclosed block and record it against the current request's timer.
+    Outside a request the duration still feeds the stage histogram.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timer = _current.get()
+        if timer is not None:
+            timer.record(name, elapsed)
+        else:
+            INGEST_STAGE_SECONDS.observe(elapsed, name)
+
+
+@contextmanager
+def query(name):
+    """
+    Time the enclosed block into the query histogram, never into a request's stages.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        QUERY_SECONDS.observe(time.perf_counter() - started, name)
+
+
+# -------------------------------------- Rendering --------------------------------------
+def render_prometheus():
+    """
+    Render all registered metrics as Prometheus text exposition format (version 0.0.4).
+    """
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
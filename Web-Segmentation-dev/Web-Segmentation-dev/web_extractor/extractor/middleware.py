@@ -0,0 +1,153 @@
+"""
+Objective         -   Accept compressed request bodies (`Content-Encoding: gzip` / `zstd`) on the
+                      extract API, so remote capture machines can upload the highly repetitive
+                      element JSON at a fraction of its size.
+
+                      The body is decompressed in a streaming fashion in front of the DRF / JSON
+                      parsers and the decompressed size is capped, so a small compressed payload
+                      cannot expand into an unbounded amount of memory. The cap defaults to
+                      DATA_UPLOAD_MAX_MEMORY_SIZE, i.e. Django's upload limit applies to the body
+                      the views actually parse, not to the bytes on the wire. zstd needs the
+                      optional `zstandard` package; without it zstd bodies get 415.
+
+Configuration (settings.EXTRACTOR_DECOMPRESSION, all keys optional):
+    ENABLED         -   Turn decompression on (default True).
+    MAX_SIZE        -   Maximum decompressed body size in bytes
+                        (default DATA_UPLOAD_MAX_MEMORY_SIZE, None for no limit).
+    CHUNK_SIZE      -   Bytes decompressed per read (default 64 KiB).
+
+Modules / Functions:
+    RequestDecompressionMiddleware  -   Replaces a compressed request body by its decompressed form.
+    decompress_stream               -   Decompress a file-like body with a size limit.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import gzip
+import zlib
+from io import BytesIO
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+
+from . import metrics
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_DECOMPRESSION", {}) or {}
+
+
+def _open_gzip(stream):
+    return gzip.GzipFile(fileobj=stream, mode="rb")
+
+
+def _open_zstd(stream):
+    return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+
+
+DECODERS = {
+    "gzip": _open_gzip,
+    "x-gzip": _open_gzip,
+    "zstd": _open_zstd,
+}
+
+DECODE_ERRORS = (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+class _LimitedReader:
+    """
+    File-like wrapper that fails once more than `limit` bytes have been read, so the
+    compressed side is bounded as well.
+    """
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.consumed = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.consumed += len(data)
+        if self.limit is not None and self.consumed > self.limit:
+            raise BodyTooLarge(f"Compressed request body exceeds {self.limit} bytes")
+        return data
+
+
+def decompress_stream(stream, encoding: str, max_size=None, chunk_size=65536) -> bytes:
+    """
+    Decompress `stream` read in `chunk_size` pieces; raises BodyTooLarge as soon as the
+    output (or the compressed input) passes `max_size`.
+    """
+    reader = DECODERS[encoding](_LimitedReader(stream, max_size))
+    out = BytesIO()
+    while True:
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            break
+        out.write(chunk)
+        if max_size is not None and out.tell() > max_size:
+            raise BodyTooLarge(f"Decompressed request body exceeds {max_size} bytes")
+    return out.getvalue()
+
+
+class RequestDecompressionMiddleware:
+    """
+    Decompress request bodies sent with a supported Content-Encoding and hand the
+    views a plain request: `request.body` / `request.read()` return the decompressed
+    bytes, CONTENT_LENGTH matches them and the Content-Encoding header is removed.
+    Responds 415 for unsupported encodings, 413 past the size limit and 400 for
+    corrupt bodies.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        error = self._decompress(request)
+        return error or self.get_response(request)
+
+    async def __acall__(self, request):
+        error = None
+        if request.META.get("HTTP_CONTENT_ENCODING"):
+            # CPU-bound; keep it off the event loop
+            error = await sync_to_async(self._decompress, thread_sensitive=False)(request)
+        return error or await self.get_response(request)
+
+    def _decompress(self, request):
+        config = _config()
+        encoding = request.META.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if not encoding or encoding == "identity" or not config.get("ENABLED", True):
+            return None
+        if encoding not in DECODERS or (encoding == "zstd" and zstandard is None):
+            return JsonResponse({"error": f"Unsupported Content-Encoding: {encoding}"}, status=415)
+
+        max_size = config.get("MAX_SIZE", settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+        try:
+            with metrics.stage("decompress"):
+                body = decompress_stream(request, encoding, max_size, config.get("CHUNK_SIZE", 65536))
+        except BodyTooLarge as e:
+            return JsonResponse({"error": str(e)}, status=413)
+        except DECODE_ERRORS as e:
+            return JsonResponse({"error": f"Invalid {encoding} request body: {e}"}, status=400)
+
+        # HttpRequest.body / read() serve these from now on; the size check in
+        # HttpRequest.body only runs when _body is unset, so it is not applied twice
+        request._body = body
+        request._stream = BytesIO(body)
+        request.META["CONTENT_LENGTH"] = str(len(body))
+        del request.META["HTTP_CONTENT_ENCODING"]
+        return None
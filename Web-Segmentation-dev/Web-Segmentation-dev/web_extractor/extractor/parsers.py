@@ -0,0 +1,42 @@
+"""
+Objective         -   DRF parser for newline-delimited JSON (NDJSON) request bodies, used by the
+                      bulk ingest endpoint so a crawler can stream one scroll batch per line.
+
+Modules / Functions:
+    NDJSONParser    -   Parses `application/x-ndjson` bodies into a lazy iterator of objects.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import codecs
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Yields one decoded JSON value per non-empty line. Lines are read from the request
+    stream as the view consumes them, so a batch can be processed while later ones are
+    still being read; a malformed line raises ParseError when it is reached.
+    """
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if stream is None:
+            return iter(())
+        return self._iter_lines(codecs.getreader(encoding)(stream))
+
+    @staticmethod
+    def _iter_lines(reader):
+        for line_no, line in enumerate(reader, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ParseError(f"NDJSON parse error on line {line_no}: {e}")
@@ -0,0 +1,159 @@
+"""
+Objective         -   Opt-in per-request profiling for the extractor views: a cProfile dump and a
+                      tracemalloc top-N report written under a profiles directory keyed by
+                      site and scroll index, plus a `Server-Timing` header with stage timings.
+                      tracemalloc (and its peak) is process-wide, so profiled requests run one
+                      at a time; the others are not held up.
+
+Configuration (settings.EXTRACTOR_PROFILING, all keys optional):
+    ENABLED         -   Profile every request (default False).
+    SAMPLE_RATE     -   Fraction of requests to profile at random (default 0.0).
+    ALLOW_HEADER    -   Honour the request header below (default settings.DEBUG).
+    HEADER          -   Request header that turns profiling on (default "X-Extractor-Profile").
+    DIR             -   Output directory (default "./profiles/").
+    TOP_N           -   Number of tracemalloc allocation sites to keep (default 25).
+    SERVER_TIMING   -   Always emit `Server-Timing`, even for unprofiled requests (default False).
+
+Modules / Functions:
+    profile_ingest      -   Decorator for APIView handler methods.
+    server_timing       -   Format a StageTimer as a `Server-Timing` header value.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import cProfile
+import functools
+import os
+import random
+import re
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+
+from . import metrics
+
+
+DEFAULTS = {
+    "ENABLED": False,
+    "SAMPLE_RATE": 0.0,
+    "ALLOW_HEADER": None,
+    "HEADER": "X-Extractor-Profile",
+    "DIR": "./profiles/",
+    "TOP_N": 25,
+    "SERVER_TIMING": False,
+}
+
+_PROFILE_LOCK = threading.Lock()
+
+
+def profile_ingest(handler):
+    """
+    Wrap an APIView handler (e.g. `post`) so that selected requests are profiled.
+    When no trigger fires the only overhead is reading the settings dict.
+    """
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        config = getattr(settings, "EXTRACTOR_PROFILING", None)
+        if not config or not _should_profile(request, config):
+            response = handler(view, request, *args, **kwargs)
+            if config and config.get("SERVER_TIMING"):
+                _add_server_timing(response, request)
+            return response
+
+        top_n = config.get("TOP_N", DEFAULTS["TOP_N"])
+        # Another request stopping tracemalloc or resetting its peak would break this one
+        with _PROFILE_LOCK:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            try:
+                profiler.enable()
+                try:
+                    response = handler(view, request, *args, **kwargs)
+                finally:
+                    profiler.disable()
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
+            elapsed = time.perf_counter() - started
+
+        site, scroll_index = _request_key(request)
+        folder = os.path.join(
+            config.get("DIR", DEFAULTS["DIR"]), site, f"scroll_{scroll_index}"
+        )
+        os.makedirs(folder, exist_ok=True)
+        stem = os.path.join(
+            folder, f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{id(request):x}"
+        )
+        profiler.dump_stats(f"{stem}.prof")
+        _write_tracemalloc_report(f"{stem}.tracemalloc.txt", snapshot, top_n, peak, elapsed)
+
+        _add_server_timing(response, request)
+        response["X-Extractor-Profile"] = f"{stem}.prof"
+        return response
+
+    return wrapper
+
+
+def server_timing(timer) -> str:
+    """
+    Format the stages recorded on a StageTimer as a `Server-Timing` header value (ms).
+    """
+    totals = {}
+    for name, seconds in timer.stages:
+        totals[name] = totals.get(name, 0.0) + seconds
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items()]
+    entries.append(f"total;dur={(time.perf_counter() - timer.started) * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def _should_profile(request, config) -> bool:
+    if config.get("ENABLED"):
+        return True
+    allow_header = config.get("ALLOW_HEADER")
+    if allow_header is None:
+        allow_header = settings.DEBUG
+    if allow_header and request.headers.get(config.get("HEADER", DEFAULTS["HEADER"])):
+        return True
+    rate = config.get("SAMPLE_RATE", 0.0)
+    return bool(rate) and random.random() < rate
+
+
+def _add_server_timing(response, request):
+    timer = getattr(request, "stage_timer", None)
+    if timer is not None:
+        response["Server-Timing"] = server_timing(timer)
+
+
+def _request_key(request):
+    """
+    Derive (site, scroll_index) for the output folder from an already parsed request.
+    """
+    try:
+        data = request.data
+        website = data.get("website", "") or ""
+        scroll_index = data.get("scroll_index")
+        if scroll_index is None:
+            elements = data.get("elements") or []
+            if elements and isinstance(elements[0], dict):
+                scroll_index = elements[0].get("scrollIndex")
+    except Exception:
+        website, scroll_index = "", None
+    site = re.sub(r"[^\w\-]", "_", str(website).replace("www.", "")) or "unknown"
+    return site, "unknown" if scroll_index is None else re.sub(r"[^\w\-]", "_", str(scroll_index))
+
+
+def _write_tracemalloc_report(path, snapshot, top_n, peak, elapsed):
+    stats = snapshot.statistics("lineno")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"elapsed_seconds: {elapsed:.6f}\n")
+        f.write(f"peak_traced_bytes: {peak}\n")
+        f.write(f"top {top_n} allocation sites:\n")
+        for stat in stats[:top_n]:
+            f.write(f"{stat}\n")
@@ -0,0 +1,174 @@
+"""
+Objective         -   Full-text search over the text of every captured element, so targets such
+                      as "Add to Cart" can be found across sites and scrolls without grepping CSVs.
+
+                      Elements live in a SQLite table (site, scroll, webElementId, xpath, bbox,
+                      text) with an external-content FTS5 index kept in sync by triggers. Besides
+                      the text, the index holds a `scope` column with one token for the site and
+                      one for the scroll, so site / scroll filters are posting-list intersections
+                      inside FTS5 rather than row-by-row checks. Only the requested page of
+                      BM25-ranked rowids is joined back to the element table, and rows are read
+                      lazily from the cursor. Ingest replaces a scroll's rows in one transaction;
+                      WAL mode keeps searches from blocking on ingest writes.
+
+Configuration (settings.EXTRACTOR_SEARCH, all keys optional):
+    ENABLED     -   Index elements on ingest (default False).
+    DB          -   Path of the SQLite database (default ./Outputs/search.sqlite3).
+
+Modules / Functions:
+    connection          -   Per-thread connection to the search database (schema created on first use).
+    index_scroll        -   Replace the indexed rows of one scroll.
+    match_expression    -   FTS5 query from free text (tokens ANDed, optional prefix match).
+    search              -   Iterate over ranked matches.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import os
+import re
+import sqlite3
+import threading
+
+import pandas as pd
+from django.conf import settings
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS elements (
+    id INTEGER PRIMARY KEY,
+    site TEXT NOT NULL,
+    scroll_index INTEGER NOT NULL,
+    element_id TEXT NOT NULL,
+    xpath TEXT,
+    text TEXT,
+    x REAL, y REAL, width REAL, height REAL,
+    scope TEXT GENERATED ALWAYS AS ('s' || hex(site) || ' n' || scroll_index) VIRTUAL
+);
+CREATE INDEX IF NOT EXISTS elements_scroll ON elements (site, scroll_index);
+CREATE VIRTUAL TABLE IF NOT EXISTS elements_fts USING fts5(
+    text, scope, content='elements', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS elements_ai AFTER INSERT ON elements BEGIN
+    INSERT INTO elements_fts (rowid, text, scope) VALUES (new.id, new.text, new.scope);
+END;
+CREATE TRIGGER IF NOT EXISTS elements_ad AFTER DELETE ON elements BEGIN
+    INSERT INTO elements_fts (elements_fts, rowid, text, scope)
+    VALUES ('delete', old.id, old.text, old.scope);
+END;
+"""
+
+# Rank by the text column only
+RANK = "INSERT INTO elements_fts (elements_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')"
+
+BBOX_COLUMNS = ("x", "y", "width", "height")
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_local = threading.local()
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_SEARCH", {}) or {}
+
+
+def enabled() -> bool:
+    return _config().get("ENABLED", False)
+
+
+def connection() -> sqlite3.Connection:
+    path = _config().get("DB", "./Outputs/search.sqlite3")
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.execute(RANK)
+        connections[path] = conn
+    return conn
+
+
+def index_scroll(site: str, scroll_index: int, table: pd.DataFrame, xpaths=None) -> int:
+    """
+    Replace the indexed elements of (site, scroll_index) by the rows of `table`.
+    `xpaths` overrides the table's xpath column (e.g. the original, uncleaned XPaths).
+    Returns the number of rows indexed.
+    """
+    n = len(table)
+    xpaths = table["xpath"] if xpaths is None else xpaths
+    if all(col in table.columns for col in BBOX_COLUMNS):
+        bbox = [pd.to_numeric(table[col], errors="coerce").astype(object)
+                .where(table[col].notna(), None).tolist() for col in BBOX_COLUMNS]
+    else:
+        bbox = [[None] * n] * 4
+    texts = table["text"].fillna("").astype(str) if "text" in table.columns else [""] * n
+    rows = zip(
+        [site] * n, [scroll_index] * n,
+        table["webElementId"].astype(str), xpaths.astype(str), texts, *bbox
+    )
+
+    conn = connection()
+    with conn:
+        conn.execute("DELETE FROM elements WHERE site = ? AND scroll_index = ?", (site, scroll_index))
+        conn.executemany(
+            "INSERT INTO elements (site, scroll_index, element_id, xpath, text, x, y, width, height)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+    return n
+
+
+def match_expression(query: str, prefix: bool = False) -> str:
+    """
+    Quote every word of `query` so user input cannot break FTS5 syntax; all words must
+    match, the last one as a prefix if requested.
+    """
+    tokens = TOKEN_RE.findall(query)
+    if not tokens:
+        return ""
+    terms = [f'text : "{token}"' for token in tokens]
+    if prefix:
+        terms[-1] += "*"
+    return " AND ".join(terms)
+
+
+def search(expression: str, site: str = None, scroll_index: int = None, limit: int = 20,
+           offset: int = 0):
+    """
+    Run the query and return an iterator over its matches, best first, as dicts with
+    site, scroll_index, webElementId, xpath, text, bbox (or None) and score (lower is
+    better). Query errors are raised here, before anything is iterated.
+    """
+    if site is not None:
+        expression = f'({expression}) AND scope : "s{site.encode("utf-8").hex()}"'
+    if scroll_index is not None:
+        expression = f'({expression}) AND scope : "n{int(scroll_index)}"'
+    sql = (
+        "SELECT e.site, e.scroll_index, e.element_id, e.xpath, e.text,"
+        "       e.x, e.y, e.width, e.height, m.rank"
+        " FROM (SELECT rowid, rank FROM elements_fts WHERE elements_fts MATCH ?"
+        "       ORDER BY rank LIMIT ? OFFSET ?) m"
+        " JOIN elements e ON e.id = m.rowid"
+        " ORDER BY m.rank"
+    )
+    return _iter_matches(connection().execute(sql, (expression, limit, offset)))
+
+
+def _iter_matches(cursor):
+    try:
+        for site_, scroll, element_id, xpath, text, x, y, w, h, rank in cursor:
+            yield {
+                "site": site_,
+                "scroll_index": scroll,
+                "webElementId": element_id,
+                "xpath": xpath,
+                "text": text,
+                "bbox": None if x is None else {"x": x, "y": y, "width": w, "height": h},
+                "score": rank,
+            }
+    finally:
+        cursor.close()
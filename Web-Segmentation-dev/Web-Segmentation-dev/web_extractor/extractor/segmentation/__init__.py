@@ -0,0 +1,13 @@
+"""
+Objective         -   Built-in segmenters that run inside the extractor, next to (or instead of)
+                      the LLM segmenter in llm_integration/.
+
+Modules / Functions:
+    structural          -   XPath-tree / tag / bbox based segmentation of a scroll.
+    visual              -   Screenshot XY-cut segmentation of a scroll.
+    fusion              -   Structural + visual segmentation fused by graph components.
+    prompt              -   Token-budgeted element table serialization for the LLM segmenter.
+    windows             -   Windowed, concurrent LLM segmentation of large scrolls.
+    embedding           -   Model-free hashed embedding + clustering segmentation backend.
+    jobs                -   Bounded background queue of the built-in backends.
+"""
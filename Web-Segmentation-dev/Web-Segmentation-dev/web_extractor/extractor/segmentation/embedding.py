@@ -0,0 +1,266 @@
+"""
+Objective         -   Segmentation backend that needs no model at all, for ingest nodes without
+                      access to an LLM: elements are embedded with a hashed feature vectorizer
+                      and clustered with a DBSCAN-style pass constrained by document order and
+                      bbox adjacency.
+
+                      Embedding: every element contributes features from its cleaned xpath
+                      (its own path and its three nearest ancestor paths, with decreasing
+                      weight), its tag, and the words of its text (weight split among them).
+                      Features are hashed with pandas' deterministic hash_array (the same in
+                      every process, unlike hash()) into EMBEDDING_DIM signed buckets and the
+                      rows L2-normalized, all as array operations over one long feature table.
+
+                      Clustering: only elements at most EMBEDDING_WINDOW rows apart in document
+                      order (xpaths sorted with zero-padded positions) are compared, one strided
+                      dot product per offset, and when boxes are known only those within
+                      BBOX_GAP pixels of each other. Pairs with cosine similarity of at least
+                      1 - EMBEDDING_EPS are neighbours; elements with EMBEDDING_MIN_PTS
+                      neighbours are core points and connected core points form clusters
+                      (fusion.connected_components). Other elements join their most similar
+                      core neighbour or stay on their own. As density clustering chains along
+                      long lists, clusters are cut into runs of MAX_SEGMENT elements.
+
+                      queue_segmentation(xpath_csv) has the LLM segmenter's interface; scrolls
+                      are segmented on a pool of EMBEDDING_WORKERS processes (spawned, so the
+                      threaded server is never forked), which receive the settings they need
+                      with each job. Boxes come from the scroll's cleaned CSV when it has them.
+                      The new scrolls of a bulk upload form one job (queue_site_segmentation).
+
+Configuration (settings.EXTRACTOR_SEGMENTATION, all keys optional):
+    EMBEDDING           -   Use this backend when no LLM segmenter is available (default False).
+    EMBEDDING_DIM       -   Hashed feature dimensions (default 256).
+    EMBEDDING_WINDOW    -   Rows compared with each element, in document order (default 8).
+    EMBEDDING_EPS       -   Cosine distance below which two elements are neighbours (default 0.35).
+    EMBEDDING_MIN_PTS   -   Neighbours that make an element a core point (default 2).
+    EMBEDDING_WORKERS   -   Worker processes (default 2).
+    EMBEDDING_QUEUE     -   Scrolls accepted before queue_segmentation refuses (default 32).
+    BBOX_GAP            -   Largest distance in pixels between neighbouring boxes (default 24).
+    MAX_SEGMENT         -   Largest number of elements in a segment (default 40).
+
+Modules / Functions:
+    embed               -   Hashed feature vectors of an element table.
+    vectorize           -   Hashed feature vectors from a row / feature / weight table.
+    cluster             -   Cluster labels from vectors, optionally constrained by boxes.
+    segment             -   webElementId / segmentId table of a scroll's elements.
+    segment_csv         -   Segment an xpath CSV into its `*_segmented.csv`.
+    queue_segmentation  -   Accept a scroll for background segmentation.
+    queue_site_segmentation - Accept the new scrolls of a site as one background job.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .. import identity
+from ..storage import scroll_lock, write_csv_atomic
+from .fusion import connected_components
+from .jobs import JobQueue
+
+
+BBOX_COLUMNS = ["x", "y", "width", "height"]
+POSITION_RE = re.compile(r"\[\d+\]")
+DIGITS_RE = re.compile(r"(?<=\[)\d+(?=\])")
+ANCESTOR_WEIGHTS = (1.0, 0.7, 0.5, 0.35)  # own path, parent, grandparent, ...
+TAG_WEIGHT = 0.5
+TEXT_WEIGHT = 0.8
+MAX_WORDS = 20
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_SEGMENTATION", {}) or {}
+
+
+def enabled() -> bool:
+    return _config().get("EMBEDDING", False)
+
+
+def _features(table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Long row / feature / weight table of an element table.
+    """
+    xpaths = [POSITION_RE.sub("", xpath) for xpath in table["xpath"].fillna("").astype(str).tolist()]
+    rows = np.arange(len(xpaths))
+    parts = []
+    paths = xpaths
+    for weight in ANCESTOR_WEIGHTS:
+        parts.append(pd.DataFrame({"row": rows, "feature": ["p:" + path for path in paths], "weight": weight}))
+        paths = [path.rsplit("/", 1)[0] for path in paths]
+    tags = ["t:" + path.rsplit("/", 1)[-1].split("[", 1)[0].lower() for path in xpaths]
+    parts.append(pd.DataFrame({"row": rows, "feature": tags, "weight": TAG_WEIGHT}))
+
+    if "text" in table.columns:
+        words = (table["text"].fillna("").astype(str).str.lower().str.findall(r"[^\W_]{2,}")
+                 .str[:MAX_WORDS].reset_index(drop=True).explode().dropna())
+        if len(words):
+            count = words.groupby(level=0).transform("size").to_numpy()
+            parts.append(pd.DataFrame({"row": words.index.to_numpy(), "feature": "w:" + words.to_numpy(),
+                                       "weight": TEXT_WEIGHT / np.sqrt(count)}))
+    return pd.concat(parts, ignore_index=True)
+
+
+def embed(table: pd.DataFrame, dim: int = None) -> np.ndarray:
+    """
+    (rows, dim) float32 matrix of L2-normalized hashed features; `table` needs xpath
+    (cleaned or not) and optionally text.
+    """
+    return vectorize(_features(table), len(table), dim or _config().get("EMBEDDING_DIM", 256))
+
+
+def vectorize(features: pd.DataFrame, n: int, dim: int) -> np.ndarray:
+    """
+    (n, dim) float32 matrix of L2-normalized hashed features from a long row / feature /
+    weight table.
+    """
+    hashed = pd.util.hash_array(features["feature"].to_numpy(dtype=object))
+    column = (hashed % np.uint64(dim)).astype(np.int64)
+    sign = np.where((hashed >> np.uint64(63)) == 1, -1.0, 1.0)
+    vectors = np.zeros((n, dim), dtype=np.float32)
+    np.add.at(vectors, (features["row"].to_numpy(), column), sign * features["weight"].to_numpy())
+    norm = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norm > 0, norm, 1)
+
+
+def _near_boxes(boxes: np.ndarray, i: np.ndarray, j: np.ndarray, gap: float) -> np.ndarray:
+    """
+    True where the boxes of rows i and j are within `gap` pixels (rows without a box
+    count as near).
+    """
+    a, b = boxes[i], boxes[j]
+    dx = np.maximum(np.maximum(b[:, 0] - (a[:, 0] + a[:, 2]), a[:, 0] - (b[:, 0] + b[:, 2])), 0)
+    dy = np.maximum(np.maximum(b[:, 1] - (a[:, 1] + a[:, 3]), a[:, 1] - (b[:, 1] + b[:, 3])), 0)
+    return ~((dx > gap) | (dy > gap))
+
+
+def cluster(vectors: np.ndarray, boxes: np.ndarray = None, window: int = 8, eps: float = 0.35,
+            min_pts: int = 2, gap: float = 24) -> np.ndarray:
+    """
+    Cluster labels (0-based, in order of first row) of normalized vectors in document
+    order; `boxes` is an optional (n, 4) x, y, width, height array (NaN rows unknown).
+    """
+    n = len(vectors)
+    if not n:
+        return np.zeros(0, dtype=np.int64)
+    i_parts, j_parts, sim_parts = [], [], []
+    for offset in range(1, min(window, n - 1) + 1):
+        sim = np.einsum("ij,ij->i", vectors[:-offset], vectors[offset:])
+        i = np.arange(n - offset)
+        keep = sim >= 1 - eps
+        i_parts.append(i[keep])
+        j_parts.append(i[keep] + offset)
+        sim_parts.append(sim[keep])
+    i = np.concatenate(i_parts) if i_parts else np.zeros(0, dtype=np.int64)
+    j = np.concatenate(j_parts) if j_parts else np.zeros(0, dtype=np.int64)
+    sim = np.concatenate(sim_parts) if sim_parts else np.zeros(0)
+    if boxes is not None:
+        near = _near_boxes(np.nan_to_num(boxes, nan=0.0), i, j, gap)
+        unknown = np.isnan(boxes).any(axis=1)
+        keep = near | unknown[i] | unknown[j]
+        i, j, sim = i[keep], j[keep], sim[keep]
+
+    degree = np.bincount(i, minlength=n) + np.bincount(j, minlength=n)
+    core = degree >= min_pts
+    both = core[i] & core[j]
+    labels = connected_components(n, i[both], j[both])
+
+    # Border points join their most similar core neighbour
+    border = core[i] ^ core[j]
+    point = np.where(core[i[border]], j[border], i[border])
+    anchor = np.where(core[i[border]], i[border], j[border])
+    order = np.argsort(-sim[border], kind="stable")
+    point, anchor = point[order], anchor[order]
+    first = np.unique(point, return_index=True)[1]
+    labels[point[first]] = labels[anchor[first]]
+    return pd.factorize(labels)[0]
+
+
+def segment(table: pd.DataFrame, config: dict = None) -> pd.DataFrame:
+    """
+    Segment the elements of one scroll (webElementId, xpath, text, optional bbox
+    columns). `config` defaults to settings.EXTRACTOR_SEGMENTATION. Returns
+    webElementId / segmentId (1-based) in the table's row order.
+    """
+    config = _config() if config is None else config
+    # Document order: xpaths sorted with zero-padded positions (li[2] before li[10])
+    column = "original_xpath" if "original_xpath" in table.columns else "xpath"
+    key = [DIGITS_RE.sub(lambda m: m.group().zfill(6), xpath)
+           for xpath in table[column].fillna("").astype(str).tolist()]
+    order = np.argsort(np.array(key, dtype=object), kind="stable")
+    ordered = table.iloc[order]
+
+    vectors = embed(ordered, config.get("EMBEDDING_DIM", 256))
+    boxes = None
+    if all(col in table.columns for col in BBOX_COLUMNS):
+        boxes = ordered[BBOX_COLUMNS].apply(pd.to_numeric, errors="coerce").to_numpy(float)
+    clusters = cluster(vectors, boxes, config.get("EMBEDDING_WINDOW", 8),
+                       config.get("EMBEDDING_EPS", 0.35), config.get("EMBEDDING_MIN_PTS", 2),
+                       config.get("BBOX_GAP", 24))
+    run = pd.Series(clusters).groupby(clusters).cumcount().to_numpy() // config.get("MAX_SEGMENT", 40)
+    labels = np.empty(len(table), dtype=np.int64)
+    labels[order] = pd.factorize(pd.MultiIndex.from_arrays([clusters, run]))[0]
+    return pd.DataFrame({
+        "webElementId": table["webElementId"].to_numpy(),
+        "segmentId": pd.factorize(labels)[0] + 1,
+    })
+
+
+def _with_boxes(table: pd.DataFrame, xpath_csv: str) -> pd.DataFrame:
+    """
+    Join the boxes of the scroll's cleaned CSV (`cleaned_<site>_<n>.csv`) when it has them.
+    """
+    folder, name = os.path.split(xpath_csv)
+    cleaned_csv = os.path.join(folder, "cleaned_" + name[len("xpath_"):])
+    if not os.path.exists(cleaned_csv):
+        return table
+    header = pd.read_csv(cleaned_csv, nrows=0).columns
+    if not all(col in header for col in BBOX_COLUMNS):
+        return table
+    boxes = pd.read_csv(cleaned_csv, usecols=["webElementId"] + BBOX_COLUMNS, dtype={"webElementId": str})
+    boxes = boxes.drop_duplicates("webElementId")
+    return table.merge(boxes, on="webElementId", how="left")
+
+
+def segment_csv(xpath_csv: str, output_csv: str = None, config: dict = None) -> str:
+    """
+    Segment the elements of an xpath CSV and write `output_csv` (default the scroll's
+    `*_segmented.csv`, replacing a published fallback); returns the path. Runs in the
+    worker processes, with `config` passed from the server.
+    """
+    output_csv = output_csv or xpath_csv[:-len(".csv")] + "_segmented.csv"
+    table = _with_boxes(pd.read_csv(xpath_csv, dtype=str, keep_default_na=False), xpath_csv)
+    # Elements captured in an earlier scroll keep the segment they got there
+    unique, copied = identity.split_duplicates(table, xpath_csv, "_segmented.csv")
+    result = identity.restore_duplicates(table, segment(unique, config), copied)
+    with scroll_lock(os.path.dirname(output_csv)):
+        write_csv_atomic(result, output_csv)
+    return output_csv
+
+
+_QUEUE = JobQueue(
+    "Embedding segmentation",
+    lambda config: ProcessPoolExecutor(max_workers=config.get("EMBEDDING_WORKERS", 2),
+                                       mp_context=multiprocessing.get_context("spawn")),
+    "EMBEDDING_QUEUE",
+)
+
+
+def queue_segmentation(xpath_csv: str) -> None:
+    """
+    Segment the scroll of `xpath_csv` on the process pool. Raises RuntimeError when
+    EMBEDDING_QUEUE scrolls are already waiting or running.
+    """
+    _QUEUE.submit(segment_csv, xpath_csv, None, dict(_config()))
+
+
+def queue_site_segmentation(xpath_csvs: list) -> None:
+    """
+    Segment the new scrolls of one site on the process pool, one after the other, as a single
+    job. Raises RuntimeError when EMBEDDING_QUEUE jobs are already waiting or running.
+    """
+    _QUEUE.submit_site(segment_csv, xpath_csvs, None, dict(_config()))
@@ -0,0 +1,157 @@
+"""
+Objective         -   Fuse the structural and visual segmentations of a scroll into one, instead of
+                      only comparing them afterwards (finding_intersction_strutual_visual.py).
+
+                      Elements are the nodes of a weighted graph. Each segmentation contributes
+                      its weight to the edge between two elements it puts in the same segment;
+                      an element without a visual group (no box, off-screen) takes the group of
+                      the nearest element of its structural segment that has one (in row order),
+                      or a group of its own. Edges reaching FUSION_THRESHOLD are kept and the
+                      connected components are the fused segments. Only O(n) candidate edges
+                      are needed: consecutive elements after sorting by (segment, other
+                      segment, row) in each segmentation, which connects every pair both agree
+                      on as well as every pair either one groups. Components come from a
+                      vectorized union-find (hooking by minimum label plus pointer jumping, a
+                      logarithmic number of NumPy passes), so tens of thousands of elements
+                      fuse in milliseconds. Fragments smaller than MIN_SEGMENT are then
+                      reattached to the largest fused segment of their structural segment.
+
+                      With the default weights (1.0 each) and threshold (2.0) the fused segments
+                      are the parts that both segmenters agree on; lowering the threshold to 1.0
+                      gives the union, and unequal weights let one side decide alone.
+
+Configuration (settings.EXTRACTOR_SEGMENTATION, all keys optional):
+    FUSION                      -   Fuse on ingest when both segmentations exist (default False).
+    FUSION_STRUCTURAL_WEIGHT    -   Edge weight of a shared structural segment (default 1.0).
+    FUSION_VISUAL_WEIGHT        -   Edge weight of a shared visual group (default 1.0).
+    FUSION_THRESHOLD            -   Smallest edge weight kept (default 2.0).
+    MIN_SEGMENT                 -   Fused fragments below this size are reattached (default 3).
+
+Modules / Functions:
+    connected_components    -   Component label of every node from an edge list.
+    fuse_labels             -   Fused segment labels from per-source label arrays.
+    fuse                    -   Fused webElementId / segmentId table from the two segmentations.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .visual import GROUP_COLUMN, ID_COLUMN as VISUAL_ID_COLUMN
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_SEGMENTATION", {}) or {}
+
+
+def enabled() -> bool:
+    return _config().get("FUSION", False)
+
+
+def connected_components(n: int, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    Label every node 0..n-1 with the smallest node id of its component.
+    """
+    labels = np.arange(n)
+    u, v = np.asarray(u, dtype=np.int64), np.asarray(v, dtype=np.int64)
+    while True:
+        # Hook both ends onto the smaller label, then compress paths
+        low = np.minimum(labels[u], labels[v])
+        hooked = labels.copy()
+        np.minimum.at(hooked, labels[u], low)
+        np.minimum.at(hooked, labels[v], low)
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+        if np.array_equal(hooked, labels):
+            return labels
+        labels = hooked
+
+
+def _chain(primary: np.ndarray, secondary: np.ndarray):
+    """
+    Edges between consecutive rows sharing `primary` after sorting by (primary,
+    secondary, row).
+    """
+    order = np.lexsort((np.arange(len(primary)), secondary, primary))
+    same = primary[order[1:]] == primary[order[:-1]]
+    return order[:-1][same], order[1:][same]
+
+
+def fuse_labels(sources, weights, threshold: float) -> np.ndarray:
+    """
+    `sources` are integer label arrays over the same elements; returns fused component
+    labels 0..k-1. Exact for two sources: every kept pair is connected, by a chain of
+    kept candidate edges, to every other element it shares the kept sources with.
+    """
+    sources = [np.asarray(s, dtype=np.int64) for s in sources]
+    n = len(sources[0])
+    if not n:
+        return np.zeros(0, dtype=np.int64)
+    u, v = [], []
+    for i, primary in enumerate(sources):
+        others = [s for j, s in enumerate(sources) if j != i]
+        secondary = others[0] if others else np.zeros(n, dtype=np.int64)
+        a, b = _chain(primary, secondary)
+        u.append(a)
+        v.append(b)
+    u, v = np.concatenate(u), np.concatenate(v)
+
+    weight = np.zeros(len(u))
+    for labels, w in zip(sources, weights):
+        weight += w * (labels[u] == labels[v])
+    keep = weight >= threshold - 1e-9
+    return pd.factorize(connected_components(n, u[keep], v[keep]))[0]
+
+
+def _reattach(fused: np.ndarray, structural: np.ndarray, min_size: int) -> np.ndarray:
+    """
+    Move fragments smaller than min_size into the largest fused segment of their
+    structural segment.
+    """
+    frame = pd.DataFrame({"fused": fused, "structural": structural})
+    sizes = frame.groupby("fused")["fused"].transform("size")
+    largest = (frame.assign(size=sizes).sort_values("size", ascending=False, kind="stable")
+               .drop_duplicates("structural").set_index("structural")["fused"])
+    small = (sizes < min_size).to_numpy() & (structural >= 0)
+    fused = fused.copy()
+    fused[small] = largest.reindex(structural[small]).to_numpy()
+    return fused
+
+
+def fuse(structural_table: pd.DataFrame, visual_table: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Fused segmentation of one scroll. `structural_table` has webElementId / segmentId
+    (every element of the scroll), `visual_table` Web Element ID / Group for the
+    elements on the screenshot. Returns webElementId / segmentId in the structural
+    table's order, segment ids 1-based in order of first appearance.
+    """
+    config = _config()
+    ids = structural_table["webElementId"].astype(str)
+    structural = pd.factorize(structural_table["segmentId"])[0]
+    visual = pd.Series(np.nan, index=ids)
+    if visual_table is not None and len(visual_table):
+        groups = pd.Series(visual_table[GROUP_COLUMN].to_numpy(),
+                           index=visual_table[VISUAL_ID_COLUMN].astype(str))
+        groups = groups[~groups.index.duplicated()]
+        visual = pd.Series(pd.factorize(groups.reindex(ids))[0], dtype=float).replace(-1, np.nan)
+    # Elements without a group borrow the nearest one of their structural segment
+    by_segment = pd.Series(visual.to_numpy()).groupby(structural)
+    filled = by_segment.ffill().fillna(by_segment.bfill())
+    own = len(visual) + structural
+    visual = np.where(filled.isna(), own, filled.fillna(0)).astype(np.int64)
+
+    fused = fuse_labels(
+        [structural, visual],
+        [config.get("FUSION_STRUCTURAL_WEIGHT", 1.0), config.get("FUSION_VISUAL_WEIGHT", 1.0)],
+        config.get("FUSION_THRESHOLD", 2.0),
+    )
+    fused = _reattach(fused, structural, config.get("MIN_SEGMENT", 3))
+    return pd.DataFrame({
+        "webElementId": structural_table["webElementId"].to_numpy(),
+        "segmentId": pd.factorize(fused)[0] + 1,
+    })
+
@@ -0,0 +1,97 @@
+"""
+Objective         -   Bounded background queue behind the built-in `queue_segmentation` backends
+                      (windows.py, embedding.py), with the LLM segmenter's contract: a job is
+                      accepted or refused at once, never waited for. Refusing (RuntimeError)
+                      makes the views publish the structural result; a job that fails
+                      publishes it as well.
+
+Modules / Functions:
+    JobQueue            -   Executor created on first use plus a slot semaphore.
+    run_each            -   Run a job for each scroll of a site in turn, collecting the failures.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import logging
+import threading
+
+from django.conf import settings
+
+from . import structural
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+    `make_executor(config)` builds the executor (thread or process pool) on the first
+    submit; at most config[size_key] jobs are waiting or running at once.
+    """
+
+    def __init__(self, name: str, make_executor, size_key: str, default_size: int = 32):
+        self.name = name
+        self.make_executor = make_executor
+        self.size_key = size_key
+        self.default_size = default_size
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def _setup(self):
+        with self._lock:
+            if self._executor is None:
+                config = getattr(settings, "EXTRACTOR_SEGMENTATION", {}) or {}
+                self._slots = threading.BoundedSemaphore(config.get(self.size_key, self.default_size))
+                self._executor = self.make_executor(config)
+        return self._executor
+
+    def _submit(self, fn, *args):
+        executor = self._setup()
+        if not self._slots.acquire(blocking=False):
+            raise RuntimeError(f"{self.name} queue is full")
+        try:
+            return executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def submit(self, fn, xpath_csv: str, *args) -> None:
+        """
+        Run fn(xpath_csv, *args) in the background; raises RuntimeError when full.
+        """
+        future = self._submit(fn, xpath_csv, *args)
+        future.add_done_callback(lambda done: self._done(done, [xpath_csv], each=False))
+
+    def submit_site(self, fn, xpath_csvs: list, *args) -> None:
+        """
+        Run fn(xpath_csv, *args) for each scroll of one site, in order, as a single job
+        taking one slot; raises RuntimeError when full. A scroll that fails gets the
+        structural result, the others are still segmented.
+        """
+        xpath_csvs = list(xpath_csvs)
+        future = self._submit(run_each, fn, xpath_csvs, *args)
+        future.add_done_callback(lambda done: self._done(done, xpath_csvs, each=True))
+
+    def _done(self, future, xpath_csvs: list, each: bool) -> None:
+        self._slots.release()
+        error = future.exception()
+        if error is not None:
+            failed = [(xpath_csv, error) for xpath_csv in xpath_csvs]
+        else:
+            failed = future.result() if each else []
+        for xpath_csv, error in failed:
+            logger.error("%s failed for %s", self.name, xpath_csv, exc_info=error)
+            structural.publish_fallback(xpath_csv)
+
+
+def run_each(fn, xpath_csvs: list, *args) -> list:
+    """
+    fn(xpath_csv, *args) for each scroll in turn; returns (xpath_csv, error) of the
+    scrolls that failed. Module-level so that process pools can pickle it.
+    """
+    failed = []
+    for xpath_csv in xpath_csvs:
+        try:
+            fn(xpath_csv, *args)
+        except Exception as error:
+            failed.append((xpath_csv, error))
+    return failed
@@ -0,0 +1,289 @@
+"""
+Objective         -   Compact, token-budgeted serialization of a scroll's element table for the
+                      LLM segmenter, and the decoder of the segment ids it answers with.
+
+                      The xpath CSVs repeat long absolute xpaths, twice with original_xpath. A
+                      prompt carries one xpath per element (the original, indexed one), front
+                      coded: the number of leading steps shared with the previous row, then
+                      only the remaining steps, with tag names replaced by the codes of a
+                      legend (most frequent tag first) and `[n]` positions written as a bare
+                      number. Text is collapsed and cut to PROMPT_TEXT_CHARS characters; boxes,
+                      when present, are quantized to a PROMPT_GRID pixel grid. Rows are numbered
+                      and the model answers with row ranges per segment, which parse_reply
+                      maps back to webElementIds.
+
+                      Token counts come from a local stand-in for a BPE tokenizer (words of up
+                      to 8 letters, numbers in groups of 3 digits, single punctuation marks),
+                      counted in chunks until the budget is reached. fit tries shorter text, then no
+                      boxes, then keeps the longest prefix of rows within PROMPT_BUDGET.
+
+Configuration (settings.EXTRACTOR_SEGMENTATION, all keys optional):
+    PROMPT_BUDGET       -   Token budget of one prompt (default 8000).
+    PROMPT_TEXT_CHARS   -   Characters of element text kept (default 80).
+    PROMPT_GRID         -   Box quantization step in pixels, None to leave boxes out (default 8).
+
+Modules / Functions:
+    count_tokens        -   Approximate token count of a string.
+    serialize           -   Prompt text of an element table at a given text length / grid.
+    fit                 -   Prompt of the longest prefix of a table that fits the budget.
+    shared_steps        -   Leading xpath steps each row shares with the previous one.
+    decode_rows         -   Rows (xpath, text, box) back from a prompt.
+    parse_reply         -   webElementId / segmentId table from the model's reply.
+    serialize_csv       -   fit an xpath CSV.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import re
+from collections import namedtuple
+from itertools import chain
+from string import ascii_lowercase
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from ..xpath_tree import STEP_RE
+
+
+# Stand-in for a BPE tokenizer: short words (with their leading space), 3-digit groups,
+# whitespace runs and any other single character
+TOKEN_RE = re.compile(r" ?[A-Za-z]{1,8}| ?\d{1,3}|\s+|[^\sA-Za-z\d]")
+TAG_STEP_RE = re.compile(r"^(//)?([A-Za-z][\w.:-]*)(.*)$", re.S)
+CODE_STEP_RE = re.compile(r"^(//)?([a-z]+)(\d*)(.*)$", re.S)
+POSITION_RE = re.compile(r"^\[(\d+)\]$")
+LEGEND_RE = re.compile(r"^tags:(.*)$", re.M)
+REPLY_RE = re.compile(r"^\s*(\w+)\s*:\s*([\d\s,-]+?)\s*$", re.M)
+RANGE_RE = re.compile(r"(\d+)(?:\s*-\s*(\d+))?")
+BBOX_COLUMNS = ("x", "y", "width", "height")
+
+HEADER = (
+    "rows: index|shared|steps|text|box\n"
+    "an xpath keeps the first <shared> steps of the previous row's, then <steps>\n"
+    "tags:{legend}\n"
+    "{boxes}"
+    "reply one line per segment, <segment>: <rows>, e.g. 1: 0-4,7\n"
+)
+
+Prompt = namedtuple("Prompt", "text ids tokens")
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_SEGMENTATION", {}) or {}
+
+
+def count_tokens(text: str) -> int:
+    return len(TOKEN_RE.findall(text))
+
+
+def _code(i: int) -> str:
+    code = ""
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        code = ascii_lowercase[r] + code
+    return code
+
+
+def _steps(xpaths: pd.Series):
+    """
+    Steps of every xpath as an (n, depth) matrix of step ids (-1 past the end), the
+    step strings, and the number of leading steps each row shares with the previous one.
+    """
+    per_row = [STEP_RE.findall(xpath) for xpath in xpaths.fillna("").astype(str).tolist()]
+    lengths = np.fromiter(map(len, per_row), dtype=np.int64, count=len(per_row))
+    ids, steps = pd.factorize(np.array(list(chain.from_iterable(per_row)), dtype=object))
+    rows = np.repeat(np.arange(len(per_row)), lengths)
+    level = np.arange(len(ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    matrix = np.full((len(per_row), int(lengths.max()) if len(ids) else 1), -1, dtype=np.int64)
+    matrix[rows, level] = ids
+
+    shared = np.zeros(len(xpaths), dtype=np.int64)
+    if len(xpaths) > 1:
+        same = (matrix[1:] == matrix[:-1]) & (matrix[1:] >= 0)
+        shared[1:] = np.cumprod(same, axis=1).sum(axis=1)
+    return matrix, np.asarray(steps, dtype=object), shared
+
+
+def shared_steps(table: pd.DataFrame) -> np.ndarray:
+    """
+    Number of leading xpath steps each row shares with the previous one (0 for the
+    first); low values mark the boundaries between large subtrees.
+    """
+    column = "original_xpath" if "original_xpath" in table.columns else "xpath"
+    return _steps(table[column].reset_index(drop=True))[2]
+
+
+def _encode_steps(steps: np.ndarray, used: np.ndarray):
+    """
+    Encoded form of every step and the legend of the tags of the `used` steps.
+    """
+    parts = [match.groups("") if match else ("", "", "")
+             for match in map(TAG_STEP_RE.match, steps)]
+    counts = np.bincount(used, minlength=len(steps))
+    frequency = pd.Series(counts, index=[tag for _, tag, _ in parts]).groupby(level=0, sort=False).sum()
+    frequency = frequency[(frequency > 0) & (frequency.index != "")]
+    frequency = frequency.sort_values(ascending=False, kind="stable")
+    codes = {tag: _code(i) for i, tag in enumerate(frequency.index)}
+
+    # `|` separates the fields of a row, so it is written as `/` (as in text)
+    encoded = []
+    for step, (slashes, tag, suffix) in zip(steps, parts):
+        if not tag:
+            encoded.append(step.replace("|", "/"))
+            continue
+        position = POSITION_RE.match(suffix)
+        encoded.append(slashes + codes.get(tag, tag)
+                       + (position.group(1) if position else suffix.replace("|", "/")))
+    legend = " ".join(f"{code}={tag}" for tag, code in codes.items())
+    return encoded, legend
+
+
+def _text(texts: pd.Series, chars: int) -> list:
+    if not chars:
+        return [""] * len(texts)
+    texts = (" ".join(str(t).split()).replace("|", "/") for t in texts.fillna("").tolist())
+    return [t if len(t) <= chars else t[:chars - 1] + "…" for t in texts]
+
+
+def _xpaths(table: pd.DataFrame):
+    """
+    Shared step count and encoded remaining steps of every row, and the tag legend.
+    """
+    column = "original_xpath" if "original_xpath" in table.columns else "xpath"
+    matrix, steps, shared = _steps(table[column].reset_index(drop=True))
+    tail = np.arange(matrix.shape[1]) >= shared[:, None]
+    encoded, legend = _encode_steps(steps, matrix[tail & (matrix >= 0)])
+    encoded = np.asarray(encoded + [""], dtype=object)  # -1 -> ""
+    shared = shared.tolist()
+    rest = ["/".join(s for s in row[start:] if s) for row, start in zip(encoded[matrix].tolist(), shared)]
+    return shared, rest, legend
+
+
+def _lines(table: pd.DataFrame, xpaths, text_chars: int, grid):
+    """
+    Header and row lines of a table whose xpaths are already encoded.
+    """
+    shared, rest, legend = xpaths
+    texts = _text(table["text"] if "text" in table.columns else pd.Series("", index=table.index),
+                  text_chars)
+    lines = [f"{i}|{s}|{r}|{t}" for i, (s, r, t) in enumerate(zip(shared, rest, texts))]
+    boxes = ""
+    if grid and all(col in table.columns for col in BBOX_COLUMNS):
+        values = table[list(BBOX_COLUMNS)].apply(pd.to_numeric, errors="coerce").to_numpy(float)
+        valid = ~np.isnan(values).any(axis=1)
+        quantized = np.round(np.nan_to_num(values) / grid).astype(np.int64).tolist()
+        lines = [f"{line}|{x},{y},{w},{h}" if ok else line + "|"
+                 for line, (x, y, w, h), ok in zip(lines, quantized, valid.tolist())]
+        boxes = f"boxes: x,y,w,h in {grid}px units\n"
+    return HEADER.format(legend=" " + legend if legend else "", boxes=boxes), [line + "\n" for line in lines]
+
+
+def serialize(table: pd.DataFrame, text_chars: int = None, grid=None) -> Prompt:
+    """
+    Prompt of the whole table (webElementId, original_xpath or xpath, text, optional
+    bbox columns); no budget applied.
+    """
+    text_chars = _config().get("PROMPT_TEXT_CHARS", 80) if text_chars is None else text_chars
+    header, lines = _lines(table, _xpaths(table), text_chars, grid)
+    text = header + "".join(lines)
+    return Prompt(text, table["webElementId"].tolist(), count_tokens(text))
+
+
+def fit(table: pd.DataFrame, budget: int = None) -> Prompt:
+    """
+    Prompt of the longest prefix of `table` that fits `budget` tokens, trying full text
+    and boxes first, then shorter text, then no boxes, then no text. Always holds at
+    least one row; callers serialize the remaining rows (prompt.ids tells how many were
+    taken) in further prompts.
+    """
+    config = _config()
+    budget = budget or config.get("PROMPT_BUDGET", 8000)
+    chars = config.get("PROMPT_TEXT_CHARS", 80)
+    grid = config.get("PROMPT_GRID", 8)
+    levels = [(chars, grid), (chars // 4, grid), (chars // 4, None), (0, None)]
+
+    # A row takes at least 5 tokens (index, shared count, separators, newline), so rows
+    # past budget / 5 cannot fit; the rest of a large table is never serialized
+    table = table.iloc[:budget // 5 + 1]
+    xpaths = _xpaths(table)
+    for text_chars, level_grid in levels:
+        header, lines = _lines(table, xpaths, text_chars, level_grid)
+        rows, total = _prefix_rows(header, lines, budget)
+        if rows == len(lines):
+            return Prompt(header + "".join(lines), table["webElementId"].tolist(), total)
+
+    # Even the most compact level is too long: keep the rows that fit
+    return serialize(table.iloc[:max(1, rows)], text_chars, level_grid)
+
+
+def _prefix_rows(header: str, lines: list, budget: int, chunk: int = 64):
+    """
+    Number of leading lines that fit `budget` tokens after the header, and the tokens
+    they take. Counting stops at the first chunk over budget; tokens never span a `|`
+    or newline, so line counts add up to the prompt's.
+    """
+    used = count_tokens(header)
+    for start in range(0, len(lines), chunk):
+        tokens = count_tokens("".join(lines[start:start + chunk]))
+        if used + tokens > budget:
+            for i, line in enumerate(lines[start:start + chunk]):
+                tokens = count_tokens(line)
+                if used + tokens > budget:
+                    return start + i, used
+                used += tokens
+        used += tokens
+    return len(lines), used
+
+
+def decode_rows(text: str) -> pd.DataFrame:
+    """
+    index / xpath / text / box table back from a prompt's text (text as truncated,
+    boxes in grid units).
+    """
+    legend = LEGEND_RE.search(text)
+    tags = dict(item.split("=", 1) for item in legend.group(1).split()) if legend else {}
+    rows, previous = [], []
+    for line in text.splitlines():
+        fields = line.split("|")
+        if len(fields) < 4 or not fields[0].isdigit():
+            continue
+        steps = previous[:int(fields[1])]
+        for step in STEP_RE.findall(fields[2]):
+            match = CODE_STEP_RE.match(step)
+            if match and match.group(2) in tags:
+                slashes, code, position, suffix = match.groups()
+                step = (slashes or "") + tags[code] + (f"[{position}]" if position else "") + suffix
+            steps.append(step)
+        previous = steps
+        xpath = "".join(s if s.startswith("//") else "/" + s for s in steps)
+        rows.append((int(fields[0]), xpath, fields[3], fields[4] if len(fields) > 4 else ""))
+    return pd.DataFrame(rows, columns=["index", "xpath", "text", "box"])
+
+
+def parse_reply(reply: str, ids) -> pd.DataFrame:
+    """
+    Map a reply of `<segment>: <rows>` lines onto the prompt's webElementIds. A row
+    claimed twice keeps its first segment; rows left out get a segment each. Returns
+    webElementId / segmentId (1-based, in row order) for every row of the prompt.
+    """
+    label = np.full(len(ids), None, dtype=object)
+    for segment, ranges in REPLY_RE.findall(reply):
+        for start, stop in RANGE_RE.findall(ranges):
+            start = int(start)
+            stop = min(int(stop) if stop else start, len(ids) - 1)
+            rows = np.arange(start, stop + 1)
+            rows = rows[label[rows] == None]  # noqa: E711 (element-wise)
+            label[rows] = f"s{segment}"
+    missing = np.flatnonzero(label == None)  # noqa: E711
+    label[missing] = [f"r{row}" for row in missing]
+    return pd.DataFrame({
+        "webElementId": list(ids),
+        "segmentId": pd.factorize(label)[0] + 1,
+    })
+
+
+def serialize_csv(xpath_csv: str, budget: int = None) -> Prompt:
+    """
+    fit the element table of an xpath CSV.
+    """
+    return fit(pd.read_csv(xpath_csv, dtype=str, keep_default_na=False), budget)
@@ -0,0 +1,261 @@
+"""
+Objective         -   Structural segmenter: group the elements of a scroll into segments from the
+                      page structure alone, as a baseline that runs on every batch and as the
+                      fallback when the LLM segmenter is unavailable or saturated. On every
+                      batch it is opt-in (STRUCTURAL), since it runs under the scroll lock of
+                      every ingest; the fallback segments a scroll on demand when no
+                      structural result was written for it.
+
+                      The original XPaths are loaded into an XPathTree (vectorized build) and
+                      every node gets the number of elements at or below it. Each element climbs
+                      to its highest ancestor that holds at most MAX_SEGMENT elements, without
+                      leaving a landmark (nav, header, footer, form, section, ...); that
+                      ancestor roots its segment. Then:
+                        - sibling segments stopped under one oversized container are merged
+                          into runs of about MAX_SEGMENT elements, in document order,
+                        - segments rooted at ids of one family (`result-1`, `result-2`, ...) are
+                          merged the same way,
+                        - when the batch has page-space bbox columns (x, y, width, height),
+                          segments smaller than MIN_SEGMENT join the nearest vertically
+                          adjacent, horizontally overlapping segment of at least MIN_SEGMENT
+                          elements within BBOX_GAP pixels, while it has room under
+                          MAX_SEGMENT (never one whose box contains
+                          theirs, which would fold everything into the page containers).
+                      Every step is an array operation over nodes, elements or segments (the
+                      tree is walked one depth level at a time), so a 10k-element scroll is
+                      segmented in milliseconds. The output has the LLM segmenter's format:
+                      webElementId, segmentId (1-based, in order of first appearance).
+
+Configuration (settings.EXTRACTOR_SEGMENTATION, all keys optional):
+    STRUCTURAL      -   Run the structural segmenter on ingest (default False).
+    MAX_SEGMENT     -   Largest number of elements in a structural segment (default 40).
+    MIN_SEGMENT     -   Segments with fewer elements are merged with a bbox neighbour (default 3).
+    BBOX_GAP        -   Largest vertical gap in pixels between bbox neighbours (default 24).
+    LLM_FALLBACK    -   Publish the structural result (computed then if needed) as the
+                        scroll's segmented CSV when the LLM segmenter cannot take the scroll
+                        (default True).
+
+Modules / Functions:
+    segment             -   webElementId / segmentId table of a scroll's elements.
+    publish_fallback    -   Publish the fused / structural result as a scroll's segmented CSV.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .. import identity
+from ..storage import atomic_path, scroll_lock, write_csv_atomic
+from ..xpath_tree import ROOT, XPathTree
+
+
+# Page regions; lists and tables are left to MAX_SEGMENT so a card keeps its list
+LANDMARK_TAGS = frozenset({
+    "nav", "header", "footer", "aside", "main", "form", "section", "article", "dialog",
+    "fieldset",
+})
+TAG_PATTERN = r"^(?://)?([A-Za-z][\w-]*)"
+ID_PATTERN = r"""@id\s*=\s*["']([^"']*)["']"""
+# Numbered parts of ids (uuids first, then digit runs) are what varies within a family
+FAMILY_PATTERN = r"[0-9a-f]{8}(?:-[0-9a-f]{4}){3}-[0-9a-f]{12}|\d+"
+BBOX_COLUMNS = ("x", "y", "width", "height")
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_SEGMENTATION", {}) or {}
+
+
+def enabled() -> bool:
+    return _config().get("STRUCTURAL", False)
+
+
+def fallback_enabled() -> bool:
+    return _config().get("LLM_FALLBACK", True)
+
+
+def _step_features(steps: list):
+    """
+    Per step token: is its tag a landmark, and the id family it anchors (or None).
+    """
+    steps = pd.Series(steps, dtype=object)
+    landmark = steps.str.extract(TAG_PATTERN, expand=False).str.lower().isin(LANDMARK_TAGS)
+    family = (steps.str.extract(ID_PATTERN, expand=False).str.lower()
+              .str.replace(FAMILY_PATTERN, "#", regex=True))
+    # A family needs a fixed part, else every numbered id on the page would be one family
+    family = family.where(family.str.contains(r"[^\W\d_]", regex=True, na=False))
+    return landmark.to_numpy(), family
+
+
+def _merge_groups(key: np.ndarray, group: np.ndarray, size: np.ndarray, first: np.ndarray,
+                  max_size: int) -> np.ndarray:
+    """
+    Merge segments sharing a group (group >= 0) into runs, in document order (`first`
+    row of each segment), cut when a run already holds max_size elements. Returns new
+    keys, negative for merged runs so they cannot collide with node keys.
+    """
+    frame = pd.DataFrame({"group": group, "size": size, "first": first})
+    frame = frame[group >= 0].sort_values(["group", "first"])
+    if frame.empty:
+        return key
+    before = frame.groupby("group")["size"].cumsum() - frame["size"]
+    run = pd.factorize(pd.MultiIndex.from_arrays([frame["group"], before // max_size]))[0]
+    members = np.bincount(run)
+    merged = frame.index[members[run] > 1]
+    key = key.copy()
+    key[merged] = key.min() - 1 - run[members[run] > 1]
+    return key
+
+
+def _bbox_merge(codes: np.ndarray, table: pd.DataFrame, min_size: int, max_size: int,
+                gap: float, chunk: int = 256):
+    """
+    Merge segments smaller than min_size into their nearest vertically adjacent,
+    horizontally overlapping segment of at least min_size elements, as long as it stays
+    within max_size. Containment either way does not count as adjacency.
+    """
+    values = table[list(BBOX_COLUMNS)].apply(pd.to_numeric, errors="coerce").to_numpy(float)
+    valid = ~np.isnan(values).any(axis=1)
+    k = int(codes.max()) + 1
+    size = np.bincount(codes, minlength=k)
+    left, top = np.full(k, np.inf), np.full(k, np.inf)
+    right, bottom = np.full(k, -np.inf), np.full(k, -np.inf)
+    c, v = codes[valid], values[valid]
+    np.minimum.at(left, c, v[:, 0])
+    np.minimum.at(top, c, v[:, 1])
+    np.maximum.at(right, c, v[:, 0] + v[:, 2])
+    np.maximum.at(bottom, c, v[:, 1] + v[:, 3])
+    boxed = np.isfinite(left)
+
+    small = np.flatnonzero((size < min_size) & boxed)
+    big = np.flatnonzero((size >= min_size) & boxed)
+    if not len(small) or not len(big):
+        return codes
+    bl, bt, br, bb = left[big], top[big], right[big], bottom[big]
+    joins = []
+    for start in range(0, len(small), chunk):
+        s = small[start:start + chunk, None]
+        distance = np.maximum(np.maximum(bt - bottom[s], top[s] - bb), 0)
+        overlap = np.minimum(right[s], br) - np.maximum(left[s], bl) > 0
+        contains = ((bl <= left[s]) & (br >= right[s]) & (bt <= top[s]) & (bb >= bottom[s])) \
+            | ((left[s] <= bl) & (right[s] >= br) & (top[s] <= bt) & (bottom[s] >= bb))
+        distance = np.where(overlap & ~contains & (distance <= gap), distance, np.inf)
+        best = distance.argmin(axis=1)
+        nearest = distance[np.arange(len(s)), best]
+        found = np.isfinite(nearest)
+        joins.append((s[found, 0], big[best[found]], nearest[found]))
+
+    # Nearest first, a segment takes small neighbours while it has room
+    joins = pd.DataFrame(np.concatenate([np.column_stack(j) for j in joins]) if joins else
+                         np.zeros((0, 3)), columns=["small", "target", "distance"])
+    joins = joins.astype({"small": np.int64, "target": np.int64}).sort_values(["target", "distance"])
+    taken = joins.assign(size=size[joins["small"]]).groupby("target")["size"].cumsum()
+    joins = joins[taken + size[joins["target"]] <= max_size]
+    target = np.arange(k)
+    target[joins["small"].to_numpy()] = joins["target"].to_numpy()
+    return target[codes]
+
+
+def segment(table: pd.DataFrame, max_size: int = None, min_size: int = None,
+            gap: float = None) -> pd.DataFrame:
+    """
+    Segment the elements of one scroll. `table` needs webElementId and original_xpath
+    (or xpath, taken as the original); bbox columns are used when present.
+    Returns a webElementId / segmentId table in the input row order.
+    """
+    config = _config()
+    max_size = max_size or config.get("MAX_SEGMENT", 40)
+    min_size = min_size or config.get("MIN_SEGMENT", 3)
+    gap = config.get("BBOX_GAP", 24) if gap is None else gap
+    ids = table["webElementId"].to_numpy()
+    if not len(table):
+        return pd.DataFrame({"webElementId": ids, "segmentId": np.zeros(0, dtype=np.int64)})
+
+    column = "original_xpath" if "original_xpath" in table.columns else "xpath"
+    tree = XPathTree.from_frame(table[column])
+    parent = np.frombuffer(tree.parent, dtype=np.int32).astype(np.int64)
+    depth = np.frombuffer(tree.depth, dtype=np.int32)
+    token = np.frombuffer(tree.token, dtype=np.int32)
+    node_of = np.frombuffer(tree.label_node, dtype=np.int32).astype(np.int64)
+    n = len(parent)
+    parent[ROOT] = ROOT
+
+    landmark_step, family_step = _step_features(tree.steps)
+    landmark = np.zeros(n, dtype=bool)
+    landmark[1:] = landmark_step[token[1:]]
+
+    # Elements at or below each node; children are folded into their parents one depth
+    # level at a time, deepest first
+    count = np.bincount(node_of, minlength=n)
+    order = np.argsort(depth, kind="stable")
+    bounds = np.searchsorted(depth[order], np.arange(depth.max() + 2))
+    for d in range(int(depth.max()), 0, -1):
+        nodes = order[bounds[d]:bounds[d + 1]]
+        np.add.at(count, parent[nodes], count[nodes])
+
+    # Climb while the parent is small enough; a landmark is the ceiling of its content.
+    # Both conditions only get stricter going up, so every element stops for good.
+    allowed = count <= max_size
+    allowed[ROOT] = False
+    root = node_of.copy()
+    while True:
+        up = parent[root]
+        move = allowed[up] & ~landmark[root]
+        if not move.any():
+            break
+        root = np.where(move, up, root)
+
+    # One row per segment root
+    roots, codes = np.unique(root, return_inverse=True)
+    size = np.bincount(codes)
+    first = np.full(len(roots), len(table))
+    np.minimum.at(first, codes, np.arange(len(table)))
+    key = roots.copy()
+    # Segments stopped below an oversized container are cut into runs of siblings
+    loose = ~landmark[roots] & (parent[roots] != ROOT) & (roots != ROOT)
+    key = _merge_groups(key, np.where(loose, parent[roots], -1), size, first, max_size)
+    # Id-anchored roots of one family
+    family = family_step.to_numpy(dtype=object)[np.maximum(token[roots], 0)] \
+        if len(family_step) else np.full(len(roots), np.nan, dtype=object)
+    family[roots == ROOT] = np.nan
+    family_codes, _ = pd.factorize(family)
+    family_codes = np.where(key == roots, family_codes, -1)
+    key = _merge_groups(key, family_codes, size, first, max_size)
+
+    codes = pd.factorize(key[codes])[0]
+    if all(col in table.columns for col in BBOX_COLUMNS):
+        codes = _bbox_merge(codes, table, min_size, max_size, gap)
+    return pd.DataFrame({
+        "webElementId": ids,
+        "segmentId": pd.factorize(codes)[0] + 1,
+    })
+
+
+def publish_fallback(xpath_csv: str) -> None:
+    """
+    Copy the fused (else structural) segmentation of the scroll of `xpath_csv` to its
+    `*_segmented.csv`, unless the LLM segmenter has already written one. Without either
+    (STRUCTURAL off), the scroll's cleaned table is segmented now; elements first
+    captured in an earlier scroll take their segment there, as on ingest.
+    """
+    if not fallback_enabled():
+        return
+    base = xpath_csv[:-len(".csv")]
+    folder, name = os.path.split(xpath_csv)
+    with scroll_lock(folder):
+        target = base + "_segmented.csv"
+        if os.path.exists(target):
+            return
+        for source in (base + "_fused_segmented.csv", base + "_structural_segmented.csv"):
+            if os.path.exists(source):
+                with atomic_path(target) as tmp_path:
+                    shutil.copyfile(source, tmp_path)
+                return
+        # The cleaned CSV also has the bbox columns, when the batch sent them
+        cleaned_csv = os.path.join(folder, "cleaned_" + name[len("xpath_"):])
+        table = pd.read_csv(cleaned_csv if os.path.exists(cleaned_csv) else xpath_csv)
+        unique, copied = identity.split_duplicates(table, xpath_csv, "_segmented.csv")
+        write_csv_atomic(identity.restore_duplicates(table, segment(unique), copied), target)
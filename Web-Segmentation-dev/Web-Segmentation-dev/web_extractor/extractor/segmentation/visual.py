@@ -0,0 +1,182 @@
+"""
+Objective         -   Visual segmenter: split a scroll's screenshot into regions with a recursive
+                      XY-cut and assign every element box to a region, producing the
+                      `*_visual.csv` (Web Element ID, Group) that
+                      finding_intersction_strutual_visual.py compares with the structural segments.
+
+                      The PNG is reduced by VISUAL_DOWNSAMPLE and turned into an edge mask
+                      (neighbouring gray levels differing by more than VISUAL_EDGE). Row and
+                      column prefix sums of the mask give the projection profile of any
+                      rectangle in O(height + width), so each XY-cut step is a few vectorized
+                      slices: trim the region to its content, cut it at every blank band of at
+                      least VISUAL_MIN_GAP pixels (lines with only a VISUAL_NOISE fraction of
+                      edges, e.g. scrollbars, still count as blank), horizontally first (page
+                      sections stack), else vertically, until no band is left or
+                      VISUAL_MAX_DEPTH is reached.
+                      Regions come out in reading order. Element boxes are joined to the
+                      region they overlap most with one elements x regions overlap matrix.
+                      A 1920x912 viewport is segmented in a few tens of milliseconds on CPU.
+
+                      Element boxes are page-space CSS pixels as the bbox extensions send them
+                      (client rect + scroll offset); the screenshot of scroll n starts at page
+                      y = n * viewport height, and VISUAL_SCALE is the screenshot's pixels per
+                      CSS pixel (devicePixelRatio).
+
+Configuration (settings.EXTRACTOR_SEGMENTATION, all keys optional):
+    VISUAL              -   Run the visual segmenter on ingest when boxes are sent (default False).
+    VISUAL_DOWNSAMPLE   -   Integer reduction of the screenshot before cutting (default 2).
+    VISUAL_EDGE         -   Gray level difference counted as an edge (default 12).
+    VISUAL_MIN_GAP      -   Narrowest blank band, in screenshot pixels, that separates regions (default 12).
+    VISUAL_MAX_DEPTH    -   Maximum number of nested cuts (default 8).
+    VISUAL_NOISE        -   Edges per line, as a fraction of the region's extent, still
+                            counted as blank (default 0.02).
+    VISUAL_SCALE        -   Screenshot pixels per CSS pixel (default 1.0).
+
+Modules / Functions:
+    edge_mask           -   Boolean edge mask of an image.
+    xy_cut              -   Regions of an edge mask, in reading order.
+    assign_regions      -   Region of each element box (spatial join).
+    segment_image       -   Web Element ID / Group table of a scroll's elements.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from PIL import Image
+
+
+BBOX_COLUMNS = ("x", "y", "width", "height")
+ID_COLUMN = "Web Element ID"
+GROUP_COLUMN = "Group"
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_SEGMENTATION", {}) or {}
+
+
+def enabled() -> bool:
+    return _config().get("VISUAL", False)
+
+
+def has_boxes(table: pd.DataFrame) -> bool:
+    return all(col in table.columns for col in BBOX_COLUMNS)
+
+
+def edge_mask(image, edge: int = 12) -> np.ndarray:
+    """
+    True where the gray level differs from the right or lower neighbour by more than `edge`.
+    """
+    gray = np.asarray(image.convert("L"), dtype=np.int16)
+    mask = np.zeros(gray.shape, dtype=bool)
+    mask[:, :-1] |= np.abs(np.diff(gray, axis=1)) > edge
+    mask[:-1, :] |= np.abs(np.diff(gray, axis=0)) > edge
+    return mask
+
+
+def _bands(profile: np.ndarray, min_gap: int, noise: int):
+    """
+    (start, stop) of the content bands of a trimmed profile separated by runs of at
+    least min_gap lines with at most `noise` edges each.
+    """
+    blank = np.concatenate(([False], profile <= noise, [False]))
+    edges = np.flatnonzero(np.diff(blank.astype(np.int8)))
+    starts, stops = edges[0::2], edges[1::2]
+    wide = (stops - starts) >= min_gap
+    cuts_start, cuts_stop = starts[wide], stops[wide]
+    return np.column_stack((np.concatenate(([0], cuts_stop)),
+                            np.concatenate((cuts_start, [len(profile)]))))
+
+
+def xy_cut(mask: np.ndarray, min_gap: int = 6, max_depth: int = 8, noise: float = 0.02) -> np.ndarray:
+    """
+    Recursive XY-cut of an edge mask; returns an (n, 4) array of x0, y0, x1, y1 regions
+    in reading order. Blank areas belong to no region. A line still counts as blank with
+    up to `noise` times the region's extent in edges, so lines crossing the whole
+    region (scrollbars, rules, borders) do not prevent the cuts across them.
+    """
+    height, width = mask.shape
+    # rows[y, x] = edges in row y left of x; cols[y, x] = edges in column x above y
+    rows = np.zeros((height, width + 1), dtype=np.int32)
+    np.cumsum(mask, axis=1, out=rows[:, 1:])
+    cols = np.zeros((height + 1, width), dtype=np.int32)
+    np.cumsum(mask, axis=0, out=cols[1:, :])
+
+    regions = []
+    stack = [(0, 0, width, height, 0)]
+    while stack:
+        x0, y0, x1, y1, depth = stack.pop()
+        row_profile = rows[y0:y1, x1] - rows[y0:y1, x0]
+        filled = np.flatnonzero(row_profile)
+        if not len(filled):
+            continue
+        y0, y1 = y0 + filled[0], y0 + filled[-1] + 1
+        col_profile = cols[y1, x0:x1] - cols[y0, x0:x1]
+        filled = np.flatnonzero(col_profile)
+        x0, x1 = x0 + filled[0], x0 + filled[-1] + 1
+
+        if depth < max_depth:
+            bands = _bands(rows[y0:y1, x1] - rows[y0:y1, x0], min_gap, int(noise * (x1 - x0)))
+            if len(bands) > 1:
+                stack.extend((x0, y0 + a, x1, y0 + b, depth + 1) for a, b in reversed(bands))
+                continue
+            bands = _bands(cols[y1, x0:x1] - cols[y0, x0:x1], min_gap, int(noise * (y1 - y0)))
+            if len(bands) > 1:
+                stack.extend((x0 + a, y0, x0 + b, y1, depth + 1) for a, b in reversed(bands))
+                continue
+        regions.append((x0, y0, x1, y1))
+    return np.array(regions, dtype=np.float64).reshape(-1, 4)
+
+
+def assign_regions(boxes: np.ndarray, regions: np.ndarray, chunk: int = 4096) -> np.ndarray:
+    """
+    Index of the region each (x0, y0, x1, y1) box overlaps most, or -1 when it overlaps
+    none (or has no box).
+    """
+    result = np.full(len(boxes), -1, dtype=np.int64)
+    if not len(regions):
+        return result
+    for start in range(0, len(boxes), chunk):
+        b = boxes[start:start + chunk, None, :]
+        w = np.minimum(b[..., 2], regions[:, 2]) - np.maximum(b[..., 0], regions[:, 0])
+        h = np.minimum(b[..., 3], regions[:, 3]) - np.maximum(b[..., 1], regions[:, 1])
+        area = np.where((w > 0) & (h > 0), w * h, 0)
+        best = area.argmax(axis=1)
+        hit = area[np.arange(len(best)), best] > 0
+        result[start:start + chunk] = np.where(hit, best, -1)
+    return result
+
+
+def segment_image(image, table: pd.DataFrame, scroll_index: int = 0) -> pd.DataFrame:
+    """
+    Visual groups of the elements of one scroll. `image` is the scroll's screenshot (path
+    or PIL image) and `table` has webElementId and page-space bbox columns. Elements
+    outside every region are left out. Groups are 1-based in reading order.
+    """
+    config = _config()
+    factor = max(1, int(config.get("VISUAL_DOWNSAMPLE", 2)))
+    scale = float(config.get("VISUAL_SCALE", 1.0))
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    full_height = image.height
+    if factor > 1:
+        image = image.reduce(factor)
+
+    mask = edge_mask(image, config.get("VISUAL_EDGE", 12))
+    regions = xy_cut(mask, max(1, config.get("VISUAL_MIN_GAP", 12) // factor),
+                     config.get("VISUAL_MAX_DEPTH", 8), config.get("VISUAL_NOISE", 0.02))
+
+    # Page-space CSS pixels -> reduced screenshot pixels
+    values = table[list(BBOX_COLUMNS)].apply(pd.to_numeric, errors="coerce").to_numpy(float)
+    origin_y = scroll_index * full_height / scale
+    x0 = values[:, 0] * scale / factor
+    y0 = (values[:, 1] - origin_y) * scale / factor
+    boxes = np.column_stack((x0, y0, x0 + values[:, 2] * scale / factor,
+                             y0 + values[:, 3] * scale / factor))
+    region = assign_regions(np.nan_to_num(boxes, nan=-1.0), regions)
+
+    found = region >= 0
+    return pd.DataFrame({
+        ID_COLUMN: table["webElementId"].to_numpy()[found],
+        GROUP_COLUMN: region[found] + 1,
+    })
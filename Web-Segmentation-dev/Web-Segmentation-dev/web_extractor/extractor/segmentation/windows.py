@@ -0,0 +1,227 @@
+"""
+Objective         -   LLM segmentation of scrolls too large for one model context: the elements
+                      are split into overlapping windows that each fit PROMPT_BUDGET, the
+                      windows are sent to the model concurrently, and their segment ids are
+                      stitched into one `*_segmented.csv`.
+
+                      Windows follow the document order. Each one takes the rows prompt.fit
+                      lets in, then gives back rows to end at an xpath-subtree boundary: in its
+                      second half, the cut goes where the fewest steps are shared between
+                      neighbouring rows (the boundary between the largest subtrees). The next
+                      window starts WINDOW_OVERLAP rows before the cut.
+
+                      Prompts go to an OpenAI-compatible chat completions endpoint (LLM_URL),
+                      at most LLM_CONCURRENCY at a time (asyncio semaphore; the blocking HTTP
+                      call runs in a thread, so no HTTP client dependency is needed).
+
+                      Stitching: in every overlap, a segment of one window and a segment of the
+                      next are the same segment when each holds the majority of the other's
+                      overlap rows. The linked (window, segment) pairs are joined by
+                      fusion.connected_components; each row takes the segment from the window
+                      it is nearest the middle of (first half of an overlap -> earlier window).
+
+                      queue_segmentation(xpath_csv) is the interface the views import from the
+                      LLM segmenter: jobs run on LLM_WORKERS threads, at most LLM_QUEUE are
+                      accepted at once (a full queue raises, so the views publish the structural
+                      result), and a job that fails publishes it as well. A bulk upload hands
+                      over its new scrolls as one job (queue_site_segmentation).
+
+Configuration (settings.EXTRACTOR_SEGMENTATION, all keys optional):
+    LLM_URL             -   Chat completions URL; windowed segmentation is off without it (default None).
+    LLM_MODEL           -   Model name sent with each request (default "segmenter").
+    LLM_API_KEY         -   Bearer token, if the endpoint needs one (default None).
+    LLM_TIMEOUT         -   Seconds per request (default 120).
+    LLM_CONCURRENCY     -   Requests in flight per scroll (default 4).
+    LLM_WORKERS         -   Scrolls segmented at once (default 2).
+    LLM_QUEUE           -   Scrolls accepted before queue_segmentation refuses (default 32).
+    WINDOW_OVERLAP      -   Rows shared by consecutive windows (default 16).
+
+Modules / Functions:
+    plan_windows        -   (start, stop) row spans of the windows of a table.
+    stitch              -   Segment ids of all rows from the per-window segment ids.
+    complete            -   Send one prompt to the model endpoint, return the reply text.
+    segment             -   Windowed LLM segmentation of a table (coroutine).
+    segment_csv         -   Segment an xpath CSV into its `*_segmented.csv`.
+    queue_segmentation  -   Accept a scroll for background segmentation.
+    queue_site_segmentation - Accept the new scrolls of a site as one background job.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import asyncio
+import json
+import os
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .. import identity, metrics
+from ..storage import scroll_lock, write_csv_atomic
+from . import prompt
+from .fusion import connected_components
+from .jobs import JobQueue
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_SEGMENTATION", {}) or {}
+
+
+def enabled() -> bool:
+    return bool(_config().get("LLM_URL"))
+
+
+def plan_windows(table: pd.DataFrame, budget: int = None, overlap: int = None) -> list:
+    """
+    (start, stop) spans covering every row of `table`, each fitting `budget` tokens and
+    overlapping the next by up to `overlap` rows.
+    """
+    overlap = _config().get("WINDOW_OVERLAP", 16) if overlap is None else overlap
+    shared = prompt.shared_steps(table)
+    n = len(table)
+    spans, start = [], 0
+    while start < n:
+        stop = start + len(prompt.fit(table.iloc[start:], budget).ids)
+        if stop < n:
+            # shared[c] is what rows c-1 and c have in common; the last minimum wins
+            low = start + max((stop - start) // 2, overlap + 1)
+            if low < stop:
+                candidates = shared[low:stop + 1][::-1]
+                stop = stop - int(np.argmin(candidates))
+        spans.append((start, stop))
+        if stop >= n:
+            break
+        # At most half a window is shared, so windows only overlap their neighbours
+        start = max(stop - min(overlap, (stop - start) // 2), start + 1)
+    return spans
+
+
+def stitch(spans: list, labels: list) -> np.ndarray:
+    """
+    Segment ids (0-based, in row order) of the rows covered by `spans`, from each
+    window's segment labels (one array per span).
+    """
+    labels = [pd.factorize(np.asarray(window))[0] for window in labels]
+    offsets = np.cumsum([0] + [window.max() + 1 if len(window) else 0 for window in labels])
+    nodes = [window + offset for window, offset in zip(labels, offsets)]
+
+    n = spans[-1][1]
+    owner = np.empty(n, dtype=np.int64)
+    u, v = [], []
+    for w, (start, stop) in enumerate(spans):
+        owner[start:stop] = nodes[w]
+        if w == 0:
+            continue
+        previous_start, previous_stop = spans[w - 1]
+        if start >= previous_stop:
+            continue
+        # Overlap rows as seen by both windows
+        a = nodes[w - 1][start - previous_start:previous_stop - previous_start]
+        b = nodes[w][:previous_stop - start]
+        pairs, counts = np.unique(np.column_stack((a, b)), axis=0, return_counts=True)
+        size_a = np.bincount(a, minlength=offsets[-1])
+        size_b = np.bincount(b, minlength=offsets[-1])
+        mutual = (2 * counts > size_a[pairs[:, 0]]) & (2 * counts > size_b[pairs[:, 1]])
+        u.append(pairs[mutual, 0])
+        v.append(pairs[mutual, 1])
+        # The earlier window keeps the first half of the overlap
+        middle = start + (previous_stop - start + 1) // 2
+        owner[start:middle] = nodes[w - 1][start - previous_start:middle - previous_start]
+
+    u = np.concatenate(u) if u else np.zeros(0, dtype=np.int64)
+    v = np.concatenate(v) if v else np.zeros(0, dtype=np.int64)
+    component = connected_components(int(offsets[-1]), u, v)
+    return pd.factorize(component[owner])[0]
+
+
+def _post(url: str, payload: dict, api_key, timeout: float) -> dict:
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), headers=headers)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.load(response)
+
+
+async def complete(text: str) -> str:
+    """
+    Reply of the model endpoint to one prompt.
+    """
+    config = _config()
+    payload = {
+        "model": config.get("LLM_MODEL", "segmenter"),
+        "messages": [{"role": "user", "content": text}],
+        "temperature": 0,
+    }
+    data = await asyncio.to_thread(_post, config["LLM_URL"], payload, config.get("LLM_API_KEY"),
+                                   config.get("LLM_TIMEOUT", 120))
+    return data["choices"][0]["message"]["content"]
+
+
+async def segment(table: pd.DataFrame, budget: int = None, concurrency: int = None,
+                  client=None) -> pd.DataFrame:
+    """
+    Windowed LLM segmentation of one scroll's elements; `client` is a coroutine function
+    from prompt text to reply text (default `complete`). Returns webElementId /
+    segmentId (1-based) in the table's row order.
+    """
+    concurrency = concurrency or _config().get("LLM_CONCURRENCY", 4)
+    client = client or complete
+    if not len(table):
+        return pd.DataFrame({"webElementId": table["webElementId"].to_numpy(),
+                             "segmentId": np.zeros(0, dtype=np.int64)})
+    spans = plan_windows(table, budget)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(start, stop):
+        window = prompt.fit(table.iloc[start:stop], budget)
+        async with semaphore:
+            reply = await client(window.text)
+        return prompt.parse_reply(reply, window.ids)["segmentId"].to_numpy()
+
+    labels = await asyncio.gather(*(run(start, stop) for start, stop in spans))
+    return pd.DataFrame({
+        "webElementId": table["webElementId"].to_numpy(),
+        "segmentId": stitch(spans, labels) + 1,
+    })
+
+
+def segment_csv(xpath_csv: str, output_csv: str = None, client=None) -> str:
+    """
+    Segment the elements of an xpath CSV and write `output_csv` (default the scroll's
+    `*_segmented.csv`, replacing a published fallback); returns the path.
+    """
+    output_csv = output_csv or xpath_csv[:-len(".csv")] + "_segmented.csv"
+    table = pd.read_csv(xpath_csv, dtype=str, keep_default_na=False)
+    # Elements captured in an earlier scroll keep the segment they got there
+    unique, copied = identity.split_duplicates(table, xpath_csv, "_segmented.csv")
+    with metrics.stage("llm_segmentation"):
+        result = identity.restore_duplicates(table, asyncio.run(segment(unique, client=client)), copied)
+    with scroll_lock(os.path.dirname(output_csv)):
+        write_csv_atomic(result, output_csv)
+    return output_csv
+
+
+_QUEUE = JobQueue(
+    "LLM segmentation",
+    lambda config: ThreadPoolExecutor(max_workers=config.get("LLM_WORKERS", 2),
+                                      thread_name_prefix="llm-segmentation"),
+    "LLM_QUEUE",
+)
+
+
+def queue_segmentation(xpath_csv: str) -> None:
+    """
+    Segment the scroll of `xpath_csv` in the background. Raises RuntimeError when
+    LLM_QUEUE scrolls are already waiting or running.
+    """
+    _QUEUE.submit(segment_csv, xpath_csv)
+
+
+def queue_site_segmentation(xpath_csvs: list) -> None:
+    """
+    Segment the new scrolls of one site in the background, one after the other, as a single
+    job. Raises RuntimeError when LLM_QUEUE jobs are already waiting or running.
+    """
+    _QUEUE.submit_site(segment_csv, xpath_csvs)
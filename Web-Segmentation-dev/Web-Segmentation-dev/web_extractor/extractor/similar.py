@@ -0,0 +1,599 @@
+"""
+Objective         -   "Elements like this one" across every ingested site: each captured element
+                      gets a hashed embedding after ingest, and api/similar/ returns the nearest
+                      ones (site, scroll, xpath, bbox) from an approximate nearest-neighbour
+                      index, e.g. every search box or cart button.
+
+                      Vectors hash what carries over between sites rather than the page layout:
+                      the tag, the parent / tag pair, words of the element's own attribute
+                      values in its xpath (id, class, ...), words of its text and, with a bbox,
+                      its shape. They are stored as float16 in an append-only file (vectors.f16)
+                      next to one coarse-list number per vector (assign.i32); where each came
+                      from lives in a SQLite table keyed by vector number. Re-ingesting a scroll
+                      deletes its rows there, so its old vectors are no longer returned; a
+                      build rewrites the store without them once they are COMPACT of it.
+
+                      Ingest requests only queue their scroll (`submit`): one background thread
+                      per process embeds and appends it, so requests neither embed nor wait for
+                      the store lock while they hold their scroll lock. A queued scroll older
+                      than the one already stored (recaptured meanwhile, e.g. through another
+                      worker) is dropped.
+
+                      Index (IVF): spherical k-means centroids and, for the vectors known when
+                      it was built, the live ones grouped by list (lists_*.npy, memory-mapped,
+                      float32 so queries convert nothing). A query scores the centroids, reads
+                      the NPROBE best lists contiguously and scans the vectors added since the
+                      build (the tail, held in memory) in full. A build is started in a
+                      background thread once the tail passes REBUILD_TAIL vectors; the
+                      centroids are retrained when the store has grown 4x since they were
+                      trained, otherwise the stored list numbers are only re-sorted.
+
+                      Several worker processes can share the store. Appends hold the lock of
+                      DIR. One build runs at a time (the .build.lock of DIR, taken without
+                      waiting): it decides whether to build and takes its snapshot under the
+                      DIR lock, writes its centroids, lists and (when compacting) store files
+                      under names of its own version, and publishes them by replacing the
+                      manifest row of the SQLite database, in the transaction that renumbers
+                      the rows of a compacted store. Readers load exactly the files named by
+                      the manifest they read and look rows up in the same read transaction,
+                      so a build lands for them in one step.
+
+Configuration (settings.EXTRACTOR_SIMILAR, all keys optional):
+    ENABLED         -   Embed the elements of ingested scrolls (default False).
+    DIR             -   Folder of the store (default ./Outputs/similar/).
+    DIM             -   Vector dimension; fixed once the store has vectors (default 128).
+    NPROBE          -   Lists read per query (default 16).
+    REBUILD_TAIL    -   Unindexed vectors that trigger a build (default 20000).
+    COMPACT         -   Share of dead vectors at which a build compacts the store (default 0.25).
+    QUEUE           -   Scrolls waiting to be embedded per process; more are dropped (default 256).
+
+Modules / Functions:
+    embed               -   Vectors of an element table.
+    submit              -   Queue index_scroll on the background thread.
+    index_scroll        -   Replace the stored elements of one scroll.
+    element_vector      -   Stored vector of one element.
+    query               -   Nearest stored elements to a vector.
+    build               -   Rebuild the index over the current store.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .segmentation.embedding import vectorize
+from .storage import atomic_path, scroll_lock
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    id INTEGER PRIMARY KEY,
+    site TEXT NOT NULL,
+    scroll_index INTEGER NOT NULL,
+    element_id TEXT NOT NULL,
+    xpath TEXT,
+    x REAL, y REAL, width REAL, height REAL,
+    captured REAL
+);
+CREATE INDEX IF NOT EXISTS vectors_scroll ON vectors (site, scroll_index);
+CREATE INDEX IF NOT EXISTS vectors_element ON vectors (site, scroll_index, element_id);
+CREATE TABLE IF NOT EXISTS manifest (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    body TEXT NOT NULL
+);
+"""
+
+VECTORS = "vectors.f16"
+ASSIGN = "assign.i32"
+BUILD_LOCK = ".build.lock"
+STORE_FILE_RE = re.compile(r"(centroids_\d+\.npy|lists_\d+_\w+\.npy|vectors(_\d+)?\.f16|assign(_\d+)?\.i32)$")
+
+BBOX_COLUMNS = ("x", "y", "width", "height")
+STEP_RE = re.compile(r"([^/\[]*)((?:\[[^\]]*\])*)/*$")
+ATTRIBUTE_RE = re.compile(r"""@[\w:-]+\s*=\s*["']([^"']*)["']""")
+SPLIT_RE = re.compile(r"[\W_]+")
+WORD_RE = re.compile(r"[^\W\d_]{2,}")
+
+_local = threading.local()
+_lock = threading.Lock()
+_state = {"version": None}
+_building = threading.Event()
+_queue = {"executor": None, "slots": None}
+logger = logging.getLogger(__name__)
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_SIMILAR", {}) or {}
+
+
+def enabled() -> bool:
+    return _config().get("ENABLED", False)
+
+
+def _dir() -> str:
+    return _config().get("DIR", "./Outputs/similar/")
+
+
+def _file(name: str) -> str:
+    return os.path.join(_dir(), name)
+
+
+def _dim() -> int:
+    return _config().get("DIM", 128)
+
+
+def _connection() -> sqlite3.Connection:
+    path = _file("meta.sqlite3")
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        os.makedirs(_dir(), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        connections[path] = conn
+    return conn
+
+
+# ------------------------------------- Embedding --------------------------------------
+def _features(xpaths, texts, boxes) -> pd.DataFrame:
+    rows, features, weights = [], [], []
+
+    def add(row, feature, weight):
+        rows.append(row)
+        features.append(feature)
+        weights.append(weight)
+
+    for row, (xpath, text) in enumerate(zip(xpaths, texts)):
+        last = STEP_RE.search(xpath)
+        tag, predicates = last.group(1).lower(), last.group(2)
+        parent = STEP_RE.search(xpath, 0, last.start()).group(1).lower()
+        add(row, "t:" + tag, 1.0)
+        add(row, "c:" + parent + ">" + tag, 0.5)
+        # Whole alphabetic tokens of id / class values; generated ids split into noise
+        words = [word for word in SPLIT_RE.split(" ".join(ATTRIBUTE_RE.findall(predicates)).lower())
+                 if WORD_RE.fullmatch(word)]
+        for word in set(words):
+            add(row, "a:" + word, 0.8 / math.sqrt(len(words)))
+        words = WORD_RE.findall(text.lower())[:20]
+        for word in set(words):
+            add(row, "w:" + word, 1.0 / math.sqrt(len(words)))
+    if boxes is not None:
+        width, height = boxes[:, 2], boxes[:, 3]
+        valid = np.flatnonzero((width > 0) & (height > 0))
+        aspect = np.round(np.log2(width[valid] / height[valid])).astype(int)
+        area = np.round(np.log2(width[valid] * height[valid]) / 2).astype(int)
+        for row, a, s in zip(valid.tolist(), aspect.tolist(), area.tolist()):
+            add(row, f"r:{a}", 0.3)
+            add(row, f"s:{s}", 0.3)
+    return pd.DataFrame({"row": rows, "feature": features, "weight": weights})
+
+
+def _boxes(table: pd.DataFrame):
+    if not all(col in table.columns for col in BBOX_COLUMNS):
+        return None
+    return table[list(BBOX_COLUMNS)].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+
+
+def embed(table: pd.DataFrame, xpaths=None, dim: int = None) -> np.ndarray:
+    """
+    (rows, dim) float32 unit vectors of an element table (xpath, optional text and
+    bbox columns); `xpaths` overrides the xpath column, as in search.index_scroll.
+    """
+    xpaths = (table["xpath"] if xpaths is None else pd.Series(xpaths)).fillna("").astype(str).tolist()
+    texts = (table["text"].fillna("").astype(str).tolist() if "text" in table.columns
+             else [""] * len(xpaths))
+    return vectorize(_features(xpaths, texts, _boxes(table)), len(xpaths), dim or _dim())
+
+
+# --------------------------------------- Store ----------------------------------------
+def _count(name: str, itemsize: int) -> int:
+    try:
+        return os.path.getsize(_file(name)) // itemsize
+    except FileNotFoundError:
+        return 0
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        out[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def _append(vectors: np.ndarray, manifest: dict) -> int:
+    """
+    Append vectors and their list numbers (from the centroids of `manifest`) to the
+    store files it names, under the store lock; returns the number of the first one.
+    """
+    dim = vectors.shape[1]
+    store, assign_file = manifest.get("vectors", VECTORS), manifest.get("assign", ASSIGN)
+    first = _count(store, 2 * dim)
+    centroids = _load_centroids(manifest)
+    assign = (_assign(vectors, centroids) if centroids is not None
+              else np.full(len(vectors), -1, dtype=np.int32))
+    # Whole records only, in case an earlier append was cut short
+    with open(_file(store), "ab") as f:
+        f.truncate(first * 2 * dim)
+        f.write(vectors.astype(np.float16).tobytes())
+    with open(_file(assign_file), "ab") as f:
+        f.truncate(first * 4)
+        f.write(assign.tobytes())
+    return first
+
+
+def index_scroll(site: str, scroll_index: int, table: pd.DataFrame, xpaths=None,
+                 captured: float = None) -> int:
+    """
+    Replace the stored elements of (site, scroll_index) by the rows of `table`; `xpaths`
+    overrides the table's xpath column (e.g. the original, uncleaned XPaths). With
+    `captured` (a time.time() of the ingest), nothing is stored when the scroll has
+    rows from a later capture. Returns the number of rows stored.
+    """
+    n = len(table)
+    vectors = embed(table, xpaths)
+    boxes = _boxes(table)
+    bbox = ([[None] * n] * 4 if boxes is None else
+            [[None if math.isnan(v) else v for v in boxes[:, i].tolist()] for i in range(4)])
+    xpaths = (table["xpath"] if xpaths is None else pd.Series(xpaths)).astype(str).tolist()
+
+    conn = _connection()
+    with scroll_lock(_dir()):
+        if captured is not None:
+            newest = conn.execute("SELECT max(captured) FROM vectors WHERE site = ? AND scroll_index = ?",
+                                  (site, scroll_index)).fetchone()[0]
+            if newest is not None and newest > captured:
+                return 0
+        manifest = _manifest(conn)
+        first = _append(vectors, manifest)
+        with conn:
+            conn.execute("DELETE FROM vectors WHERE site = ? AND scroll_index = ?", (site, scroll_index))
+            conn.executemany(
+                "INSERT INTO vectors (id, site, scroll_index, element_id, xpath, x, y, width, height, captured)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                zip(range(first, first + n), [site] * n, [scroll_index] * n,
+                    table["webElementId"].astype(str), xpaths, *bbox, [captured] * n)
+            )
+    if first + n - manifest.get("indexed", 0) >= _config().get("REBUILD_TAIL", 20000):
+        _build_async()
+    return n
+
+
+def submit(site: str, scroll_index: int, table: pd.DataFrame, xpaths=None) -> bool:
+    """
+    Queue index_scroll of a scroll for this process's background thread, stamped with
+    the current time; returns False (and logs a warning) when QUEUE scrolls are already
+    waiting.
+    """
+    if _queue["executor"] is None:
+        with _lock:
+            if _queue["executor"] is None:
+                _queue["slots"] = threading.BoundedSemaphore(_config().get("QUEUE", 256))
+                _queue["executor"] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="similar-index")
+    if not _queue["slots"].acquire(blocking=False):
+        logger.warning("Similar-element queue is full; scroll %s of %s not indexed", scroll_index, site)
+        return False
+    # The caller may go on changing its table; keep the columns embedding reads
+    columns = [col for col in ("webElementId", "xpath", "text", *BBOX_COLUMNS) if col in table.columns]
+    table = table[columns].copy()
+    xpaths = None if xpaths is None else list(xpaths)
+    future = _queue["executor"].submit(index_scroll, site, scroll_index, table, xpaths, time.time())
+    future.add_done_callback(_indexed)
+    return True
+
+
+def _indexed(future) -> None:
+    _queue["slots"].release()
+    error = future.exception()
+    if error is not None:
+        logger.error("Similar-element indexing failed", exc_info=error)
+
+
+def element_vector(site: str, scroll_index: int, element_id: str):
+    """
+    Stored vector (float32) and vector number of an element, or (None, None).
+    """
+    with _snapshot() as (conn, state):
+        row = conn.execute(
+            "SELECT id FROM vectors WHERE site = ? AND scroll_index = ? AND element_id = ?",
+            (site, scroll_index, str(element_id))
+        ).fetchone()
+        if row is None or row[0] >= state["n"]:
+            return None, None
+        return np.asarray(state["vectors"][row[0]], dtype=np.float32), row[0]
+
+
+# --------------------------------------- Index ----------------------------------------
+def _manifest(conn: sqlite3.Connection) -> dict:
+    row = conn.execute("SELECT body FROM manifest WHERE id = 0").fetchone()
+    return json.loads(row[0]) if row else {}
+
+
+def _load_centroids(manifest: dict):
+    return np.load(_file(manifest["centroids"])) if manifest.get("centroids") else None
+
+
+def _reader(manifest: dict) -> dict:
+    """
+    Memory maps of the store and of the index files named by `manifest`, reopened when
+    another manifest is published or the store grows.
+    """
+    global _state
+    version = manifest.get("version", 0)
+    store = manifest.get("vectors", VECTORS)
+    dim = _dim()
+    n = _count(store, 2 * dim)
+    state = _state
+    if state["version"] == version and state.get("n") == n and state.get("dir") == _dir():
+        return state
+    with _lock:
+        state = {"version": version, "n": n, "dir": _dir(), "indexed": manifest.get("indexed", 0),
+                 "centroids": None, "vectors": None}
+        if n:
+            state["vectors"] = np.memmap(_file(store), dtype=np.float16, mode="r", shape=(n, dim))
+        if manifest.get("centroids"):
+            state["centroids"] = _load_centroids(manifest)
+            for name, file in manifest["lists"].items():
+                state["list_" + name] = np.load(_file(file), mmap_mode="r")
+        state["tail"] = np.asarray(state["vectors"][state["indexed"]:], dtype=np.float32) if n else None
+        _state = state
+    return state
+
+
+@contextmanager
+def _snapshot():
+    """
+    The thread's connection inside a read transaction, and the reader state of the
+    manifest that transaction sees: vector numbers looked up through it match the
+    state even while a build renumbers a compacted store.
+    """
+    conn = _connection()
+    for attempt in range(3):
+        conn.execute("BEGIN")
+        try:
+            state = _reader(_manifest(conn))
+            break
+        except BaseException as e:
+            conn.rollback()
+            # A build published and removed the files of the manifest just read
+            if not isinstance(e, FileNotFoundError) or attempt == 2:
+                raise
+    try:
+        yield conn, state
+    finally:
+        conn.rollback()
+
+
+def _current() -> dict:
+    with _snapshot() as (_, state):
+        return state
+
+
+def _train(vectors, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means centroids (nlist, dim) from a sample of the store.
+    """
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(len(vectors), min(len(vectors), 64 * nlist), replace=False))
+    sample = np.asarray(vectors[sample], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        order = np.argsort(labels, kind="stable")
+        starts = np.searchsorted(labels[order], np.arange(nlist))
+        sizes = np.diff(np.append(starts, len(order)))
+        sums = np.zeros_like(centroids)
+        sums[sizes > 0] = np.add.reduceat(sample[order], starts[sizes > 0])
+        norm = np.linalg.norm(sums, axis=1, keepdims=True)
+        # An empty list keeps its centroid
+        centroids = np.where(norm > 0, sums / np.where(norm > 0, norm, 1), centroids)
+    return centroids.astype(np.float32)
+
+
+def _save(name: str, array: np.ndarray) -> str:
+    with atomic_path(_file(name)) as tmp:
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+    return name
+
+
+def _write_rows(vectors, rows: np.ndarray, name: str, chunk: int = 65536) -> str:
+    with open(_file(name), "wb") as f:
+        for begin in range(0, len(rows), chunk):
+            f.write(np.asarray(vectors[rows[begin:begin + chunk]]).tobytes())
+    return name
+
+
+def _renumber(conn: sqlite3.Connection, live: np.ndarray, n: int) -> None:
+    """
+    Give the rows of a compacted store their new vector numbers: the `live` ones below
+    `n` in order, then those appended since the snapshot.
+    """
+    old = np.fromiter((row[0] for row in conn.execute("SELECT id FROM vectors ORDER BY id")), dtype=np.int64)
+    new = np.where(old < n, np.searchsorted(live, old), len(live) + old - n)
+    changed = old != new
+    # Numbers only go down and keep their order, so ascending updates never collide
+    conn.executemany("UPDATE vectors SET id = ? WHERE id = ?",
+                     zip(new[changed].tolist(), old[changed].tolist()))
+
+
+def _remove_unused(manifest: dict) -> None:
+    # Files of earlier (or failed) builds; a file still mapped elsewhere may refuse
+    keep = {manifest.get("centroids"), manifest.get("vectors", VECTORS), manifest.get("assign", ASSIGN),
+            *manifest.get("lists", {}).values()}
+    for name in os.listdir(_dir()):
+        if STORE_FILE_RE.match(name) and name not in keep:
+            try:
+                os.remove(_file(name))
+            except OSError:
+                pass
+
+
+def build(force: bool = True):
+    """
+    Rebuild the index over the vectors stored so far (retraining the centroids when the
+    store has grown 4x, compacting it when COMPACT of it is dead) and publish it;
+    returns the number of live vectors indexed, or None when another build is running
+    or, with force=False, fewer than REBUILD_TAIL vectors are unindexed.
+    """
+    dim = _dim()
+    conn = _connection()
+    with scroll_lock(_dir(), BUILD_LOCK, blocking=False) as building:
+        if not building:
+            return None
+        with scroll_lock(_dir()):
+            manifest = _manifest(conn)
+            store, assign_file = manifest.get("vectors", VECTORS), manifest.get("assign", ASSIGN)
+            n = _count(store, 2 * dim)
+            if not n:
+                return 0
+            if not force and n - manifest.get("indexed", 0) < _config().get("REBUILD_TAIL", 20000):
+                return None
+            live = np.fromiter((row[0] for row in conn.execute(
+                "SELECT id FROM vectors WHERE id < ? ORDER BY id", (n,))), dtype=np.int64)
+        vectors = np.memmap(_file(store), dtype=np.float16, mode="r", shape=(n, dim))
+        assign = np.fromfile(_file(assign_file), dtype=np.int32, count=n)
+
+        centroids = _load_centroids(manifest)
+        retrain = centroids is None or n >= 4 * manifest.get("trained", 0)
+        if retrain:
+            nlist = int(np.clip(math.sqrt(n), 1, 4096))
+            centroids = _train(vectors, min(nlist, n))
+            assign = _assign(vectors, centroids)
+        elif (assign < 0).any():
+            missing = np.flatnonzero(assign < 0)
+            assign[missing] = _assign(vectors[missing], centroids)
+
+        version = manifest.get("version", 0) + 1
+        dead = n - len(live)
+        compact = dead > 0 and dead >= _config().get("COMPACT", 0.25) * n
+        order = np.argsort(assign[live], kind="stable")
+        offsets = np.searchsorted(assign[live][order], np.arange(len(centroids) + 1)).astype(np.int64)
+        published = {
+            "version": version,
+            # In a compacted store the live vectors are numbered 0..len(live)-1
+            "indexed": len(live) if compact else n,
+            "nlist": len(centroids),
+            "trained": n if retrain else manifest["trained"],
+            "centroids": _save(f"centroids_{version}.npy", centroids) if retrain else manifest["centroids"],
+            "vectors": _write_rows(vectors, live, f"vectors_{version}.f16") if compact else store,
+            "assign": f"assign_{version}.i32" if compact else assign_file,
+            "lists": {
+                "offsets": _save(f"lists_{version}_offsets.npy", offsets),
+                "ids": _save(f"lists_{version}_ids.npy", order if compact else live[order]),
+                "vectors": _save(f"lists_{version}_vectors.npy",
+                                 np.asarray(vectors[live[order]], dtype=np.float32)),
+            },
+        }
+
+        with scroll_lock(_dir()):
+            if retrain or compact:
+                # Vectors appended during the build were assigned with the old centroids
+                total = _count(store, 2 * dim)
+                added = np.memmap(_file(store), dtype=np.float16, mode="r", shape=(total, dim))[n:total]
+                added_assign = (_assign(added, centroids) if retrain
+                                else np.fromfile(_file(assign_file), dtype=np.int32, count=total)[n:])
+            if compact:
+                with open(_file(published["vectors"]), "ab") as f:
+                    f.write(np.asarray(added).tobytes())
+                np.concatenate([assign[live], added_assign]).tofile(_file(published["assign"]))
+            elif retrain:
+                with atomic_path(_file(assign_file)) as tmp:
+                    np.concatenate([assign, added_assign]).tofile(tmp)
+            with conn:
+                if compact:
+                    _renumber(conn, live, n)
+                conn.execute("INSERT OR REPLACE INTO manifest (id, body) VALUES (0, ?)",
+                             (json.dumps(published),))
+        _remove_unused(published)
+    return len(live)
+
+
+def _build_async() -> None:
+    if _building.is_set():
+        return
+    _building.set()
+
+    def run():
+        try:
+            build(force=False)
+        except Exception:
+            logger.exception("Similar-element index build failed")
+        finally:
+            _building.clear()
+
+    threading.Thread(target=run, daemon=True, name="similar-build").start()
+
+
+def query(vector: np.ndarray, k: int = 10, site: str = None, exclude: int = None,
+          nprobe: int = None) -> list:
+    """
+    Up to `k` stored elements nearest to `vector` (cosine), best first, as dicts with
+    site, scroll_index, webElementId, xpath, bbox (or None) and score; `site` keeps one
+    site's matches among the best 32 * k, `exclude` drops one vector number (the query
+    element).
+    """
+    with _snapshot() as (conn, state):
+        return _query(conn, state, vector, k, site, exclude, nprobe)
+
+
+def _query(conn, state, vector, k, site, exclude, nprobe) -> list:
+    if not state["n"]:
+        return []
+    vector = np.asarray(vector, dtype=np.float32)
+    ids, scores = [], []
+    if state["centroids"] is not None:
+        nprobe = min(nprobe or _config().get("NPROBE", 16), len(state["centroids"]))
+        lists = np.argpartition(-(state["centroids"] @ vector), nprobe - 1)[:nprobe]
+        offsets = state["list_offsets"]
+        for i in lists.tolist():
+            start, stop = int(offsets[i]), int(offsets[i + 1])
+            if stop > start:
+                ids.append(np.asarray(state["list_ids"][start:stop]))
+                scores.append(state["list_vectors"][start:stop] @ vector)
+    indexed = state["indexed"]
+    if indexed < state["n"]:
+        ids.append(np.arange(indexed, state["n"]))
+        scores.append(state["tail"] @ vector)
+    if not ids:
+        return []
+    ids, scores = np.concatenate(ids), np.concatenate(scores)
+
+    # Dead (re-ingested) vectors in the tail and other sites are dropped after the lookup
+    wanted = min(len(ids), (4 if site is None else 32) * k + 1)
+    top = np.argpartition(-scores, wanted - 1)[:wanted] if wanted < len(ids) else np.arange(len(ids))
+    top = top[np.argsort(-scores[top])]
+    score_of = dict(zip(ids[top].tolist(), scores[top].tolist()))
+    score_of.pop(exclude, None)
+    sql = ("SELECT id, site, scroll_index, element_id, xpath, x, y, width, height FROM vectors"
+           f" WHERE id IN ({','.join('?' * len(score_of))})")
+    args = list(score_of)
+    if site is not None:
+        sql += " AND site = ?"
+        args.append(site)
+    rows = conn.execute(sql, args).fetchall() if score_of else []
+    rows.sort(key=lambda row: -score_of[row[0]])
+    return [{
+        "site": site_,
+        "scroll_index": scroll,
+        "webElementId": element_id,
+        "xpath": xpath,
+        "bbox": None if x is None else {"x": x, "y": y, "width": w, "height": h},
+        # float16 storage can put a cosine slightly above 1
+        "score": round(min(score_of[id_], 1.0), 6),
+    } for id_, site_, scroll, element_id, xpath, x, y, w, h in rows[:k]]
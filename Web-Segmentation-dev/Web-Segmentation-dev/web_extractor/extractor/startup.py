@@ -0,0 +1,126 @@
+"""
+Objective         -   Keep worker boot and manage.py commands cheap. Importing the URLconf (which
+                      `manage.py check`, every command that runs system checks and every
+                      worker does at start) used to import pandas, numpy, PIL and every
+                      index and segmentation module through extractor/views.py. The views
+                      now hold lazy stand-ins for those modules that import the real module
+                      on first attribute access, i.e. on the first request that needs it.
+
+                      Workers that should not pay those imports on their first request can
+                      warm up when the WSGI / ASGI application is created: synchronously, or
+                      on a background thread so the worker starts accepting requests at once
+                      (a request that needs a module still being imported waits for it).
+
+Configuration (settings.EXTRACTOR_STARTUP, all keys optional):
+    WARM_UP     -   Import the lazily loaded modules when the application is created (default
+                    False).
+    BACKGROUND  -   Warm up on a daemon thread instead of before serving (default True).
+
+Modules / Functions:
+    LazyModule      -   Module stand-in that imports the real module on first attribute access.
+    lazy_import     -   LazyModule of a module name (the module itself if already imported).
+    warm_up         -   Import every module handed out by lazy_import, and run warm-up callbacks.
+    on_warm_up      -   Register a callback for warm_up (e.g. resolving the segmenter).
+    maybe_warm_up   -   warm_up as configured; called from wsgi.py and asgi.py.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import importlib
+import importlib.util
+import logging
+import sys
+import threading
+import time
+import types
+
+from django.conf import settings
+
+
+_LAZY = {}
+_CALLBACKS = []
+logger = logging.getLogger(__name__)
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_STARTUP", {}) or {}
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for the module `name`. The first attribute read imports it (through the
+    regular import system, so concurrent first reads import it once) and every read
+    is forwarded to it.
+    """
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._module = None
+
+    def _load(self) -> types.ModuleType:
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name: str, package: str = None):
+    """
+    Module `name` (relative names resolved against `package`, as importlib.import_module
+    does), imported on first use. Already imported modules are returned as they are.
+    """
+    name = importlib.util.resolve_name(name, package) if name.startswith(".") else name
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return _LAZY.setdefault(name, LazyModule(name))
+
+
+def on_warm_up(callback):
+    """
+    Register `callback()` to run at the end of warm_up; returns it (usable as a decorator).
+    """
+    _CALLBACKS.append(callback)
+    return callback
+
+
+def warm_up() -> float:
+    """
+    Import every module handed out by lazy_import so far and run the registered
+    callbacks; returns the seconds spent.
+    """
+    started = time.perf_counter()
+    for module in list(_LAZY.values()):
+        module._load()
+    for callback in _CALLBACKS:
+        callback()
+    return time.perf_counter() - started
+
+
+def maybe_warm_up() -> None:
+    """
+    Warm up if settings.EXTRACTOR_STARTUP asks for it. The URLconf is imported first,
+    since that is where the views hand out their lazy modules.
+    """
+    config = _config()
+    if not config.get("WARM_UP", False):
+        return
+
+    def run():
+        try:
+            importlib.import_module(settings.ROOT_URLCONF)
+            logger.info("Extractor warm-up done in %.2fs", warm_up())
+        except Exception:
+            logger.exception("Extractor warm-up failed")
+
+    if config.get("BACKGROUND", True):
+        threading.Thread(target=run, name="extractor-warm-up", daemon=True).start()
+    else:
+        run()
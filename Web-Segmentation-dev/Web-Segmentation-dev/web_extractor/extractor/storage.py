@@ -0,0 +1,168 @@
+"""
+Objective         -   Make scroll batch writes safe when several worker processes ingest batches
+                      for the same site and scroll index at once.
+
+                      Every (site, scroll_index) folder has a `.lock` file; holding an exclusive
+                      OS-level lock on it serializes the "initial vs modification" decision and
+                      all writes for that scroll across processes and threads. Artifacts are
+                      written to a temporary file in the same folder and renamed into place, so
+                      readers never observe a half-written CSV or PNG.
+
+Modules / Functions:
+    scroll_lock         -   Context manager holding the exclusive lock of a scroll folder.
+    atomic_path         -   Context manager yielding a temp path that is renamed onto the target.
+    write_csv_atomic    -   DataFrame (or ElementBatch) to_csv through atomic_path.
+    save_image_atomic   -   PIL Image.save through atomic_path.
+    unique_path         -   First non-existing variant of a path (`name`, `name_1`, ...).
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+LOCK_FILENAME = ".lock"
+
+# Files from mkstemp are owner-only; atomic_path gives them the mode open() would,
+# worked out on first use (see _file_mode).
+_FILE_MODE = None
+_FILE_MODE_LOCK = threading.Lock()
+
+
+@contextmanager
+def scroll_lock(scroll_folder: str, name: str = LOCK_FILENAME, blocking: bool = True):
+    """
+    Hold an exclusive, cross-process lock on `scroll_folder` (its `name` lock file) for
+    the duration of the block. The lock is released automatically if the holding
+    process dies. With blocking=False the block runs at once and the context value
+    says whether the lock was taken (False: another process or thread holds it).
+    """
+    os.makedirs(scroll_folder, exist_ok=True)
+    fd = os.open(os.path.join(scroll_folder, name), os.O_RDWR | os.O_CREAT, 0o644)
+    acquired = False
+    try:
+        if blocking:
+            with metrics.stage("lock_wait"):
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                else:
+                    _lock_windows(fd)
+            acquired = True
+        else:
+            acquired = _try_lock(fd)
+        yield acquired
+    finally:
+        try:
+            if acquired and fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            elif acquired:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+
+def _file_mode() -> int:
+    """
+    Mode of a new file under the process umask. The umask is read from
+    /proc/self/status where there is one: os.umask can only be read by setting it,
+    which briefly changes it for every thread, so that is done at most once.
+    """
+    global _FILE_MODE
+    if _FILE_MODE is None:
+        with _FILE_MODE_LOCK:
+            if _FILE_MODE is None:
+                umask = None
+                try:
+                    with open("/proc/self/status", encoding="ascii") as f:
+                        umask = next((int(line.split()[1], 8) for line in f
+                                      if line.startswith("Umask:")), None)
+                except OSError:
+                    pass
+                if umask is None:
+                    umask = os.umask(0)
+                    os.umask(umask)
+                _FILE_MODE = 0o666 & ~umask
+    return _FILE_MODE
+
+
+@contextmanager
+def atomic_path(path: str):
+    """
+    Yield a temporary path next to `path`; on success it replaces `path` atomically,
+    on failure it is removed and `path` is left untouched. The file gets the mode a
+    plain open() would give it (mkstemp creates it owner-only).
+    """
+    folder, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=folder or ".")
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.chmod(tmp_path, _file_mode())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_csv_atomic(df, path: str, **kwargs) -> str:
+    kwargs.setdefault("index", False)
+    kwargs.setdefault("encoding", "utf-8")
+    with atomic_path(path) as tmp_path:
+        df.to_csv(tmp_path, **kwargs)
+    return path
+
+
+def save_image_atomic(img, path: str, format: str = "PNG") -> str:
+    # The temp file has a .tmp suffix, so the format cannot be inferred from the name
+    with atomic_path(path) as tmp_path:
+        img.save(tmp_path, format=format)
+    return path
+
+
+def unique_path(path: str) -> str:
+    """
+    Return `path` if it does not exist, else the first free `stem_<n>.ext` variant.
+    Only meaningful while the scroll lock is held.
+    """
+    if not os.path.exists(path):
+        return path
+    stem, ext = os.path.splitext(path)
+    n = 1
+    while os.path.exists(f"{stem}_{n}{ext}"):
+        n += 1
+    return f"{stem}_{n}{ext}"
+
+
+def _try_lock(fd) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _lock_windows(fd):
+    # LK_LOCK retries for ~10 seconds before raising; keep waiting like flock does
+    os.lseek(fd, 0, os.SEEK_SET)
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
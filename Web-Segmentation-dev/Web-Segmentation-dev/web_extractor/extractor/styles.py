@@ -0,0 +1,248 @@
+"""
+Objective         -   Dictionary-encoded computed styles for the Selenium capture paths
+                      (views1.py, views-only-till-body.py, custom.py): instead of free strings
+                      per element (background-color, font-size, ... repeat across most of a
+                      page), each element gets an integer style id into a per-site table of
+                      distinct styles, so element tables shrink and "same style" is an
+                      integer comparison.
+
+                      Capture is one script call per page: the browser reads the configured
+                      properties of every element with getComputedStyle and already returns
+                      the page's distinct styles plus one local id per element, instead of one
+                      WebDriver round trip per property and element. The page's styles are
+                      then resolved to site-wide ids. The site table lives in memory as a
+                      dict and on disk as `Outputs/<site>/styles.jsonl`; new styles are
+                      appended under the site folder's lock and other processes pick them up
+                      by reading the file from their last offset (as identity.py does).
+
+                      The Selenium views load posted HTML from a data: URL, so the site is
+                      the request's `website` field, else the host of the page's canonical
+                      link / og:url / <base>. When neither is known the page's ids come from
+                      a table of that page alone rather than from a table shared by every
+                      unnamed capture.
+
+Configuration (settings.EXTRACTOR_STYLES, all keys optional):
+    ENCODE      -   Store a style_id column instead of the property strings (default True).
+    PROPERTIES  -   Computed properties to capture (default background-color, font-size,
+                    font-style, color).
+
+Modules / Functions:
+    StyleTable          -   Style -> id map of one site (or of one run, without a file).
+    capture             -   Distinct computed styles of a page's elements and a local id per element.
+    encode              -   Site-wide ids of styles, registering new ones.
+    decode              -   Property columns of style ids.
+    site_folder         -   Output folder of a website (as views.clean_site names it).
+    page_website        -   Host a page declares for itself (canonical link, og:url, base).
+    style_columns       -   Style columns of a Selenium view's element rows.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import json
+import os
+import re
+import threading
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .storage import scroll_lock
+
+
+INDEX_FILE = "styles.jsonl"
+OUTPUT_DIR = "./Outputs/"
+DEFAULT_PROPERTIES = ("background-color", "font-size", "font-style", "color")
+# Column names the Selenium views used for the properties before encoding
+LEGACY_COLUMNS = {"color": "font-color"}
+
+# Styles are deduplicated in the page, so only distinct ones cross the WebDriver connection
+CAPTURE_SCRIPT = """
+const [elements, properties] = arguments;
+const index = new Map(), styles = [], ids = [];
+for (const element of elements) {
+    const computed = window.getComputedStyle(element);
+    const values = properties.map(p => computed.getPropertyValue(p));
+    const key = values.join("\\u0000");
+    let id = index.get(key);
+    if (id === undefined) {
+        id = styles.length;
+        index.set(key, id);
+        styles.push(values);
+    }
+    ids.push(id);
+}
+return [styles, ids];
+"""
+
+# Pages posted as HTML are loaded from a data: URL; these name the page they were saved from
+PAGE_URL_SCRIPT = """
+const found = document.querySelector(
+    "link[rel~='canonical'][href], meta[property='og:url'][content], base[href]");
+if (found) return found.getAttribute("href") || found.getAttribute("content");
+return window.location.href;
+"""
+
+_TABLES = {}
+_TABLES_LOCK = threading.Lock()
+
+
+def _config():
+    return getattr(settings, "EXTRACTOR_STYLES", {}) or {}
+
+
+def encode_enabled() -> bool:
+    return _config().get("ENCODE", True)
+
+
+def properties() -> tuple:
+    return tuple(_config().get("PROPERTIES", DEFAULT_PROPERTIES))
+
+
+def _key(style: dict) -> str:
+    return json.dumps(style, sort_keys=True, separators=(",", ":"))
+
+
+class StyleTable:
+    """
+    In-memory view of a site's styles.jsonl (`path` None keeps the table in memory
+    only). With a file, refresh() and register() must run with the site folder's lock
+    held.
+    """
+    __slots__ = ("path", "ids", "styles", "offset")
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.ids = {}
+        self.styles = []
+        self.offset = 0
+
+    def refresh(self) -> None:
+        # Entries appended by other processes since the last read
+        if self.path is None or not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                entry = json.loads(line)
+                self.ids[_key(entry["style"])] = entry["id"]
+                self.styles.append(entry["style"])
+            self.offset = f.tell()
+
+    def lookup(self, styles: list) -> list:
+        """
+        Id of each style ({property: value}), None for styles not registered yet.
+        """
+        return [self.ids.get(_key(style)) for style in styles]
+
+    def register(self, styles: list) -> list:
+        """
+        Id of each style, registering unknown ones.
+        """
+        resolved = []
+        new_lines = []
+        for style in styles:
+            key = _key(style)
+            found = self.ids.get(key)
+            if found is None:
+                found = self.ids[key] = len(self.styles)
+                self.styles.append(style)
+                new_lines.append(json.dumps({"id": found, "style": style}, separators=(",", ":")))
+            resolved.append(found)
+        if new_lines and self.path is not None:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(new_lines) + "\n")
+                f.flush()
+                self.offset = f.tell()
+        return resolved
+
+    def frame(self) -> pd.DataFrame:
+        """
+        The table as style_id plus one column per property.
+        """
+        table = pd.DataFrame(self.styles)
+        table.insert(0, "style_id", range(len(self.styles)))
+        return table
+
+
+def _table(site_folder: str) -> StyleTable:
+    path = os.path.join(site_folder, INDEX_FILE)
+    with _TABLES_LOCK:
+        table = _TABLES.get(path)
+        if table is None or (table.offset and not os.path.exists(path)):
+            table = _TABLES[path] = StyleTable(path)
+        return table
+
+
+def capture(driver, elements: list, properties: tuple = None):
+    """
+    (styles, ids): the distinct computed styles of `elements` as {property: value}
+    dicts, and for each element the index of its style in that list. One script call.
+    """
+    properties = list(properties or DEFAULT_PROPERTIES)
+    if not elements:
+        return [], []
+    values, ids = driver.execute_script(CAPTURE_SCRIPT, list(elements), properties)
+    return [dict(zip(properties, row)) for row in values], ids
+
+
+def encode(site_folder: str, styles: list) -> list:
+    """
+    Site-wide style id of each style; the site folder is only locked when some are new.
+    """
+    table = _table(site_folder)
+    resolved = table.lookup(styles)
+    if None in resolved:
+        os.makedirs(site_folder, exist_ok=True)
+        with scroll_lock(site_folder):
+            table.refresh()
+            resolved = table.register(styles)
+    return resolved
+
+
+def decode(site_folder: str, ids) -> pd.DataFrame:
+    """
+    One column per property, one row per style id (NaN for unknown ids).
+    """
+    table = _table(site_folder)
+    ids = pd.Series(ids)
+    if ids.max() >= len(table.styles):
+        with scroll_lock(site_folder):
+            table.refresh()
+    return table.frame().set_index("style_id").reindex(ids.to_numpy()).reset_index(drop=True)
+
+
+def site_folder(website: str) -> str:
+    return os.path.join(OUTPUT_DIR, re.sub(r"[^\w\-]", "_", website.replace("www.", "")))
+
+
+def page_website(driver):
+    """
+    Host named by the loaded page's canonical link, og:url or <base>, else by its own
+    http(s) URL; None when there is none.
+    """
+    try:
+        url = urlparse(driver.execute_script(PAGE_URL_SCRIPT) or "")
+    except ValueError:
+        return None
+    return url.hostname if url.scheme in ("http", "https") else None
+
+
+def style_columns(driver, elements: list, website: str = None, missing: str = "") -> pd.DataFrame:
+    """
+    Style columns for the rows of `elements`: style_id into the site's table when
+    encoding (into a table of this page only when `website` is None), otherwise the
+    property strings (empty ones replaced by `missing`) under the views' former column
+    names.
+    """
+    names = properties()
+    distinct, local = capture(driver, elements, names)
+    if encode_enabled():
+        ids = (encode(site_folder(website), distinct) if website
+               else StyleTable().register(distinct))
+        ids = np.asarray(ids, dtype=np.int32)
+        return pd.DataFrame({"style_id": ids[np.asarray(local, dtype=np.int64)]})
+    frame = pd.DataFrame(distinct, columns=list(names)).iloc[local].reset_index(drop=True)
+    if missing:
+        frame = frame.replace("", missing)
+    return frame.rename(columns=LEGACY_COLUMNS)
@@ -1,3 +1,800 @@
-from django.test import TestCase
+"""
+Objective         -   Behaviour tests of the extractor app, run offline: model-backed paths
+                      talk to the local fake model (benchmarks/fake_model.py), and the views
+                      write to a relative ./Outputs/, so every test runs in its own scratch
+                      directory.
 
-# Create your tests here.
+Usage (from web_extractor/):
+    python manage.py test extractor
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import asyncio
+import base64
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+
+from benchmarks.fake_model import fake_segments, serve
+from benchmarks.llm_windows import agreement
+from benchmarks.synthetic import element_payload, generate_page
+
+from . import batch, metrics, similar
+from .profiling import profile_ingest
+from .segmentation import fusion, jobs, prompt, visual, windows
+from .storage import scroll_lock, write_csv_atomic
+from .xpath_tree import XPathTree, split_steps
+
+
+def _elements(scroll_index: int, count: int = 5, text: str = "t") -> list:
+    return [{"webElementId": i, "xpath": f"/html/body/div[{i}]", "text": f"{text}{i}",
+             "scrollIndex": scroll_index} for i in range(1, count + 1)]
+
+
+def _png(width: int, height: int) -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+class ScratchOutputsTestCase(TestCase):
+    """
+    Runs each test in an empty scratch directory, with the replay cache cleared.
+    """
+
+    def setUp(self):
+        cwd = os.getcwd()
+        folder = tempfile.mkdtemp(prefix="extractor-test-")
+        os.chdir(folder)
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        self.addCleanup(os.chdir, cwd)
+        caches["extractor"].clear()
+
+    def post(self, path: str, body: dict, **extra):
+        return self.client.post(path, json.dumps(body), content_type="application/json", **extra)
+
+    def ingest(self, website: str, scroll_index: int, elements: list, **extra):
+        response = self.post("/api/extract/", {"website": website, "scroll_index": scroll_index,
+                                               "elements": elements, **extra})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    @staticmethod
+    def scroll_files(site: str, scroll_index: int, prefix: str) -> list:
+        folder = os.path.join("Outputs", site, f"scroll_{scroll_index}")
+        return sorted(name for name in os.listdir(folder) if name.startswith(prefix))
+
+
+class WindowedSegmentationTests(ScratchOutputsTestCase):
+    """
+    windows.py against the fake model, which puts every element in the segment of its
+    xpath cut to 4 steps.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = serve()
+        cls.addClassCleanup(cls.server.shutdown)
+        url = f"http://127.0.0.1:{cls.server.server_port}/v1/chat/completions"
+        cls.enterClassContext(override_settings(
+            EXTRACTOR_SEGMENTATION={**settings.EXTRACTOR_SEGMENTATION, "LLM_URL": url}))
+        cls.table = pd.DataFrame(element_payload(generate_page(nodes=601, seed=600)))
+        cls.reference = pd.factorize(fake_segments(cls.table["xpath"]))[0]
+
+    def test_single_window_matches_the_model(self):
+        self.assertEqual(len(windows.plan_windows(self.table, budget=10 ** 6)), 1)
+        result = asyncio.run(windows.segment(self.table, budget=10 ** 6))
+        self.assertEqual(result["webElementId"].tolist(), self.table["webElementId"].tolist())
+        np.testing.assert_array_equal(pd.factorize(result["segmentId"])[0], self.reference)
+
+    def test_windows_are_stitched_into_the_models_segments(self):
+        spans = windows.plan_windows(self.table, budget=1500)
+        self.assertGreater(len(spans), 5)
+        requests = self.server.RequestHandlerClass.requests
+        result = asyncio.run(windows.segment(self.table, budget=1500, concurrency=4))
+
+        self.assertEqual(self.server.RequestHandlerClass.requests - requests, len(spans))
+        labels = result["segmentId"].to_numpy()
+        self.assertEqual(labels.min(), 1)
+        self.assertEqual(agreement(labels, self.reference), 1.0)
+        # No stitched segment spans two of the model's segments
+        pairs = pd.DataFrame({"got": labels, "expected": self.reference}).drop_duplicates()
+        self.assertFalse(pairs["got"].duplicated().any())
+
+    def test_segment_csv_writes_the_scroll_segmentation(self):
+        folder = os.path.join("Outputs", "w_com", "scroll_0")
+        os.makedirs(folder)
+        xpath_csv = os.path.join(folder, "xpath_w_com_0.csv")
+        self.table.to_csv(xpath_csv, index=False)
+
+        output = windows.segment_csv(xpath_csv)
+        self.assertEqual(output, os.path.join(folder, "xpath_w_com_0_segmented.csv"))
+        written = pd.read_csv(output)
+        self.assertEqual(written.columns.tolist(), ["webElementId", "segmentId"])
+        self.assertEqual(written["webElementId"].tolist(), self.table["webElementId"].tolist())
+        self.assertEqual(agreement(written["segmentId"].to_numpy(), self.reference), 1.0)
+
+
+class StitchTests(TestCase):
+    def test_overlap_majority_links_segments(self):
+        # Rows 4-5 are segment 1 of the first window and segment 0 of the second
+        labels = windows.stitch([(0, 6), (4, 10)], [np.array([0, 0, 0, 1, 1, 1]),
+                                                    np.array([0, 0, 1, 1, 1, 1])])
+        self.assertEqual(labels.tolist(), [0, 0, 0, 1, 1, 1, 2, 2, 2, 2])
+
+    def test_split_overlap_is_not_linked(self):
+        # The windows disagree on rows 4-5; row 5 is nearer the second window's middle
+        labels = windows.stitch([(0, 6), (4, 10)], [np.array([0, 0, 0, 1, 1, 1]),
+                                                    np.array([0, 1, 1, 1, 1, 1])])
+        self.assertEqual(labels.tolist(), [0, 0, 0, 1, 1, 2, 2, 2, 2, 2])
+
+
+class FusionTests(TestCase):
+    STRUCTURAL = [0, 0, 0, 0, 1, 1, 1, 1]
+    VISUAL = [0, 0, 1, 1, 1, 1, 2, 2]
+
+    def test_agreement_of_both_sources(self):
+        fused = fusion.fuse_labels([self.STRUCTURAL, self.VISUAL], [1.0, 1.0], 2.0)
+        self.assertEqual(fused.tolist(), [0, 0, 1, 1, 2, 2, 3, 3])
+
+    def test_union_of_both_sources(self):
+        fused = fusion.fuse_labels([self.STRUCTURAL, self.VISUAL], [1.0, 1.0], 1.0)
+        self.assertEqual(fused.tolist(), [0] * 8)
+
+    def test_heavier_source_decides_alone(self):
+        fused = fusion.fuse_labels([self.STRUCTURAL, self.VISUAL], [2.0, 1.0], 2.0)
+        self.assertEqual(fused.tolist(), self.STRUCTURAL)
+
+    def test_non_adjacent_members_are_connected(self):
+        # Segment 5 is split by other rows; its members still end up together
+        fused = fusion.fuse_labels([[5, 1, 5, 2, 5], [0, 1, 0, 2, 0]], [1.0, 1.0], 2.0)
+        self.assertEqual(fused.tolist(), [0, 1, 0, 2, 0])
+        self.assertEqual(fusion.fuse_labels([[], []], [1.0, 1.0], 2.0).tolist(), [])
+
+
+class SearchTests(ScratchOutputsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(self.settings(EXTRACTOR_SEARCH={"ENABLED": True,
+                                                          "DB": os.path.abspath("search.sqlite3")}))
+
+    def search(self, **params):
+        response = self.client.get("/api/search/", params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_best_match_first(self):
+        self.ingest("s.com", 0, [
+            {"webElementId": 1, "xpath": "/html/body/p[1]",
+             "text": "Free shipping on every order, see the cart page for details"},
+            {"webElementId": 2, "xpath": "/html/body/button[1]", "text": "Add to cart"},
+            {"webElementId": 3, "xpath": "/html/body/p[2]", "text": "Nothing here"},
+        ])
+        results = self.search(q="cart")["results"]
+        self.assertEqual([r["webElementId"] for r in results], ["2", "1"])
+        self.assertEqual(results[0]["xpath"], "/html/body/button[1]")
+        self.assertEqual([r["webElementId"] for r in self.search(q="ad", prefix=1)["results"]], ["2"])
+        self.assertEqual(self.client.get("/api/search/", {"q": "  "}).status_code, 400)
+
+    def test_site_and_scroll_scope(self):
+        for website in ("s.com", "t.com"):
+            for scroll_index in (0, 1):
+                self.ingest(website, scroll_index, _elements(scroll_index, count=2, text="cart "))
+        self.assertEqual(self.search(q="cart")["count"], 8)
+        results = self.search(q="cart", website="t.com", scroll_index=1)["results"]
+        self.assertEqual({(r["site"], r["scroll_index"]) for r in results}, {("t_com", 1)})
+        self.assertEqual(len(results), 2)
+
+    def test_pages(self):
+        self.ingest("s.com", 0, _elements(0, count=5, text="cart "))
+        pages = [self.search(q="cart", page=page, page_size=2) for page in (1, 2, 3)]
+        self.assertEqual([page["count"] for page in pages], [2, 2, 1])
+        self.assertEqual([page["next_page"] for page in pages], [2, 3, None])
+        ids = [r["webElementId"] for page in pages for r in page["results"]]
+        self.assertEqual(sorted(ids), ["1", "2", "3", "4", "5"])
+
+
+class SimilarTests(ScratchOutputsTestCase):
+    @staticmethod
+    def page(scroll_index: int, label: str = "cart") -> list:
+        controls = [("form[1]/input[@class='search-box']", "search"),
+                    (f"div[2]/button[@class='{label}-button']", f"add to {label}"),
+                    ("nav[1]/a[1]", "home"), ("footer[1]/p[1]", "contact us")]
+        return [{"webElementId": i, "xpath": f"/html/body/{xpath}", "text": text,
+                 "scrollIndex": scroll_index} for i, (xpath, text) in enumerate(controls, 1)]
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(self.settings(EXTRACTOR_SIMILAR={"ENABLED": True,
+                                                           "DIR": os.path.abspath("similar")}))
+
+    def ingest_indexed(self, website: str, scroll_index: int, elements: list):
+        self.ingest(website, scroll_index, elements)
+        # Indexing runs on one background thread; wait for everything queued so far
+        similar._queue["executor"].submit(lambda: None).result()
+
+    def similar(self, **params):
+        response = self.client.get("/api/similar/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["results"]
+
+    def test_by_element_and_by_text(self):
+        self.ingest_indexed("a.com", 0, self.page(0))
+        self.ingest_indexed("b.com", 0, self.page(0))
+        results = self.similar(website="a.com", scroll_index=0, webElementId=2, k=1)
+        self.assertEqual([(r["site"], r["webElementId"]) for r in results], [("b_com", "2")])
+        self.assertLessEqual(results[0]["score"], 1.0)
+
+        results = self.similar(text="add to cart", k=3, in_site="a.com")
+        self.assertEqual(results[0]["webElementId"], "2")
+        self.assertEqual({r["site"] for r in results}, {"a_com"})
+        self.assertEqual(self.client.get("/api/similar/", {"webElementId": 2}).status_code, 400)
+
+    def test_rebuild_after_compaction(self):
+        self.ingest_indexed("a.com", 0, self.page(0))
+        self.assertEqual(similar.build(), 4)
+        self.ingest_indexed("a.com", 0, self.page(0, label="basket"))
+        # Half of the store is the replaced batch, so the build compacts it
+        self.assertEqual(similar.build(), 4)
+        self.assertEqual(similar._current()["n"], 4)
+
+        results = self.similar(text="add to basket", k=4)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0]["xpath"], "/html/body/div[2]/button[@class='basket-button']")
+        by_id = self.similar(website="a.com", scroll_index=0, webElementId=1, k=4)
+        self.assertNotIn("1", [r["webElementId"] for r in by_id])
+
+
+@override_settings(EXTRACTOR_GROUNDING={"REFRESH": 0})
+class GroundTests(ScratchOutputsTestCase):
+    @staticmethod
+    def element(element_id: int, xpath: str, text: str, box: tuple) -> dict:
+        return {"webElementId": element_id, "xpath": xpath, "text": text,
+                **dict(zip(("x", "y", "width", "height"), box))}
+
+    def ground(self, **params):
+        response = self.client.get("/api/ground/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["results"]
+
+    def test_point_lookup_innermost_first(self):
+        self.ingest("g1.com", 0, [
+            self.element(1, "/html/body/div[1]", "panel", (0, 0, 500, 500)),
+            self.element(2, "/html/body/div[1]/button[1]", "buy now", (10, 10, 80, 20)),
+            self.element(3, "/html/body/div[1]/p[1]", "details", (10, 100, 300, 40)),
+        ])
+        results = self.ground(website="g1.com", x=20, y=15)
+        self.assertEqual([r["webElementId"] for r in results], ["2", "1"])
+        self.assertEqual(results[0]["bbox"], {"x": 10.0, "y": 10.0, "width": 80.0, "height": 20.0})
+        self.assertEqual([r["webElementId"] for r in self.ground(website="g1.com", q="buy")], ["2"])
+        self.assertEqual(self.client.get("/api/ground/", {"x": 1, "y": 1}).status_code, 400)
+
+    def test_new_scroll_is_picked_up(self):
+        self.ingest("g2.com", 0, [self.element(1, "/html/body/header[1]", "top", (0, 0, 800, 60))])
+        self.assertEqual(self.ground(website="g2.com", x=20, y=1010), [])
+        self.ingest("g2.com", 1, [self.element(1, "/html/body/footer[1]", "bottom", (0, 1000, 800, 60))])
+        results = self.ground(website="g2.com", x=20, y=1010)
+        self.assertEqual([(r["scroll_index"], r["text"]) for r in results], [(1, "bottom")])
+
+
+class PromptTests(TestCase):
+    TABLE = pd.DataFrame({
+        "webElementId": ["10", "11", "12", "13", "14", "15"],
+        "xpath": ["/html[1]/body[1]/nav[1]/a[1]", "/html[1]/body[1]/nav[1]/a[2]",
+                  "/html[1]/body[1]/nav[1]/a[3]", '//*[@id="main"]/div[1]/h2[1]',
+                  '//*[@id="main"]/div[1]/p[1]', '//*[@id="main"]/div[2]/a[@href="/x|y"]'],
+        "text": ["Home", "Shop", "Help", "Offers", "Up   to\n50% off", "See all"],
+        "x": [0, 80, 160, 0, 0, 0], "y": [0, 0, 0, 100, 140, 300],
+        "width": [80, 80, 80, 600, 600, 120], "height": [40, 40, 40, 30, 60, 20],
+    })
+
+    def test_rows_and_reply_round_trip(self):
+        serialized = prompt.serialize(self.TABLE, text_chars=80, grid=8)
+        self.assertEqual(serialized.tokens, prompt.count_tokens(serialized.text))
+        rows = prompt.decode_rows(serialized.text)
+        # `|` is the field separator, so it comes back as `/`
+        self.assertEqual(rows["xpath"].tolist(), self.TABLE["xpath"].str.replace("|", "/").tolist())
+        self.assertEqual(rows["text"].tolist()[3:], ["Offers", "Up to 50% off", "See all"])
+        self.assertEqual(rows["box"].tolist()[4], "0,18,75,8")
+
+        # Row 4 is left out, row 2 claimed twice and row 9 does not exist
+        reply = "1: 0-2\n2: 3, 5\n3: 2,9\n"
+        segments = prompt.parse_reply(reply, serialized.ids)
+        self.assertEqual(segments["webElementId"].tolist(), self.TABLE["webElementId"].tolist())
+        self.assertEqual(segments["segmentId"].tolist(), [1, 1, 1, 2, 3, 2])
+
+    def test_fit_keeps_the_budget(self):
+        table = pd.DataFrame(element_payload(generate_page(nodes=601, seed=601)))
+        whole = prompt.serialize(table)
+        fitted = prompt.fit(table, budget=2000)
+        self.assertGreater(whole.tokens, 2000)
+        self.assertLessEqual(fitted.tokens, 2000)
+        self.assertEqual(fitted.tokens, prompt.count_tokens(fitted.text))
+        self.assertEqual(fitted.ids, table["webElementId"].tolist()[:len(fitted.ids)])
+        self.assertEqual(prompt.decode_rows(fitted.text)["xpath"].tolist(),
+                         table["xpath"].tolist()[:len(fitted.ids)])
+
+        small = prompt.fit(self.TABLE, budget=2000)
+        self.assertEqual(small.text, prompt.serialize(self.TABLE, grid=8).text)
+        self.assertEqual(len(prompt.fit(self.TABLE, budget=1).ids), 1)
+
+
+class StructuralFallbackTests(ScratchOutputsTestCase):
+    """
+    Without an LLM segmenter, every new scroll gets the structural segmentation as its
+    segmented CSV.
+    """
+
+    @staticmethod
+    def page(scroll_index: int) -> list:
+        nav = [{"webElementId": i, "xpath": f"/html/body/nav[1]/a[{i}]", "text": f"nav {i}",
+                "scrollIndex": scroll_index} for i in range(1, 5)]
+        cards = [{"webElementId": 10 + i, "xpath": f"/html/body/main[1]/div[{i % 2 + 1}]/p[{i}]",
+                  "text": f"card {i}", "scrollIndex": scroll_index} for i in range(1, 9)]
+        return nav + cards
+
+    def segmented(self, site: str) -> pd.DataFrame:
+        return pd.read_csv(f"Outputs/{site}/scroll_0/xpath_{site}_0_segmented.csv")
+
+    def test_segmented_on_demand_without_structural(self):
+        body = self.ingest("f.com", 0, self.page(0))
+        self.assertNotIn("structural_segmented_csv", body)
+        segmented = self.segmented("f_com")
+        self.assertEqual(segmented["webElementId"].tolist(), [e["webElementId"] for e in self.page(0)])
+        # The nav bar is a landmark, so it never shares a segment with the cards
+        nav, cards = segmented["segmentId"][:4], segmented["segmentId"][4:]
+        self.assertEqual(nav.nunique(), 1)
+        self.assertFalse(set(nav) & set(cards))
+
+    def test_structural_result_is_published(self):
+        with self.settings(EXTRACTOR_SEGMENTATION={**settings.EXTRACTOR_SEGMENTATION,
+                                                   "STRUCTURAL": True}):
+            body = self.ingest("f.com", 0, self.page(0))
+        structural = pd.read_csv(body["structural_segmented_csv"])
+        pd.testing.assert_frame_equal(self.segmented("f_com"), structural)
+
+    def test_no_fallback_when_disabled(self):
+        with self.settings(EXTRACTOR_SEGMENTATION={**settings.EXTRACTOR_SEGMENTATION,
+                                                   "LLM_FALLBACK": False}):
+            self.ingest("f.com", 0, self.page(0))
+        self.assertEqual(self.scroll_files("f_com", 0, "xpath_"), ["xpath_f_com_0.csv"])
+
+
+class AtomicWriteTests(ScratchOutputsTestCase):
+    def test_written_file_follows_the_umask(self):
+        umask = os.umask(0)
+        os.umask(umask)
+        write_csv_atomic(pd.DataFrame({"a": [1, 2]}), "table.csv")
+        self.assertEqual(os.stat("table.csv").st_mode & 0o777, 0o666 & ~umask)
+        self.assertEqual(os.listdir("."), ["table.csv"])
+
+    def test_failed_write_keeps_the_previous_file(self):
+        write_csv_atomic(pd.DataFrame({"a": [1]}), "table.csv")
+
+        class Unwritable(pd.DataFrame):
+            def to_csv(self, path, **kwargs):
+                with open(path, "w") as f:
+                    f.write("a\n")
+                raise OSError("disk full")
+
+        with self.assertRaises(OSError):
+            write_csv_atomic(Unwritable({"a": [2]}), "table.csv")
+        self.assertEqual(pd.read_csv("table.csv")["a"].tolist(), [1])
+        self.assertEqual(os.listdir("."), ["table.csv"])
+
+    def test_scroll_lock_excludes_other_holders(self):
+        os.makedirs("scroll_0")
+        seen = []
+
+        def try_lock():
+            with scroll_lock("scroll_0", blocking=False) as acquired:
+                seen.append(acquired)
+
+        with scroll_lock("scroll_0"):
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+        try_lock()
+        self.assertEqual(seen, [False, True])
+
+    def test_concurrent_recaptures_keep_every_modified_csv(self):
+        self.ingest("race.com", 0, _elements(0))
+        responses = []
+
+        def recapture(k):
+            responses.append(self.client.post(
+                "/api/extract/", json.dumps({"website": "race.com", "scroll_index": 0,
+                                             "elements": _elements(0, text=f"w{k}")}),
+                content_type="application/json"))
+
+        threads = [threading.Thread(target=recapture, args=(k,)) for k in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([response.status_code for response in responses], [200] * 8)
+        self.assertEqual(len(self.scroll_files("race_com", 0, "modified_")), 8)
+
+
+@override_settings(EXTRACTOR_PROFILING={"ENABLED": True, "DIR": "./profiles/", "TOP_N": 5})
+class ProfilingTests(ScratchOutputsTestCase):
+    def test_concurrent_profiled_requests(self):
+        responses = {}
+
+        def send(scroll_index):
+            responses[scroll_index] = self.post("/api/extract/", {
+                "website": "p.com", "scroll_index": scroll_index, "elements": _elements(scroll_index)})
+
+        threads = [threading.Thread(target=send, args=(k,)) for k in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for scroll_index, response in responses.items():
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertIn("total;dur=", response["Server-Timing"])
+            self.assertTrue(os.path.exists(response["X-Extractor-Profile"]))
+            report = response["X-Extractor-Profile"][:-len(".prof")] + ".tracemalloc.txt"
+            self.assertTrue(os.path.exists(report))
+        self.assertEqual(len(responses), 4)
+
+    def test_overlapping_profiles_do_not_stop_each_others_tracing(self):
+        class View:
+            @profile_ingest
+            def post(self, request, delay):
+                time.sleep(delay)
+                return HttpResponse("ok")
+
+        factory = RequestFactory()
+        results = []
+
+        def send(delay):
+            results.append(View().post(factory.post("/api/extract/"), delay).status_code)
+
+        # The first request finishes (and would stop tracemalloc) while the second runs
+        first = threading.Thread(target=send, args=(0.1,))
+        second = threading.Thread(target=send, args=(0.3,))
+        first.start()
+        time.sleep(0.05)
+        second.start()
+        first.join()
+        second.join()
+        self.assertEqual(results, [200, 200])
+
+
+class DecompressionTests(ScratchOutputsTestCase):
+    BODY = json.dumps({"website": "z.com", "scroll_index": 0, "elements": _elements(0)}).encode()
+
+    def send(self, body: bytes, encoding: str):
+        return self.client.post("/api/extract/", body, content_type="application/json",
+                                headers={"Content-Encoding": encoding})
+
+    def test_gzip_body_is_ingested(self):
+        response = self.send(gzip.compress(self.BODY), "gzip")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(os.path.exists(response.json()["xpath_csv"]))
+
+    def test_unsupported_encoding(self):
+        response = self.send(self.BODY, "br")
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(response.json()["error"], "Unsupported Content-Encoding: br")
+
+    def test_decompressed_size_is_capped(self):
+        with self.settings(EXTRACTOR_DECOMPRESSION={"MAX_SIZE": len(self.BODY) - 1}):
+            response = self.send(gzip.compress(self.BODY), "gzip")
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(os.path.exists("Outputs/z_com"))
+
+    def test_corrupt_body(self):
+        response = self.send(gzip.compress(self.BODY)[:-12] + b"garbage", "gzip")
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()["error"].startswith("Invalid gzip request body"))
+
+
+class XPathTreeTests(TestCase):
+    XPATHS = ["/html[1]/body[1]/nav[1]/a[1]", "/html[1]/body[1]/nav[1]/a[2]",
+              "/html[1]/body[1]/main[1]/div[1]/p[1]", "/html[1]/body[1]/main[1]/div[2]",
+              '//*[@id="cart"]/a[@href="/a/b"]']
+
+    def trees(self):
+        labels = [f"e{i}" for i in range(len(self.XPATHS))]
+        return XPathTree.from_xpaths(self.XPATHS, labels), XPathTree.from_frame(self.XPATHS, labels)
+
+    def test_steps_keep_predicates_whole(self):
+        self.assertEqual(split_steps('//*[@id="cart"]/a[@href="/a/b"]'),
+                         ['//*[@id="cart"]', 'a[@href="/a/b"]'])
+
+    def test_subtree_labels_and_depth(self):
+        for tree in self.trees():
+            self.assertEqual(tree.subtree_labels(tree.find("/html[1]/body[1]/nav[1]")), ["e0", "e1"])
+            self.assertEqual(tree.subtree_labels(tree.find("/html[1]/body[1]/main[1]")), ["e2", "e3"])
+            self.assertEqual(len(tree.subtree_labels(0)), 5)
+            self.assertEqual(tree.depth[tree.find("/html[1]/body[1]/main[1]/div[1]/p[1]")], 5)
+            self.assertEqual(tree.depth[tree.find('//*[@id="cart"]/a[@href="/a/b"]')], 2)
+            self.assertIsNone(tree.find("/html[1]/head[1]"))
+
+    def test_lca(self):
+        for tree in self.trees():
+            link, paragraph, div = (tree.find(xpath) for xpath in
+                                    (self.XPATHS[0], self.XPATHS[2], self.XPATHS[3]))
+            self.assertEqual(tree.path(tree.lca(link, paragraph)), "/html[1]/body[1]")
+            self.assertEqual(tree.path(tree.lca(paragraph, div)), "/html[1]/body[1]/main[1]")
+            self.assertEqual(tree.lca(div, tree.parent[div]), tree.parent[div])
+            self.assertEqual(tree.lca(link, tree.find(self.XPATHS[4])), 0)
+            self.assertEqual(tree.path(tree.lca_of([link, paragraph, div])), "/html[1]/body[1]")
+
+
+class VisualSegmentationTests(TestCase):
+    @staticmethod
+    def two_blocks() -> Image.Image:
+        # Two blocks of "text" lines (2px lines, 4px apart) with a 60px gap between them
+        image = Image.new("RGB", (200, 200), "white")
+        for top, bottom in ((20, 60), (120, 180)):
+            for y in range(top, bottom, 4):
+                image.paste((30, 30, 30), (20, y, 180, y + 2))
+        return image
+
+    def test_xy_cut_finds_both_blocks(self):
+        regions = visual.xy_cut(visual.edge_mask(self.two_blocks()), min_gap=12)
+        # Edges sit on the pixel before a change, hence the one-pixel shifts
+        self.assertEqual(regions.tolist(), [[19, 19, 180, 58], [19, 119, 180, 178]])
+
+    def test_elements_join_their_block(self):
+        # Scroll 1 starts at page y = 200; element 3 sits in the blank gap
+        table = pd.DataFrame({"webElementId": [1, 2, 3], "x": [30, 30, 30], "y": [230, 330, 290],
+                              "width": [50, 50, 10], "height": [20, 20, 10]})
+        groups = visual.segment_image(self.two_blocks(), table, scroll_index=1)
+        self.assertEqual(groups[visual.ID_COLUMN].tolist(), [1, 2])
+        self.assertEqual(groups[visual.GROUP_COLUMN].tolist(), [1, 2])
+
+
+class DeltaTests(ScratchOutputsTestCase):
+    def delta(self, website: str, base_version: str, **fields):
+        return self.post("/api/extract/delta/", {"website": website, "scroll_index": 0,
+                                                 "base_version": base_version, **fields})
+
+    def test_stale_base_version_conflicts(self):
+        version = self.ingest("d.com", 0, _elements(0))["version"]
+        self.ingest("d.com", 0, _elements(0, text="new"))
+
+        response = self.delta("d.com", version, changed=[{"webElementId": 2, "text": "x"}])
+        self.assertEqual(response.status_code, 409)
+        self.assertNotEqual(response.json()["version"], version)
+
+    def test_applied_delta_moves_the_version(self):
+        version = self.ingest("d.com", 0, _elements(0))["version"]
+        response = self.delta("d.com", version, changed=[{"webElementId": 2, "text": "changed"}],
+                              removed=[5])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotEqual(response.json()["version"], version)
+        current = pd.read_csv("Outputs/d_com/scroll_0/current_d_com_0.csv")
+        self.assertEqual(current["webElementId"].tolist(), [1, 2, 3, 4])
+        self.assertEqual(current.loc[current["webElementId"] == 2, "text"].item(), "changed")
+        # The old version no longer applies
+        self.assertEqual(self.delta("d.com", version, removed=[1]).status_code, 409)
+
+    def test_patch_without_screenshot_writes_nothing(self):
+        version = self.ingest("d.com", 0, _elements(0))["version"]
+        response = self.delta("d.com", version, changed=[{"webElementId": 2, "text": "x"}],
+                              image_patch={"x": 0, "y": 0, "data": _png(4, 4)})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["version"], version)
+        self.assertEqual(self.scroll_files("d_com", 0, "modified_"), [])
+
+    def test_invalid_patch_is_rejected_without_orphans(self):
+        version = self.ingest("e.com", 0, _elements(0), screenshot=_png(20, 20))["version"]
+        for patch in ({"x": 0}, {"x": "a", "data": _png(2, 2)}, {"data": "aGVsbG8="}):
+            response = self.delta("e.com", version, changed=[{"webElementId": 2, "text": "x"}],
+                                  image_patch=patch)
+            self.assertEqual(response.status_code, 400, patch)
+        self.assertEqual(self.scroll_files("e_com", 0, "modified_"), [])
+
+        response = self.delta("e.com", version, changed=[{"webElementId": 2, "text": "x"}],
+                              image_patch={"x": 3, "y": 3, "data": _png(4, 4)})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(self.scroll_files("e_com", 0, "modified_")), 1)
+
+
+class IdempotencyTests(ScratchOutputsTestCase):
+    def send(self, website: str, scroll_index: int, key: str = "k1"):
+        response = self.post("/api/extract/", {"website": website, "scroll_index": scroll_index,
+                                               "elements": _elements(scroll_index)},
+                             headers={"Idempotency-Key": key})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_retry_is_replayed(self):
+        first = self.send("a.com", 0)
+        retry = self.send("a.com", 0)
+        self.assertIsNone(first.headers.get("Idempotent-Replayed"))
+        self.assertEqual(retry.headers.get("Idempotent-Replayed"), "true")
+        self.assertEqual(retry.json(), first.json())
+
+    def test_key_is_scoped_to_site_and_scroll(self):
+        self.send("a.com", 0)
+        for website, scroll_index, site in (("a.com", 1, "a_com"), ("b.com", 0, "b_com")):
+            response = self.send(website, scroll_index)
+            self.assertIsNone(response.headers.get("Idempotent-Replayed"))
+            self.assertEqual(response.json()["xpath_csv"],
+                             f"./Outputs/{site}/scroll_{scroll_index}/xpath_{site}_{scroll_index}.csv")
+            self.assertTrue(os.path.exists(response.json()["xpath_csv"]))
+
+    def test_batch_is_reprocessed_after_the_scroll_moved(self):
+        first = self.ingest("a.com", 0, _elements(0, text="a"))
+        self.ingest("a.com", 0, _elements(0, text="b"))
+        # The page went back to A: not a retry of the first upload
+        response = self.post("/api/extract/", {"website": "a.com", "scroll_index": 0,
+                                               "elements": _elements(0, text="a")})
+        self.assertIsNone(response.headers.get("Idempotent-Replayed"))
+        self.assertEqual(response.json()["version"], "v3")
+        self.assertNotEqual(response.json()["version"], first["version"])
+        current = pd.read_csv("Outputs/a_com/scroll_0/current_a_com_0.csv")
+        self.assertEqual(current["text"].tolist(), [f"a{i}" for i in range(1, 6)])
+
+
+class BulkIngestTests(ScratchOutputsTestCase):
+    def bulk(self, body: str, content_type: str, **params):
+        query = "?" + "&".join(f"{k}={v}" for k, v in params.items()) if params else ""
+        response = self.client.post("/api/extract/bulk/" + query, body, content_type=content_type)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["results"]
+
+    def test_json_batches_are_saved_in_input_order(self):
+        batches = [{"scroll_index": 0, "elements": _elements(0)},
+                   {"scroll_index": 1, "elements": _elements(1)},
+                   {"scroll_index": 0, "elements": _elements(0, text="u")}]
+        results = self.bulk(json.dumps({"website": "k.com", "batches": batches}), "application/json")
+        self.assertEqual([(r["scroll_index"], r["outcome"]) for r in results],
+                         [(0, "initial"), (1, "initial"), (0, "recapture")])
+        self.assertEqual(len(self.scroll_files("k_com", 0, "modified_")), 1)
+        # Both new scrolls were handed on (here to the structural fallback)
+        for scroll_index in (0, 1):
+            self.assertEqual(self.scroll_files("k_com", scroll_index, f"xpath_k_com_{scroll_index}_seg"),
+                             [f"xpath_k_com_{scroll_index}_segmented.csv"])
+
+    def test_ndjson_lines_are_batches(self):
+        lines = [json.dumps({"scroll_index": i, "elements": _elements(i)}) for i in range(3)]
+        results = self.bulk("\n".join(lines) + "\n", "application/x-ndjson", website="k.com")
+        self.assertEqual([r["outcome"] for r in results], ["initial"] * 3)
+        self.assertTrue(os.path.exists("Outputs/k_com/scroll_2/xpath_k_com_2.csv"))
+
+    def test_bad_ndjson_line_is_rejected(self):
+        lines = [json.dumps({"scroll_index": 0, "elements": _elements(0)}), "{not json",
+                 json.dumps({"scroll_index": 1, "elements": _elements(1)})]
+        results = self.bulk("\n".join(lines), "application/x-ndjson", website="k.com")
+        self.assertEqual([r["outcome"] for r in results], ["initial", "rejected"])
+        self.assertFalse(os.path.exists("Outputs/k_com/scroll_1"))
+
+    def test_failed_scroll_of_a_site_job_gets_the_fallback(self):
+        with self.settings(EXTRACTOR_SEGMENTATION={**settings.EXTRACTOR_SEGMENTATION,
+                                                   "LLM_FALLBACK": False}):
+            xpath_csvs = [self.ingest("k.com", i, _elements(i))["xpath_csv"] for i in (0, 1)]
+        started = threading.Event()
+
+        def segment(xpath_csv):
+            started.wait(5)
+            if xpath_csv == xpath_csvs[1]:
+                raise ValueError("model unavailable")
+            pd.DataFrame({"webElementId": [1], "segmentId": [7]}).to_csv(
+                xpath_csv.replace(".csv", "_segmented.csv"), index=False)
+
+        queue = jobs.JobQueue("Test", lambda config: ThreadPoolExecutor(1), "TEST_QUEUE", 1)
+        with self.assertLogs("extractor.segmentation.jobs", "ERROR") as logs:
+            queue.submit_site(segment, xpath_csvs)
+            with self.assertRaises(RuntimeError):
+                queue.submit_site(segment, xpath_csvs)  # one slot for the whole site
+            started.set()
+            queue._executor.shutdown(wait=True)
+        self.assertEqual(len(logs.records), 1)
+        segmented, fallback = (pd.read_csv(path.replace(".csv", "_segmented.csv")) for path in xpath_csvs)
+        self.assertEqual(segmented["segmentId"].tolist(), [7])
+        self.assertEqual(fallback["webElementId"].tolist(), [1, 2, 3, 4, 5])
+
+
+@override_settings(EXTRACTOR_HISTORY={"ENABLED": True, "SNAPSHOT_EVERY": 3})
+class HistoryTests(ScratchOutputsTestCase):
+    def history(self, **params):
+        return self.client.get("/api/history/", {"website": "h.com", "scroll_index": 0, **params})
+
+    def test_as_of_returns_the_table_of_that_time(self):
+        marks = []
+        for k in range(5):
+            self.ingest("h.com", 0, _elements(0, count=3 + k, text=f"v{k}-"))
+            marks.append(time.time())
+            time.sleep(0.01)
+
+        for k, mark in enumerate(marks):
+            response = self.history(as_of=str(mark))
+            self.assertEqual(response.status_code, 200, response.content)
+            body = response.json()
+            self.assertEqual(body["rows_total"], 3 + k)
+            self.assertEqual({row["text"] for row in body["elements"]},
+                             {f"v{k}-{i}" for i in range(1, 4 + k)})
+
+        latest = self.history().json()
+        self.assertEqual(latest["rows_total"], 7)
+        self.assertEqual(latest["seq"], self.history(as_of=str(marks[-1])).json()["seq"])
+
+    def test_unknown_times_and_scrolls(self):
+        self.ingest("h.com", 0, _elements(0))
+        self.assertEqual(self.history(as_of="2000-01-01T00:00").status_code, 404)
+        self.assertEqual(self.history(as_of="yesterday").status_code, 400)
+        self.assertEqual(self.client.get("/api/history/", {"website": "q.com",
+                                                           "scroll_index": 0}).status_code, 404)
+
+    def test_torn_last_record_is_ignored_and_cut_off(self):
+        self.ingest("h.com", 0, _elements(0, count=3))
+        self.ingest("h.com", 0, _elements(0, count=4))
+        changes = "Outputs/h_com/scroll_0/history/changes.jsonl"
+        with open(changes, "a", encoding="utf-8") as f:
+            f.write('{"seq":3,"ts":')  # crash in the middle of an append
+        self.assertEqual(self.history().json()["rows_total"], 4)
+
+        self.ingest("h.com", 0, _elements(0, count=5))
+        self.assertEqual(self.history().json()["rows_total"], 5)
+        with open(changes, encoding="utf-8") as f:
+            self.assertEqual([json.loads(line)["seq"] for line in f], [1, 2, 3])
+
+    def test_queries_are_not_ingest_stages(self):
+        self.ingest("h.com", 0, _elements(0))
+        self.history()
+        exposition = self.client.get("/api/metrics/").content.decode()
+        self.assertIn('extractor_query_seconds_count{query="history"}', exposition)
+        self.assertNotIn('stage="history_materialize"', exposition)
+
+    def test_nothing_is_recorded_by_default(self):
+        with self.settings(EXTRACTOR_HISTORY={}):
+            self.ingest("h.com", 0, _elements(0))
+            self.ingest("h.com", 0, _elements(0, text="u"))
+        self.assertFalse(os.path.exists("Outputs/h_com/scroll_0/history"))
+
+
+class ElementBatchTests(ScratchOutputsTestCase):
+    RECORDS = [
+        {"webElementId": 1, "xpath": "/html/body/div[1]", "text": 'quoted, "text"', "x": 1.5, "y": 2},
+        {"webElementId": 2, "xpath": "/html/body/div[2]", "text": None, "y": None, "hidden": True},
+        {"webElementId": 3, "xpath": "/html/body/div[3]", "text": "two\nlines", "x": 3, "y": 4},
+        {"webElementId": 4, "xpath": "/html/body/div[4]", "text": "", "x": float("nan"), "y": 5},
+    ]
+
+    def test_csv_matches_dataframe_to_csv(self):
+        batch.ElementBatch.from_records(self.RECORDS).to_csv("batch.csv")
+        pd.DataFrame(self.RECORDS).to_csv("pandas.csv", index=False, encoding="utf-8")
+        with open("batch.csv", "rb") as ours, open("pandas.csv", "rb") as theirs:
+            self.assertEqual(ours.read(), theirs.read())
+
+    def test_projected_columns_match(self):
+        columns = ["webElementId", "xpath", "text"]
+        batch.ElementBatch.from_records(self.RECORDS).to_csv("batch.csv", columns=columns)
+        pd.DataFrame(self.RECORDS)[columns].to_csv("pandas.csv", index=False)
+        with open("batch.csv", "rb") as ours, open("pandas.csv", "rb") as theirs:
+            self.assertEqual(ours.read(), theirs.read())
+
+    def test_read_csv_and_diff(self):
+        pd.DataFrame(self.RECORDS).to_csv("previous.csv", index=False)
+        previous = batch.read_csv("previous.csv")
+        expected = pd.read_csv("previous.csv", dtype=str, keep_default_na=False)
+        self.assertEqual(previous.columns, expected.columns.tolist())
+        for name in previous.columns:
+            self.assertEqual(previous[name], expected[name].tolist())
+
+        records = [dict(record) for record in self.RECORDS]
+        records[2]["text"] = "changed"
+        changed = batch.diff(batch.ElementBatch.from_records(records), previous)
+        self.assertEqual(changed["webElementId"], ["3"])
+        self.assertEqual(changed["text"], ["changed"])
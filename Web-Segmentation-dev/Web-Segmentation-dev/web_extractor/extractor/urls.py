@@ -1,7 +1,15 @@
 from django.urls import path
-from .views import ExtractDataView
+from .views import ExtractDataView, ExtractDataAsyncView, ExtractBulkView, ExtractDeltaView, HistoryView, MetricsView, SearchView, SimilarView, GroundView
 
 urlpatterns = [
     path("extract/", ExtractDataView.as_view(), name="extract_data"), 
+    path("extract/bulk/", ExtractBulkView.as_view(), name="extract_bulk"),
+    path("extract/delta/", ExtractDeltaView.as_view(), name="extract_delta"),
+    path("extract-async/", ExtractDataAsyncView.as_view(), name="extract_data_async"),
+    path("history/", HistoryView.as_view(), name="history"),
+    path("search/", SearchView.as_view(), name="search"),
+    path("similar/", SimilarView.as_view(), name="similar"),
+    path("ground/", GroundView.as_view(), name="ground"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
     # path("extract-html/", ExtractDataView.as_view(), name="extract_html"),
 ]
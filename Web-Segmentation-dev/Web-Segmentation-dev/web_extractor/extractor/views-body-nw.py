@@ -1,14 +1,25 @@
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
+from .startup import lazy_import
+
+pd = lazy_import("pandas")
+
+
+def _load_selenium():
+    """
+    Import Selenium and webdriver_manager on the first request instead of at server start;
+    both are slow to import and only this view needs them.
+    """
+    global webdriver, By, ChromeService, WebDriverWait, EC, ChromeDriverManager
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.chrome.service import Service as ChromeService
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from webdriver_manager.chrome import ChromeDriverManager
+
 
 def get_relative_xpath(element):
     """
@@ -114,6 +125,7 @@ class ExtractDataView(APIView):
 
         try:
             # Step 1: Set up Selenium WebDriver
+            _load_selenium()
             options = webdriver.ChromeOptions()
             # options.add_argument("--headless")  # Disable headless mode for debugging
             try:
@@ -205,6 +217,7 @@ class ExtractDataView(APIView):
 
         try:
             # Step 1: Set up Selenium WebDriver
+            _load_selenium()
             options = webdriver.ChromeOptions()
             options.add_argument("--headless")  
             options.add_argument("--enable-javascript")
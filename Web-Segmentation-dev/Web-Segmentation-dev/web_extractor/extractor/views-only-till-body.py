@@ -1,14 +1,26 @@
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
+from .startup import lazy_import
+
+pd = lazy_import("pandas")
+styles = lazy_import(".styles", __package__)
+
+
+def _load_selenium():
+    """
+    Import Selenium and webdriver_manager on the first request instead of at server start;
+    both are slow to import and only this view needs them.
+    """
+    global webdriver, By, ChromeService, WebDriverWait, EC, ChromeDriverManager
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.chrome.service import Service as ChromeService
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from webdriver_manager.chrome import ChromeDriverManager
+
 
 def get_relative_xpath(element):
     """
@@ -64,6 +76,7 @@ class ExtractDataView(APIView):
 
         try:
             # Step 1: Set up Selenium WebDriver
+            _load_selenium()
             options = webdriver.ChromeOptions()
             options.add_argument("--headless")  
             driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
@@ -90,6 +103,7 @@ class ExtractDataView(APIView):
             print(f"Number of elements found: {len(elements)}")
 
             data = []
+            kept = []
             for elem in elements:
                 try:
                     if elem.is_displayed():  # Process only visible elements
@@ -98,10 +112,6 @@ class ExtractDataView(APIView):
                         y = elem.location.get("y", None)
                         width = elem.size.get("width", None)
                         height = elem.size.get("height", None)
-                        bg_color = elem.value_of_css_property("background-color") or "N/A"
-                        font_size = elem.value_of_css_property("font-size") or "N/A"
-                        font_style = elem.value_of_css_property("font-style") or "N/A"
-                        font_color = elem.value_of_css_property("color") or "N/A"
                         text = elem.text.strip()
 
                         data.append({
@@ -110,18 +120,20 @@ class ExtractDataView(APIView):
                             "y": y,
                             "width": width,
                             "height": height,
-                            "background-color": bg_color,
-                            "font-size": font_size,
-                            "font-style": font_style,
-                            "font-color": font_color,
                             "text": text,
                         })
+                        kept.append(elem)
                 except Exception as e:
                     print(f"Error processing element: {e}")
 
-            # Save data to a DataFrame
+            # Save data to a DataFrame, computed styles read for all rows in one call
             if data:
                 df = pd.DataFrame(data)
+                # Styles go to the table of the posted site (or of this page alone)
+                website = request.data.get("website") or styles.page_website(driver)
+                style_df = styles.style_columns(driver, kept, website,
+                                                missing="N/A")
+                df = pd.concat([df.drop(columns="text"), style_df, df[["text"]]], axis=1)
                 print(df)
                 df.to_csv("extracted_elements.csv", index=False)
                 print("Data saved to extracted_elements.csv")
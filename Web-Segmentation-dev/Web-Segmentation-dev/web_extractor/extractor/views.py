@@ -5,33 +5,129 @@ Objective         -   Provide an API endpoint that receives front-end scroll bat
                       
 Modules / Functions:
     ExtractDataView     -   Handles POST requests to ingest scroll batches.
+    ExtractDataAsyncView -  Async (ASGI) variant that offloads ingest work to a thread pool.
+    ExtractDeltaView    -   Applies versioned delta uploads (changed rows / image patch).
+    SearchView          -   Full-text search over captured element text.
+    SimilarView         -   Nearest stored elements to a given one across sites.
+    GroundView          -   Elements of a site at a page-space point / region or matching text.
+    HistoryView         -   Materializes a scroll's element table as of a timestamp.
+    ExtractBulkView     -   Ingests many scroll batches of one site in one request (JSON / NDJSON).
+    MetricsView         -   Exposes ingest metrics in the Prometheus text format.
+    resolve_scroll_index -  Read and validate the scroll index of a payload.
+    clean_site          -   Folder name of a website.
+    scroll_paths        -   Folder and CSV paths of a (website, scroll_index) pair.
+    replay              -   Stored response of a re-sent batch, while the scroll is at its version.
+    ingest_scroll_batch -   Save one scroll batch under the scroll folder lock.
+    ingest_scroll_delta -   Apply a delta to the stored state of a scroll.
+    ingest_site_batches -   Pipeline the scroll batches of one site through the worker pool.
     clean_xpath         -   Normalize XPaths by stripping numeric indices.
     save_screenshot     -   Decode base64 image data and save it as a PNG file.
+
+pandas, PIL, the index and segmentation modules and the LLM segmenter are loaded on
+first use (see startup.py), so importing the URLconf stays cheap.
 """
 
 # --------------------------------------- Imports ---------------------------------------
+from __future__ import annotations
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import pandas as pd
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from django.conf import settings
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, namedtuple
+from asgiref.sync import sync_to_async
+import asyncio
+import contextvars
+import functools
+import json
+import logging
 import re
 import os
+import sqlite3
+import time
 import base64
 from io import BytesIO
-from PIL import Image
 from datetime import datetime
 
 import sys, os
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-sys.path.append(os.path.join(BASE_DIR, "llm_integration"))
 
-from llm.llm_segmenter import queue_segmentation
+from . import batch, idempotency, metrics, startup
+from .parsers import NDJSONParser
+from .profiling import profile_ingest
+from .startup import lazy_import
+from .storage import save_image_atomic, scroll_lock, unique_path, write_csv_atomic
+
+pd = lazy_import("pandas")
+Image = lazy_import("PIL.Image")
+delta = lazy_import(".delta", __package__)
+grounding = lazy_import(".grounding", __package__)
+history = lazy_import(".history", __package__)
+identity = lazy_import(".identity", __package__)
+search = lazy_import(".search", __package__)
+similar = lazy_import(".similar", __package__)
+embedding = lazy_import(".segmentation.embedding", __package__)
+fusion = lazy_import(".segmentation.fusion", __package__)
+structural = lazy_import(".segmentation.structural", __package__)
+visual = lazy_import(".segmentation.visual", __package__)
+windows = lazy_import(".segmentation.windows", __package__)
+
+logger = logging.getLogger(__name__)
+
+
+@startup.on_warm_up
+@functools.lru_cache(maxsize=None)
+def _segmenter():
+    """
+    queue_segmentation of the LLM segmenter in llm_integration/ if it is installed, else
+    of a configured model endpoint (windows), else of the local embedding backend if
+    enabled, else None (the structural segmentation is published). Resolved on first use.
+    """
+    llm_dir = os.path.join(BASE_DIR, "llm_integration")
+    if llm_dir not in sys.path:
+        sys.path.append(llm_dir)
+    try:
+        from llm.llm_segmenter import queue_segmentation
+        return queue_segmentation
+    except ImportError:
+        pass
+    if windows.enabled():
+        return windows.queue_segmentation
+    if embedding.enabled():
+        return embedding.queue_segmentation
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _site_segmenter():
+    """
+    queue_site_segmentation(xpath_csvs) next to the resolved queue_segmentation, when
+    that segmenter can take all the new scrolls of a site at once; else None.
+    """
+    queue_segmentation = _segmenter()
+    module = sys.modules.get(getattr(queue_segmentation, "__module__", None))
+    return getattr(module, "queue_site_segmentation", None)
 
 
 # ---------------------- Base output directory for all scroll batches -------------------
 OUTPUT_DIR = "./Outputs/"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Worker threads for ExtractDataAsyncView; bounds how many batches are processed at once
+INGEST_EXECUTOR = ThreadPoolExecutor(
+    max_workers=getattr(settings, "EXTRACTOR_ASYNC_WORKERS", None),
+    thread_name_prefix="extract-ingest"
+)
+
+# Scroll batches of one bulk request being processed at the same time
+BULK_WINDOW = getattr(settings, "EXTRACTOR_BULK_WINDOW", 4)
+
 class ExtractDataView(APIView):
     """
     API view to process incoming scroll batch data.
@@ -40,153 +136,884 @@ class ExtractDataView(APIView):
     - On subsequent batches: diffs against previous xpath CSV, flags modifications,
       saves a timestamped modified CSV, and optional screenshot.
     """
+    @profile_ingest
     def post(self, request):
+        timer = metrics.start_request(request)
+        payload_bytes = _content_length(request)
+        elements = []
         try:
             # Get scroll_index from request or fallback to elements[0]['scrollIndex']
-            scroll_index = request.data.get("scroll_index")
-            elements = request.data.get("elements", []) or []
-            if scroll_index is None and elements:
-                first = elements[0]
-                if isinstance(first, dict) and "scrollIndex" in first:
-                    try:
-                        scroll_index = int(first["scrollIndex"])
-                    except (ValueError, TypeError):
-                        pass
-            
+            with metrics.stage("parse"):
+                data = request.data
+            elements = data.get("elements", []) or []
+            scroll_index, error = resolve_scroll_index(data, elements)
+
             # Return error if scroll_index still missing or invalid
-            if scroll_index is None:
-                return Response(
-                    {"error": "Missing scroll_index in payload or elements"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            try:
-                scroll_index = int(scroll_index)
-            except (ValueError, TypeError):
-                return Response(
-                    {"error": f"Invalid scroll_index: {scroll_index}"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            if error:
+                timer.finish("rejected", payload_bytes, len(elements))
+                return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Prepare folder and file paths for this scroll_index
-           # website = request.data.get("website", "")
-           # site_clean = re.sub(r"[^\w\-]", "_", website.replace("www.", ""))
-           # batch_folder = os.path.join(OUTPUT_DIR, f"{site_clean}_scroll_{scroll_index}")
-            #os.makedirs(batch_folder, exist_ok=True)
-
-            #uncleaned_csv = os.path.join(batch_folder, f"uncleaned_{site_clean}_{scroll_index}.csv")
-            #cleaned_csv   = os.path.join(batch_folder, f"cleaned_{site_clean}_{scroll_index}.csv")
-           # xpath_csv     = os.path.join(batch_folder, f"xpath_{site_clean}_{scroll_index}.csv")
-            #screenshot_data = request.data.get("screenshot")
-
-            website = request.data.get("website", "")
-            site_clean = re.sub(r"[^\w\-]", "_", website.replace("www.", ""))
-            site_folder = os.path.join(OUTPUT_DIR, site_clean)
-            os.makedirs(site_folder, exist_ok=True)
-            scroll_folder = os.path.join(site_folder, f"scroll_{scroll_index}")
-            os.makedirs(scroll_folder, exist_ok=True)
-            uncleaned_csv = os.path.join(scroll_folder, f"uncleaned_{site_clean}_{scroll_index}.csv")
-            cleaned_csv   = os.path.join(scroll_folder, f"cleaned_{site_clean}_{scroll_index}.csv")
-            xpath_csv     = os.path.join(scroll_folder, f"xpath_{site_clean}_{scroll_index}.csv")
-            screenshot_data = request.data.get("screenshot")
-
-
-            # Load incoming elements into a DataFrame
-            df_current = pd.DataFrame(elements)
-
-            # If an xpath CSV already exists, treat this as a modification event
-            if os.path.exists(xpath_csv):
-                # Read previous snapshot
-                prev_df = pd.read_csv(xpath_csv, dtype=str)
-                # Compare full rows to detect changes
-                curr_cmp = df_current.astype(str)
-                prev_cmp = prev_df.astype(str)
-
-                diff = curr_cmp.merge(
-                    prev_cmp.drop_duplicates(), how="left", indicator=True
-                )
-                modified = diff[diff['_merge'] != 'both'].drop(columns=['_merge'])
-                if modified.empty:
-                    return Response(
-                        {"message": "No changes detected for scroll {scroll_index}"},
-                        status=status.HTTP_200_OK
-                    )
-                # Flag with current scroll_index, remove any existing scroll columns
-                modified['flagged_scroll_index'] = scroll_index
-                for col in ('scroll_index', 'scrollIndex'):
-                    if col in modified.columns:
-                        modified.drop(columns=[col], inplace=True)
-                # Save modified rows to a timestamped CSV
-                ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-                modified_csv = os.path.join(
-                    scroll_folder,
-                    f"modified_{site_clean}_{scroll_index}_{ts}.csv"
-                )
-                modified.to_csv(modified_csv, index=False, encoding='utf-8')
-
-                # Save a separate image for this modification
-                screenshot_file = None
-                if screenshot_data:
-                    screenshot_file = save_screenshot(
-                        screenshot_data,
-                        site_clean,
-                        scroll_folder,
-                        f"modified_{scroll_index}_{ts}"
-                    )
-                return Response(
-                    {
-                        "message": "Modifications saved",
-                        "modified_csv": modified_csv,
-                        "rows_modified": len(modified),
-                        "screenshot": screenshot_file
-                    },
-                    status=status.HTTP_200_OK
+            # Re-sent or retried batches get the stored response without any work
+            key = None
+            if idempotency.enabled():
+                key = idempotency.batch_key(request, data, scroll_index, elements)
+                cached = replay(key, data.get("website", ""), scroll_index)
+                if cached is not None:
+                    timer.finish("duplicate", payload_bytes, len(elements))
+                    return Response(cached, status=status.HTTP_200_OK,
+                                    headers={"Idempotent-Replayed": "true"})
+
+            body, outcome = ingest_scroll_batch(
+                data.get("website", ""),
+                scroll_index,
+                elements,
+                data.get("screenshot"),
+                idempotency_key=key
+            )
+            timer.finish(outcome, payload_bytes, len(elements))
+            headers = {"Idempotent-Replayed": "true"} if outcome == "duplicate" else None
+            return Response(body, status=status.HTTP_200_OK, headers=headers)
+
+        except Exception as e:
+            timer.finish("error", payload_bytes, len(elements))
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class MetricsView(APIView):
+    """
+    Expose in-process ingest metrics (stage latencies, payload sizes, element counts,
+    initial vs recapture counts) for Prometheus scraping.
+    """
+    def get(self, request):
+        return HttpResponse(
+            metrics.render_prometheus(),
+            content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ExtractDataAsyncView(View):
+    """
+    Native async variant of ExtractDataView for ASGI deployments.
+
+    The event loop only awaits: JSON decoding and the whole ingest (DataFrame work,
+    screenshot decode, locked file writes) run on INGEST_EXECUTOR, so one ASGI process
+    can hold many in-flight uploads while at most EXTRACTOR_ASYNC_WORKERS batches are
+    processed at once. Request and response bodies match ExtractDataView.
+    """
+    http_method_names = ["post", "options"]
+
+    async def post(self, request):
+        timer = metrics.start_request(request)
+        payload_bytes = _content_length(request)
+        elements = []
+        loop = asyncio.get_running_loop()
+        try:
+            with metrics.stage("parse"):
+                data = await loop.run_in_executor(INGEST_EXECUTOR, json.loads, request.body or b"{}")
+            if not isinstance(data, dict):
+                timer.finish("rejected", payload_bytes, 0)
+                return JsonResponse({"error": "Expected a JSON object"}, status=status.HTTP_400_BAD_REQUEST)
+            elements = data.get("elements", []) or []
+            scroll_index, error = resolve_scroll_index(data, elements)
+            if error:
+                timer.finish("rejected", payload_bytes, len(elements))
+                return JsonResponse({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+            # copy_context() carries the request's StageTimer into the worker thread
+            context = contextvars.copy_context()
+            key = None
+            if idempotency.enabled():
+                key = await loop.run_in_executor(
+                    INGEST_EXECUTOR,
+                    functools.partial(context.run, idempotency.batch_key,
+                                      request, data, scroll_index, elements)
                 )
+                cached = await sync_to_async(replay)(key, data.get("website", ""), scroll_index)
+                if cached is not None:
+                    timer.finish("duplicate", payload_bytes, len(elements))
+                    return JsonResponse(cached, status=status.HTTP_200_OK,
+                                        headers={"Idempotent-Replayed": "true"})
 
-            # Initial load: save full batch to uncleaned, cleaned, and xpath-only CSVs
-            # Uncleaned CSV
-            df_current.to_csv(uncleaned_csv, index=False, encoding='utf-8')
-
-            # Clean XPaths and save cleaned CSV
-            df_current['original_xpath'] = df_current['xpath']
-            df_current['xpath'] = df_current['xpath'].apply(clean_xpath)
-            df_current.to_csv(cleaned_csv, index=False, encoding='utf-8')
-            
-            # XPath-only CSV
-            xpath_df = df_current[
-                ['webElementId', 'original_xpath', 'xpath', 'text']
-            ]
-            xpath_df.to_csv(xpath_csv, index=False, encoding='utf-8')
-            queue_segmentation(xpath_csv)
-
-            # Save screenshot if provided
-            screenshot_file = None
-            if screenshot_data:
-                screenshot_file = save_screenshot(
-                    screenshot_data,
-                    site_clean,
-                    scroll_folder,
-                    scroll_index
+            body, outcome = await loop.run_in_executor(
+                INGEST_EXECUTOR,
+                functools.partial(
+                    context.run, ingest_scroll_batch,
+                    data.get("website", ""), scroll_index, elements, data.get("screenshot"),
+                    key
                 )
+            )
+            timer.finish(outcome, payload_bytes, len(elements))
+            headers = {"Idempotent-Replayed": "true"} if outcome == "duplicate" else None
+            return JsonResponse(body, status=status.HTTP_200_OK, headers=headers)
 
-            # Return success response with file paths and row count
-            return Response(
-                {
-                    "message": "Scroll batch saved",
-                    "uncleaned_csv": uncleaned_csv,
-                    "cleaned_csv": cleaned_csv,
-                    "xpath_csv": xpath_csv,
-                    "rows_total": len(df_current),
-                    "screenshot": screenshot_file
-                },
-                status=status.HTTP_200_OK
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            timer.finish("rejected", payload_bytes, len(elements))
+            return JsonResponse({"error": f"Invalid JSON: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            timer.finish("error", payload_bytes, len(elements))
+            return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ExtractDeltaView(APIView):
+    """
+    Apply a delta upload to a scroll captured earlier through ExtractDataView.
+
+    Payload: website, scroll_index, base_version (the `version` returned by the last
+    upload for this scroll), and any of `added` / `changed` (element rows keyed by
+    webElementId), `removed` (webElementIds) and `image_patch` ({"x", "y", "data"}).
+    Responds 409 with the current version when base_version is stale or the scroll has
+    no baseline; the client should then send a full batch to api/extract/.
+    """
+    def post(self, request):
+        timer = metrics.start_request(request)
+        payload_bytes = _content_length(request)
+        rows = 0
+        try:
+            with metrics.stage("parse"):
+                data = request.data
+            added = data.get("added") or []
+            changed = data.get("changed") or []
+            removed = data.get("removed") or []
+            rows = len(added) + len(changed) + len(removed)
+            scroll_index, error = resolve_scroll_index(data, added or changed)
+            if not error and not data.get("base_version"):
+                error = "Missing base_version"
+            if error:
+                timer.finish("rejected", payload_bytes, rows)
+                return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+            body, outcome = ingest_scroll_delta(
+                data.get("website", ""),
+                scroll_index,
+                str(data["base_version"]),
+                added,
+                changed,
+                removed,
+                data.get("image_patch")
             )
+            timer.finish(outcome, payload_bytes, rows)
+            return Response(body, status=status.HTTP_200_OK)
 
+        except delta.DeltaConflict as e:
+            timer.finish("conflict", payload_bytes, rows)
+            return Response(
+                {"error": str(e), "version": e.current_version},
+                status=status.HTTP_409_CONFLICT
+            )
+        except ValueError as e:
+            timer.finish("rejected", payload_bytes, rows)
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
+            timer.finish("error", payload_bytes, rows)
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+
+class HistoryView(APIView):
+    """
+    Element table of a scroll as it was at a point in time.
+
+    Query: website, scroll_index, as_of (ISO-8601 or epoch seconds; default latest).
+    Responds 404 when nothing was recorded for the scroll at or before as_of.
+    """
+    def get(self, request):
+        params = request.query_params
+        scroll_index, error = resolve_scroll_index(params, [])
+        as_of = None
+        if not error and params.get("as_of"):
+            try:
+                as_of = history.parse_timestamp(params["as_of"])
+            except ValueError:
+                error = f"Invalid as_of: {params['as_of']}"
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        paths = scroll_paths(params.get("website", ""), scroll_index)
+        try:
+            with metrics.query("history"):
+                rows, seq, ts = history.materialize(paths.scroll_folder, as_of)
+        except (history.HistoryUnavailable, FileNotFoundError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "website": params.get("website", ""),
+            "scroll_index": scroll_index,
+            "seq": seq,
+            "recorded_at": datetime.fromtimestamp(ts).isoformat(),
+            "rows_total": len(rows),
+            "elements": rows
+        }, status=status.HTTP_200_OK)
+
+
+class SearchView(APIView):
+    """
+    Full-text search over captured element text, best matches first.
+
+    Query: q (required), website (or its folder name; `site` is accepted in its place),
+    scroll_index, prefix=1 to match the last word as a prefix, page (from 1) and
+    page_size (max 200).
+    The result page is streamed from the database cursor as it is read.
+    """
+    MAX_PAGE_SIZE = 200
+
+    def get(self, request):
+        params = request.query_params
+        expression = search.match_expression(params.get("q", ""), params.get("prefix") in ("1", "true"))
+        if not expression:
+            return Response({"error": "Missing search query q"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = max(1, int(params.get("page", 1)))
+            page_size = min(self.MAX_PAGE_SIZE, max(1, int(params.get("page_size", 20))))
+            scroll_index = int(params["scroll_index"]) if params.get("scroll_index") else None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        website = params.get("website") or params.get("site")
+        site = clean_site(website) if website else None
+
+        try:
+            # One extra row tells whether there is a next page
+            with metrics.query("search"):
+                matches = search.search(expression, site, scroll_index,
+                                        limit=page_size + 1, offset=(page - 1) * page_size)
+        except sqlite3.Error as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        def stream():
+            yield '{"query": %s, "page": %d, "page_size": %d, "results": [' % (
+                json.dumps(params.get("q", "")), page, page_size)
+            count, has_more = 0, False
+            for match in matches:
+                if count == page_size:
+                    has_more = True
+                    break
+                yield ("," if count else "") + json.dumps(match)
+                count += 1
+            matches.close()
+            yield '], "count": %d, "next_page": %s}' % (count, json.dumps(page + 1 if has_more else None))
+
+        return StreamingHttpResponse(stream(), content_type="application/json")
+
+
+class SimilarView(APIView):
+    """
+    Elements most like a given one across all ingested sites (approximate nearest
+    neighbours, see extractor/similar.py), best first.
+
+    Query: either website, scroll_index and webElementId of a stored element, or an
+    ad-hoc element as xpath and/or text; k (max 100) and in_site to keep one site's
+    results. `site` is accepted in place of website.
+    """
+    MAX_K = 100
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            k = min(self.MAX_K, max(1, int(params.get("k", 10))))
+            scroll_index = int(params["scroll_index"]) if params.get("scroll_index") else None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        in_site = clean_site(params["in_site"]) if params.get("in_site") else None
+
+        with metrics.query("similar"):
+            exclude = None
+            website = params.get("website") or params.get("site")
+            if params.get("webElementId"):
+                if not website or scroll_index is None:
+                    return Response({"error": "webElementId needs website and scroll_index"},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                vector, exclude = similar.element_vector(clean_site(website), scroll_index,
+                                                         params["webElementId"])
+                if vector is None:
+                    return Response({"error": "Element not found"}, status=status.HTTP_404_NOT_FOUND)
+            elif params.get("xpath") or params.get("text"):
+                vector = similar.embed(pd.DataFrame({"xpath": [params.get("xpath", "")],
+                                                     "text": [params.get("text", "")]}))[0]
+            else:
+                return Response({"error": "Give webElementId (with website and scroll_index), xpath or text"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            results = similar.query(vector, k, in_site, exclude)
+        return Response({"results": results, "count": len(results)}, status=status.HTTP_200_OK)
+
+
+class GroundView(APIView):
+    """
+    Grounding lookup for agents: the elements of a site at a page-space point or in a
+    region and/or matching a text query, with xpath, bbox and segment id, served from
+    in-memory per-site indexes (see extractor/grounding.py).
+
+    Query: website (required; `site` is accepted in its place), scroll_index, x and y
+    (a point, or with width and height a region), q, limit (max 200).
+    """
+    MAX_LIMIT = 200
+
+    def get(self, request):
+        params = request.query_params
+        website = params.get("website") or params.get("site")
+        if not website:
+            return Response({"error": "Missing website"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(self.MAX_LIMIT, max(1, int(params.get("limit", 20))))
+            scroll_index = int(params["scroll_index"]) if params.get("scroll_index") else None
+            region = None
+            if params.get("x") or params.get("y"):
+                x, y = float(params["x"]), float(params["y"])
+                region = (x, y, x + float(params.get("width", 0)), y + float(params.get("height", 0)))
+        except (KeyError, ValueError) as e:
+            return Response({"error": f"Invalid or missing parameter: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        site = clean_site(website)
+
+        with metrics.query("ground"):
+            results = grounding.ground(os.path.join(OUTPUT_DIR, site), scroll_index, region,
+                                       params.get("q"), limit)
+        return Response({"site": site, "results": results, "count": len(results)},
+                        status=status.HTTP_200_OK)
+
+
+class ExtractBulkView(APIView):
+    """
+    Ingest many scroll batches of one site in a single request.
+
+    Accepts either JSON `{"website": ..., "batches": [{scroll_index, elements, screenshot}, ...]}`
+    or NDJSON (`application/x-ndjson`), one batch object per line, with the site given by
+    `?website=` or the first batch's `website`. Batches are processed as they are read
+    and the new scrolls go to the segmenter in one hand-off once all of them are saved.
+    Responds with one result per batch, in input order.
+    """
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request):
+        started = time.perf_counter()
+        timer = metrics.start_request(request)
+        payload_bytes = _content_length(request)
+        try:
+            with metrics.stage("parse"):
+                data = request.data
+            if isinstance(data, dict):
+                website = data.get("website") or request.query_params.get("website", "")
+                batches = data.get("batches") or []
+            else:
+                website = request.query_params.get("website", "")
+                batches = data
+
+            results = ingest_site_batches(website, batches)
+            outcome, code = "bulk", status.HTTP_200_OK
+            body = {"website": website, "batches": len(results), "results": results}
+        except ParseError as e:
+            outcome, code = "rejected", status.HTTP_400_BAD_REQUEST
+            body = {"error": str(e.detail)}
+        except Exception as e:
+            outcome, code = "error", status.HTTP_500_INTERNAL_SERVER_ERROR
+            body = {"error": str(e)}
+
+        # Batch outcomes are counted per batch; the request itself only records latency
+        metrics.INGEST_REQUEST_SECONDS.observe(time.perf_counter() - started, outcome)
+        if payload_bytes is not None:
+            metrics.INGEST_PAYLOAD_BYTES.observe(payload_bytes)
+        timer.close()
+        return Response(body, status=code)
+
+
+def resolve_scroll_index(data: dict, elements: list):
+    """
+    Take scroll_index from the payload or fall back to elements[0]['scrollIndex'].
+    Returns (scroll_index, None) or (None, error message).
+    """
+    scroll_index = data.get("scroll_index")
+    if scroll_index is None and elements:
+        first = elements[0]
+        if isinstance(first, dict) and "scrollIndex" in first:
+            try:
+                scroll_index = int(first["scrollIndex"])
+            except (ValueError, TypeError):
+                pass
+    if scroll_index is None:
+        return None, "Missing scroll_index in payload or elements"
+    try:
+        return int(scroll_index), None
+    except (ValueError, TypeError):
+        return None, f"Invalid scroll_index: {scroll_index}"
+
+
+ScrollPaths = namedtuple(
+    "ScrollPaths",
+    "site_clean site_folder scroll_folder uncleaned_csv cleaned_csv xpath_csv"
+    " structural_csv segmented_csv visual_csv fused_csv"
+)
+
+
+def clean_site(website: str) -> str:
+    """
+    Folder name of a website ("www.amazon.com" -> "amazon_com").
+    """
+    return re.sub(r"[^\w\-]", "_", website.replace("www.", ""))
+
+
+@functools.lru_cache(maxsize=1024)
+def scroll_paths(website: str, scroll_index: int) -> ScrollPaths:
+    """
+    Folder and CSV paths for a (website, scroll_index) pair under OUTPUT_DIR.
+    """
+    site_clean = clean_site(website)
+    site_folder = os.path.join(OUTPUT_DIR, site_clean)
+    scroll_folder = os.path.join(site_folder, f"scroll_{scroll_index}")
+    return ScrollPaths(
+        site_clean,
+        site_folder,
+        scroll_folder,
+        os.path.join(scroll_folder, f"uncleaned_{site_clean}_{scroll_index}.csv"),
+        os.path.join(scroll_folder, f"cleaned_{site_clean}_{scroll_index}.csv"),
+        os.path.join(scroll_folder, f"xpath_{site_clean}_{scroll_index}.csv"),
+        os.path.join(scroll_folder, f"xpath_{site_clean}_{scroll_index}_structural_segmented.csv"),
+        os.path.join(scroll_folder, f"xpath_{site_clean}_{scroll_index}_segmented.csv"),
+        os.path.join(scroll_folder, f"xpath_{site_clean}_{scroll_index}_visual.csv"),
+        os.path.join(scroll_folder, f"xpath_{site_clean}_{scroll_index}_fused_segmented.csv"),
+    )
+
+
+def replay(key: str, website: str, scroll_index: int):
+    """
+    Stored response of an already processed batch, as long as the scroll is still at
+    the version that response reported; None otherwise.
+    """
+    paths = scroll_paths(website, scroll_index)
+    state = delta.load_state(delta.state_path(paths.scroll_folder, paths.site_clean, scroll_index))
+    return idempotency.lookup(key, (state or {}).get("token"))
+
+
+def ingest_scroll_batch(website: str, scroll_index: int, elements: list, screenshot_data=None,
+                        idempotency_key=None, segment=True):
+    """
+    Save one scroll batch under Outputs/<site>/scroll_<n>/.
+
+    The existence check and all writes run under the scroll folder's cross-process lock,
+    and every artifact is renamed into place only once fully written, so concurrent
+    workers never see a half-written snapshot or lose a modification. With an
+    idempotency key, a batch already processed (possibly by a request that was still
+    in flight when this one arrived) returns the stored response without any writes.
+    With segment=False the caller queues segmentation of new scrolls itself.
+    Returns (response body, outcome) with outcome "initial", "recapture", "unchanged"
+    or "duplicate".
+    """
+    # scroll_lock creates the folder
+    paths = scroll_paths(website, scroll_index)
+
+    # Load incoming elements into column lists; a DataFrame is only built for the indexes
+    with metrics.stage("dataframe"):
+        current = batch.ElementBatch.from_records(elements)
+
+    with scroll_lock(paths.scroll_folder):
+        if idempotency_key:
+            cached = replay(idempotency_key, website, scroll_index)
+            if cached is not None:
+                return cached, "duplicate"
+        body, outcome = _save_scroll_batch(paths, scroll_index, current, screenshot_data)
+        if outcome in ("initial", "recapture"):
+            table = None
+            if _needs_frame():
+                with metrics.stage("dataframe"):
+                    table = current.frame()
+                body.update(_update_indexes(paths, scroll_index, table))
+            body.update(_segment_builtin(paths, scroll_index, table, body.get("screenshot")))
+        if idempotency_key:
+            idempotency.remember(idempotency_key, body)
+
+    if outcome == "initial" and segment:
+        _queue_segmentation(paths)
+    return body, outcome
+
+
+def ingest_site_batches(website: str, batches, window: int = None) -> list:
+    """
+    Save the scroll batches of one site through INGEST_EXECUTOR, keeping up to `window`
+    batches in flight while the next ones are read and validated. Batches for the same
+    scroll index are applied in input order. Once the pipeline drains, the new scrolls
+    are handed to the segmenter together (see _queue_site_segmentation).
+    Returns one result dict per batch, in input order.
+    """
+    window = window or BULK_WINDOW
+    results = []
+    pending = deque()
+    new_scrolls = []  # paths of the scrolls this upload created, segmented together at the end
+
+    def collect():
+        slot, scroll_index, n_elements, future = pending.popleft()
+        try:
+            body, outcome = future.result()
+        except Exception as e:
+            body, outcome = {"error": str(e)}, "error"
+        metrics.INGEST_BATCHES_TOTAL.inc(outcome)
+        metrics.INGEST_ELEMENTS.observe(n_elements)
+        if outcome == "initial":
+            new_scrolls.append(scroll_paths(website, scroll_index))
+        results[slot] = dict(body, scroll_index=scroll_index, outcome=outcome)
+
+    batches = iter(batches)
+    while True:
+        try:
+            batch = next(batches, None)
+        except ParseError as e:
+            # A malformed NDJSON line ends the stream; earlier batches are still saved
+            metrics.INGEST_BATCHES_TOTAL.inc("rejected")
+            results.append({"error": str(e.detail), "outcome": "rejected"})
+            break
+        if batch is None:
+            break
+        if not isinstance(batch, dict):
+            metrics.INGEST_BATCHES_TOTAL.inc("rejected")
+            results.append({"error": "Batch is not an object", "outcome": "rejected"})
+            continue
+        website = website or batch.get("website", "")
+        elements = batch.get("elements", []) or []
+        scroll_index, error = resolve_scroll_index(batch, elements)
+        if not error and batch.get("website") and batch["website"] != website:
+            error = f"Batch belongs to {batch['website']}, not {website}"
+        if error:
+            metrics.INGEST_BATCHES_TOTAL.inc("rejected")
+            results.append({"error": error, "scroll_index": scroll_index, "outcome": "rejected"})
+            continue
+
+        key = None
+        if idempotency.enabled():
+            key = idempotency.batch_key(None, dict(batch, website=website), scroll_index, elements)
+
+        # A later batch for the same scroll must see the earlier one's result
+        while pending and (len(pending) >= window or any(p[1] == scroll_index for p in pending)):
+            collect()
+        results.append(None)
+        future = INGEST_EXECUTOR.submit(
+            contextvars.copy_context().run,
+            ingest_scroll_batch,
+            website, scroll_index, elements, batch.get("screenshot"), key, False
+        )
+        pending.append((len(results) - 1, scroll_index, len(elements), future))
+
+    while pending:
+        collect()
+
+    _queue_site_segmentation(new_scrolls)
+    return results
+
+
+def _save_scroll_batch(paths: ScrollPaths, scroll_index: int, current: batch.ElementBatch,
+                       screenshot_data=None):
+    """
+    Initial-vs-modification decision and writes for one batch; caller holds the scroll lock.
+    """
+    site_clean, scroll_folder = paths.site_clean, paths.scroll_folder
+    uncleaned_csv, cleaned_csv, xpath_csv = paths.uncleaned_csv, paths.cleaned_csv, paths.xpath_csv
+    current_csv = os.path.join(scroll_folder, f"current_{site_clean}_{scroll_index}.csv")
+    state_file = delta.state_path(scroll_folder, site_clean, scroll_index)
+
+    # If an xpath CSV already exists, treat this as a modification event
+    if os.path.exists(xpath_csv):
+        # Read previous snapshot
+        with metrics.stage("read_previous"):
+            previous_xpaths = batch.read_csv(xpath_csv)
+        # Compare full rows to detect changes
+        with metrics.stage("diff"):
+            modified = batch.diff(current, previous_xpaths)
+        if modified.empty:
+            state = delta.load_state(state_file) or {}
+            return {
+                "message": "No changes detected for scroll {scroll_index}",
+                "version": state.get("token")
+            }, "unchanged"
+        # Flag with current scroll_index, remove any existing scroll columns
+        modified['flagged_scroll_index'] = scroll_index
+        modified.drop(('scroll_index', 'scrollIndex'))
+        # Save modified rows to a timestamped CSV; batches landing within the same
+        # second get a numeric suffix instead of overwriting each other
+        prefix = f"modified_{site_clean}_{scroll_index}_"
+        modified_csv = unique_path(os.path.join(
+            scroll_folder,
+            f"{prefix}{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        ))
+        ts = os.path.basename(modified_csv)[len(prefix):-len(".csv")]
+        with metrics.stage("write_modified_csv"):
+            write_csv_atomic(modified, modified_csv)
+
+        # Save a separate image for this modification
+        screenshot_file = None
+        if screenshot_data:
+            screenshot_file = save_screenshot(
+                screenshot_data,
+                site_clean,
+                scroll_folder,
+                f"modified_{scroll_index}_{ts}"
+            )
+
+        # History diffs against the previous state, read before current_csv is replaced
+        previous = None
+        if history.enabled():
+            previous_state = delta.load_state(state_file)
+            if previous_state and os.path.exists(previous_state["elements_csv"]):
+                with metrics.stage("read_previous"):
+                    previous = delta.read_elements(previous_state["elements_csv"])
+
+        # The full recaptured batch becomes the base for delta uploads
+        with metrics.stage("write_state"):
+            write_csv_atomic(current, current_csv)
+            version = delta.store_state(state_file, current_csv, screenshot_file)
+        if history.enabled():
+            # Row deltas against the previous state are computed on DataFrames
+            _record_history(scroll_folder, current if previous is None else current.frame(),
+                            previous)
+        return {
+            "message": "Modifications saved",
+            "modified_csv": modified_csv,
+            "rows_modified": len(modified),
+            "screenshot": screenshot_file,
+            "version": version
+        }, "recapture"
+
+    # Initial load: save full batch to uncleaned, cleaned, and xpath-only CSVs
+    # Uncleaned CSV
+    with metrics.stage("write_uncleaned_csv"):
+        write_csv_atomic(current, uncleaned_csv)
+    # History keeps the batch as sent, before the xpath columns are rewritten below
+    if history.enabled():
+        _record_history(scroll_folder, current)
+
+    # Clean XPaths and save cleaned CSV
+    with metrics.stage("clean_xpath"):
+        current['original_xpath'] = current['xpath']
+        current['xpath'] = [clean_xpath(xpath) for xpath in current['xpath']]
+    with metrics.stage("write_cleaned_csv"):
+        write_csv_atomic(current, cleaned_csv)
+
+    # Save screenshot if provided
+    screenshot_file = None
+    if screenshot_data:
+        screenshot_file = save_screenshot(
+            screenshot_data,
+            site_clean,
+            scroll_folder,
+            scroll_index
+        )
+
+    # XPath-only CSV; written last because its presence marks the scroll as captured
+    with metrics.stage("write_xpath_csv"):
+        write_csv_atomic(current, xpath_csv,
+                         columns=['webElementId', 'original_xpath', 'xpath', 'text'])
+    # The uncleaned CSV holds the batch exactly as sent, so it is the first delta base
+    version = delta.store_state(state_file, uncleaned_csv, screenshot_file)
+
+    return {
+        "message": "Scroll batch saved",
+        "uncleaned_csv": uncleaned_csv,
+        "cleaned_csv": cleaned_csv,
+        "xpath_csv": xpath_csv,
+        "rows_total": len(current),
+        "screenshot": screenshot_file,
+        "version": version
+    }, "initial"
+
+
+
+
+def ingest_scroll_delta(website: str, scroll_index: int, base_version: str, added=(),
+                        changed=(), removed=(), image_patch=None):
+    """
+    Apply added / changed / removed rows and an optional image patch to the stored state
+    of a scroll, under the scroll lock. The change rows are saved as a timestamped
+    modified CSV (with a `change` column) like a full recapture would.
+    Returns (response body, "delta"); raises delta.DeltaConflict on a version mismatch
+    (or an image patch without a stored screenshot) and ValueError on malformed rows or
+    patch data, in both cases before anything is written.
+    """
+    paths = scroll_paths(website, scroll_index)
+    site_clean, scroll_folder = paths.site_clean, paths.scroll_folder
+    state_file = delta.state_path(scroll_folder, site_clean, scroll_index)
+    current_csv = os.path.join(scroll_folder, f"current_{site_clean}_{scroll_index}.csv")
+    if not os.path.isdir(scroll_folder):
+        raise delta.DeltaConflict(f"Scroll {scroll_index} of {website} has no baseline; send a full batch")
+
+    with scroll_lock(scroll_folder):
+        state = delta.load_state(state_file)
+        if state is None:
+            raise delta.DeltaConflict(f"Scroll {scroll_index} of {website} has no baseline; send a full batch")
+        if base_version != state["token"]:
+            raise delta.DeltaConflict(
+                f"Stale base_version {base_version}; current version is {state['token']}",
+                state["token"]
+            )
+
+        with metrics.stage("read_previous"):
+            current = delta.read_elements(state["elements_csv"])
+        with metrics.stage("diff"):
+            table, changes = delta.apply_rows(current, added, changed, removed)
+
+        prefix = f"modified_{site_clean}_{scroll_index}_"
+        modified_csv = unique_path(os.path.join(
+            scroll_folder,
+            f"{prefix}{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        ))
+        ts = os.path.basename(modified_csv)[len(prefix):-len(".csv")]
+
+        # Decoded before anything is written, so a rejected patch leaves no orphan CSV
+        patched = None
+        if image_patch:
+            with metrics.stage("screenshot_patch"):
+                patched = delta.patch_image(state.get("screenshot"), image_patch, state["token"])
+
+        if changes.empty:
+            modified_csv = None
+        else:
+            changes['flagged_scroll_index'] = scroll_index
+            for col in ('scroll_index', 'scrollIndex'):
+                if col in changes.columns:
+                    changes.drop(columns=[col], inplace=True)
+            with metrics.stage("write_modified_csv"):
+                write_csv_atomic(changes, modified_csv)
+
+        screenshot_file = None
+        if patched is not None:
+            with metrics.stage("screenshot_save"):
+                screenshot_file = save_image_atomic(
+                    patched,
+                    os.path.join(scroll_folder, f"{site_clean}_modified_{scroll_index}_{ts}.png")
+                )
+
+        with metrics.stage("write_state"):
+            write_csv_atomic(table, current_csv)
+            version = delta.store_state(state_file, current_csv, screenshot_file)
+        if history.enabled():
+            _record_history(scroll_folder, table, current)
+        indexed = _update_indexes(paths, scroll_index, table)
+        indexed.update(_segment_builtin(paths, scroll_index, table,
+                                        screenshot_file or state.get("screenshot")))
+
+    return {
+        "message": "Delta applied",
+        "modified_csv": modified_csv,
+        "rows_added": int((changes["change"] == "added").sum()),
+        "rows_changed": int((changes["change"] == "changed").sum()),
+        "rows_removed": int((changes["change"] == "removed").sum()),
+        "rows_total": len(table),
+        "screenshot": screenshot_file,
+        "version": version,
+        **indexed
+    }, "delta"
+
+
+def _update_indexes(paths: ScrollPaths, scroll_index: int, table: pd.DataFrame) -> dict:
+    """
+    Bring the identity, search and similar-element indexes up to date with the new
+    element table of a scroll; returns fields to add to the response body.
+    """
+    # The initial save has already cleaned `xpath` and kept the raw one as original_xpath
+    if "original_xpath" in table.columns:
+        original, cleaned = table["original_xpath"], table["xpath"]
+    else:
+        original, cleaned = table["xpath"].astype(str), None
+
+    body = {}
+    if identity.enabled():
+        with metrics.stage("identity"):
+            if cleaned is None:
+                cleaned = original.map(clean_xpath)
+            body.update(identity.assign(paths.site_folder, paths.scroll_folder, paths.site_clean,
+                                        scroll_index, table, cleaned, original))
+    if search.enabled():
+        with metrics.stage("search_index"):
+            search.index_scroll(paths.site_clean, scroll_index, table, original)
+    if similar.enabled():
+        with metrics.stage("similar_index"):
+            similar.submit(paths.site_clean, scroll_index, table, original)
+    return body
+
+
+def _needs_frame() -> bool:
+    # Whether any index or built-in segmenter will read the scroll's new table
+    return (identity.enabled() or search.enabled() or similar.enabled()
+            or structural.enabled() or visual.enabled())
+
+
+def _segment_builtin(paths: ScrollPaths, scroll_index: int, table: pd.DataFrame,
+                     screenshot: str = None) -> dict:
+    """
+    Write the structural segmentation of the scroll's new element table (elements first
+    captured in an earlier scroll take their segment there, see identity.py) and, when
+    the rows have boxes and a screenshot is stored, its visual segmentation and the
+    fusion of both; returns fields to add to the response body. Visual and fused CSVs left
+    from an earlier state are removed when they cannot be recomputed. Caller holds the
+    scroll lock.
+    """
+    body = {}
+    structural_table = visual_table = None
+    if structural.enabled():
+        with metrics.stage("structural_segmentation"):
+            unique, copied = (identity.split_duplicates(table, paths.xpath_csv, "_structural_segmented.csv")
+                              if identity.enabled() else (table, {}))
+            structural_table = identity.restore_duplicates(table, structural.segment(unique), copied)
+            write_csv_atomic(structural_table, paths.structural_csv)
+        body["structural_segmented_csv"] = paths.structural_csv
+    if visual.enabled() and visual.has_boxes(table) and screenshot and os.path.exists(screenshot):
+        with metrics.stage("visual_segmentation"):
+            visual_table = visual.segment_image(screenshot, table, scroll_index)
+            write_csv_atomic(visual_table, paths.visual_csv)
+        body["visual_csv"] = paths.visual_csv
+    if fusion.enabled() and structural_table is not None and visual_table is not None:
+        with metrics.stage("segment_fusion"):
+            write_csv_atomic(fusion.fuse(structural_table, visual_table), paths.fused_csv)
+        body["fused_segmented_csv"] = paths.fused_csv
+
+    for key, path in (("visual_csv", paths.visual_csv), ("fused_segmented_csv", paths.fused_csv)):
+        if key not in body and os.path.exists(path):
+            os.remove(path)
+    return body
+
+
+def _queue_segmentation(paths: ScrollPaths) -> None:
+    """
+    Hand a new scroll to the LLM segmenter. When it is not installed or does not accept
+    the job (e.g. its queue is saturated), the fused (else structural) segmentation
+    becomes the scroll's segmented CSV, unless one has already been written.
+    """
+    queue_segmentation = _segmenter()
+    if queue_segmentation is not None:
+        try:
+            with metrics.stage("queue_segmentation"):
+                queue_segmentation(paths.xpath_csv)
+            return
+        except Exception:
+            logger.exception("LLM segmentation not queued for %s", paths.xpath_csv)
+    structural.publish_fallback(paths.xpath_csv)
+
+
+def _queue_site_segmentation(paths: list) -> None:
+    """
+    Hand the new scrolls of one site to the segmenter in a single job when it takes a
+    whole site (queue_site_segmentation, as the built-in backends do), else one scroll at
+    a time. When the site job is not accepted, every scroll gets its fallback.
+    """
+    if not paths:
+        return
+    queue_site_segmentation = _site_segmenter()
+    if queue_site_segmentation is None:
+        for scroll in paths:
+            _queue_segmentation(scroll)
+        return
+    try:
+        with metrics.stage("queue_segmentation"):
+            queue_site_segmentation([scroll.xpath_csv for scroll in paths])
+        return
+    except Exception:
+        logger.exception("LLM segmentation not queued for %s", paths[0].site_clean)
+    for scroll in paths:
+        structural.publish_fallback(scroll.xpath_csv)
+
+
+def _record_history(scroll_folder: str, table: pd.DataFrame, previous: pd.DataFrame = None):
+    with metrics.stage("history"):
+        return history.record(scroll_folder, table, previous)
+
+
 def clean_xpath(xpath: str) -> str:
     """
     Remove numeric subscripts (e.g., [1], [2]) and trailing numeric segments from an XPath string.
@@ -201,9 +1028,22 @@ def save_screenshot(base64_string: str, site_clean: str, folder: str, index: str
     Decode a base64-encoded image (data URL) and save it as a PNG file.
     Returns the file path of the saved image.
     """
-    header, data = base64_string.split(',', 1)
-    img_data = base64.b64decode(data)
-    img = Image.open(BytesIO(img_data))
+    with metrics.stage("screenshot_decode"):
+        header, data = base64_string.split(',', 1)
+        img_data = base64.b64decode(data)
+        img = Image.open(BytesIO(img_data))
+        img.load()
     filename = os.path.join(folder, f"{site_clean}_{index}.png")
-    img.save(filename)
+    with metrics.stage("screenshot_save"):
+        save_image_atomic(img, filename)
     return filename
+
+
+def _content_length(request) -> int:
+    """
+    Size of the request body as declared by the client (0 when absent or malformed).
+    """
+    try:
+        return int(request.META.get("CONTENT_LENGTH") or 0)
+    except (ValueError, TypeError):
+        return 0
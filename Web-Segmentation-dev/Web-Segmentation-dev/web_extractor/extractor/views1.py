@@ -1,14 +1,26 @@
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
+from .startup import lazy_import
+
+pd = lazy_import("pandas")
+styles = lazy_import(".styles", __package__)
+
+
+def _load_selenium():
+    """
+    Import Selenium and webdriver_manager on the first request instead of at server start;
+    both are slow to import and only this view needs them.
+    """
+    global webdriver, By, ChromeService, WebDriverWait, EC, ChromeDriverManager
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.chrome.service import Service as ChromeService
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from webdriver_manager.chrome import ChromeDriverManager
+
 
 def get_relative_xpath(element):
     """
@@ -47,6 +59,7 @@ class ExtractDataView(APIView):
 
         try:
             # Step 1: Set up Selenium WebDriver
+            _load_selenium()
             options = webdriver.ChromeOptions()
             options.add_argument("--headless")  # Run in headless mode
             driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
@@ -67,6 +80,7 @@ class ExtractDataView(APIView):
             elements = driver.find_elements(By.XPATH, "//*")
             print(f"Number of elements found: {len(elements)}")  # Debug: Check element count
             data = []
+            kept = []
 
             for elem in elements:
                 try:
@@ -76,10 +90,6 @@ class ExtractDataView(APIView):
                     y = elem.location["y"]
                     width = elem.size["width"]
                     height = elem.size["height"]
-                    bg_color = elem.value_of_css_property("background-color")
-                    font_size = elem.value_of_css_property("font-size")
-                    font_style = elem.value_of_css_property("font-style")
-                    font_color = elem.value_of_css_property("color")
                     text = elem.text.strip()
 
                     # Append the data
@@ -89,17 +99,19 @@ class ExtractDataView(APIView):
                         "y": y,
                         "width": width,
                         "height": height,
-                        "background-color": bg_color,
-                        "font-size": font_size,
-                        "font-style": font_style,
-                        "font-color": font_color,
                         "text": text,
                     })
+                    kept.append(elem)
                 except Exception as e:
                     print(f"Error processing element: {e}")
 
-            # Save data to a DataFrame
+            # Save data to a DataFrame, computed styles read for all rows in one call
             df = pd.DataFrame(data)
+            if data:
+                # Styles go to the table of the posted site (or of this page alone)
+                website = request.data.get("website") or styles.page_website(driver)
+                style_df = styles.style_columns(driver, kept, website)
+                df = pd.concat([df.drop(columns="text"), style_df, df[["text"]]], axis=1)
             print(df)
 
             # Save to CSV
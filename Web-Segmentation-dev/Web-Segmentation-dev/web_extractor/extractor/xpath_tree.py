@@ -0,0 +1,273 @@
+"""
+Objective         -   Prefix tree over parsed XPath steps, for "all elements under this path"
+                      queries without scanning and string-prefix matching every row.
+
+                      XPaths are split into steps (`/html[1]`, `//*[@id="nav"]`, `div[3]`, ...),
+                      each step is interned to an integer, and every distinct path prefix becomes
+                      a node stored in flat integer arrays (parent, step token, depth) with a
+                      (parent, token) -> child hash map. Elements are attached to the node of their
+                      XPath as labels. freeze() numbers the nodes in pre-order, so a subtree is a
+                      contiguous interval: enumerating the elements under a path is a bisect plus
+                      a slice, O(log n + k), and lowest common ancestors use binary lifting,
+                      O(log depth). A tree can be built per scroll (labels are webElementIds) or
+                      per site (labels are (scroll_index, webElementId) pairs).
+
+Modules / Functions:
+    split_steps         -   Split an XPath into its location steps.
+    XPathTree           -   The prefix tree (insert / vectorized from_frame, lookup, subtree, LCA, depth).
+    scroll_tree         -   Tree of one scroll's xpath CSV.
+    site_tree           -   Tree of every scroll of a site.
+"""
+
+# --------------------------------------- Imports ---------------------------------------
+import bisect
+import glob
+import os
+import re
+from array import array
+
+import numpy as np
+import pandas as pd
+
+
+ROOT = 0
+
+
+# One location step: optional `//`, then anything but `/` outside of [predicates]
+# (quoted strings inside predicates may contain `/` and `]`)
+STEP_RE = re.compile(r"""(?://)?(?:[^/\["']+|\[(?:[^\]"']+|"[^"]*"|'[^']*')*\])+""")
+
+
+def split_steps(xpath: str) -> list:
+    """
+    Location steps of an XPath; a step reached through `//` keeps the `//` prefix.
+    Slashes inside predicates (`[@href="/a/b"]`) do not split.
+    """
+    return STEP_RE.findall(xpath)
+
+
+class XPathTree:
+    """
+    Nodes are integers; node 0 is the virtual root above the first step. Inserting
+    after freeze() is allowed and simply invalidates the pre-order numbering, which
+    the next query rebuilds.
+    """
+    __slots__ = ("steps", "step_ids", "parent", "token", "depth", "child", "label_node",
+                 "labels", "_tin", "_tout", "_by_tin", "_label_order", "_label_tin", "_up")
+
+    def __init__(self):
+        self.steps = []
+        self.step_ids = {}
+        self.parent = array("i", [-1])
+        self.token = array("i", [-1])
+        self.depth = array("i", [0])
+        self.child = {}
+        self.label_node = array("i")
+        self.labels = []
+        self._tin = None
+
+    def __len__(self):
+        return len(self.parent)
+
+    # ------------------------------------ building -------------------------------------
+    def _intern(self, step: str) -> int:
+        token = self.step_ids.get(step)
+        if token is None:
+            token = self.step_ids[step] = len(self.steps)
+            self.steps.append(step)
+        return token
+
+    def insert(self, xpath: str, label=None) -> int:
+        """
+        Add the path (and its prefixes) and attach `label` to its node; returns the node.
+        """
+        node = ROOT
+        for step in split_steps(xpath):
+            token = self._intern(step)
+            key = (node << 32) | token
+            nxt = self.child.get(key)
+            if nxt is None:
+                nxt = self.child[key] = len(self.parent)
+                self.parent.append(node)
+                self.token.append(token)
+                self.depth.append(self.depth[node] + 1)
+            node = nxt
+        if label is not None:
+            self.label_node.append(node)
+            self.labels.append(label)
+        self._tin = None
+        return node
+
+    @classmethod
+    def from_frame(cls, xpaths, labels=None):
+        """
+        Build the tree for many XPaths at once with vectorized NumPy / pandas operations:
+        steps are factorized into tokens and nodes are created one depth level at a time.
+        Same result as inserting the XPaths one by one (up to node numbering).
+        """
+        tree = cls()
+        xpaths = pd.Series(xpaths, dtype=object).fillna("").astype(str).reset_index(drop=True)
+        labels = list(labels) if labels is not None else list(range(len(xpaths)))
+        flat = xpaths.str.findall(STEP_RE).explode().dropna()
+        rows = flat.index.to_numpy()
+        tokens, steps = pd.factorize(flat.to_numpy())
+        level = flat.groupby(level=0).cumcount().to_numpy()
+
+        node_of_row = np.zeros(len(xpaths), dtype=np.int64)
+        parent, token, depth = [np.array([-1])], [np.array([-1])], [np.array([0])]
+        n_nodes, n_tokens = 1, max(len(steps), 1)
+        for d in range(int(level.max()) + 1 if len(level) else 0):
+            at = level == d
+            r = rows[at]
+            keys, inverse = np.unique(node_of_row[r] * n_tokens + tokens[at], return_inverse=True)
+            parent.append(keys // n_tokens)
+            token.append(keys % n_tokens)
+            depth.append(np.full(len(keys), d + 1))
+            node_of_row[r] = n_nodes + inverse
+            n_nodes += len(keys)
+
+        parent, token = np.concatenate(parent), np.concatenate(token)
+        tree.steps = list(steps)
+        tree.step_ids = {step: i for i, step in enumerate(tree.steps)}
+        tree.parent = array("i", parent.astype(np.int32).tobytes())
+        tree.token = array("i", token.astype(np.int32).tobytes())
+        tree.depth = array("i", np.concatenate(depth).astype(np.int32).tobytes())
+        tree.child = dict(zip(((parent[1:] << 32) | token[1:]).tolist(), range(1, n_nodes)))
+        tree.label_node = array("i", node_of_row.astype(np.int32).tobytes())
+        tree.labels = labels
+        return tree
+
+    @classmethod
+    def from_xpaths(cls, xpaths, labels=None):
+        tree = cls()
+        labels = labels if labels is not None else range(len(xpaths))
+        for xpath, label in zip(xpaths, labels):
+            tree.insert(str(xpath), label)
+        return tree.freeze()
+
+    def freeze(self):
+        """
+        Number the nodes in pre-order, order the labels by it and build the binary
+        lifting table; O(n log depth).
+        """
+        n = len(self.parent)
+        children = [[] for _ in range(n)]
+        for node in range(1, n):
+            children[self.parent[node]].append(node)
+        tin, tout = array("i", [0]) * n, array("i", [0]) * n
+        by_tin = array("i", [0]) * n
+        clock = 0
+        stack = [ROOT]
+        while stack:
+            node = stack.pop()
+            if node < 0:
+                tout[~node] = clock
+                continue
+            tin[node] = clock
+            by_tin[clock] = node
+            clock += 1
+            stack.append(~node)
+            stack.extend(reversed(children[node]))
+        self._tin, self._tout, self._by_tin = tin, tout, by_tin
+
+        order = sorted(range(len(self.labels)), key=lambda i: tin[self.label_node[i]])
+        self._label_order = array("i", order)
+        self._label_tin = array("i", (tin[self.label_node[i]] for i in order))
+
+        up = [array("i", (max(p, 0) for p in self.parent))]
+        for _ in range(max(self.depth).bit_length() if n > 1 else 0):
+            prev = up[-1]
+            up.append(array("i", (prev[prev[v]] for v in range(n))))
+        self._up = up
+        return self
+
+    def _frozen(self):
+        if self._tin is None:
+            self.freeze()
+
+    # ------------------------------------- queries -------------------------------------
+    def find(self, xpath: str):
+        """
+        Node of `xpath`, or None if no inserted path has it as a prefix.
+        """
+        node = ROOT
+        for step in split_steps(xpath):
+            token = self.step_ids.get(step)
+            if token is None:
+                return None
+            node = self.child.get((node << 32) | token)
+            if node is None:
+                return None
+        return node
+
+    def path(self, node: int) -> str:
+        steps = []
+        while node > ROOT:
+            step = self.steps[self.token[node]]
+            steps.append(step if step.startswith("//") else "/" + step)
+            node = self.parent[node]
+        return "".join(reversed(steps))
+
+    def subtree_nodes(self, node: int) -> list:
+        """
+        The node and all its descendants, in pre-order.
+        """
+        self._frozen()
+        return self._by_tin[self._tin[node]:self._tout[node]].tolist()
+
+    def subtree_labels(self, node: int) -> list:
+        """
+        Labels attached to the node or any descendant, in pre-order of their nodes.
+        """
+        self._frozen()
+        lo = bisect.bisect_left(self._label_tin, self._tin[node])
+        hi = bisect.bisect_left(self._label_tin, self._tout[node])
+        return [self.labels[i] for i in self._label_order[lo:hi]]
+
+    def is_ancestor(self, a: int, b: int) -> bool:
+        self._frozen()
+        return self._tin[a] <= self._tin[b] < self._tout[a]
+
+    def lca(self, a: int, b: int) -> int:
+        self._frozen()
+        if self.is_ancestor(a, b):
+            return a
+        if self.is_ancestor(b, a):
+            return b
+        for level in reversed(self._up):
+            if not self.is_ancestor(level[a], b):
+                a = level[a]
+        return self.parent[a]
+
+    def lca_of(self, nodes) -> int:
+        nodes = iter(nodes)
+        result = next(nodes, ROOT)
+        for node in nodes:
+            result = self.lca(result, node)
+        return result
+
+
+def scroll_tree(xpath_csv: str) -> XPathTree:
+    """
+    Tree of one scroll's xpath CSV (original XPaths), labelled with webElementIds.
+    """
+    table = pd.read_csv(xpath_csv, dtype=str, keep_default_na=False)
+    column = "original_xpath" if "original_xpath" in table.columns else "xpath"
+    return XPathTree.from_frame(table[column], table["webElementId"].tolist())
+
+
+def site_tree(site_folder: str) -> XPathTree:
+    """
+    Tree of all scrolls of a site, labelled with (scroll_index, webElementId).
+    """
+    tree = XPathTree()
+    for xpath_csv in glob.glob(os.path.join(site_folder, "scroll_*", "xpath_*.csv")):
+        match = re.search(r"_(\d+)\.csv$", xpath_csv)
+        if not match:
+            continue
+        scroll_index = int(match.group(1))
+        table = pd.read_csv(xpath_csv, dtype=str, keep_default_na=False)
+        column = "original_xpath" if "original_xpath" in table.columns else "xpath"
+        for xpath, element_id in zip(table[column], table["webElementId"]):
+            tree.insert(xpath, (scroll_index, element_id))
+    return tree.freeze()
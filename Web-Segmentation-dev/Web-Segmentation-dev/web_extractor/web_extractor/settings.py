@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +48,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # Must be first
     'django.middleware.security.SecurityMiddleware',
+    'extractor.middleware.RequestDecompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -137,3 +140,161 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+
+# Compressed uploads send Content-Encoding, which is not a CORS-safelisted header
+CORS_ALLOW_HEADERS = (*default_headers, "content-encoding")
+
+# Opt-in request profiling for the extractor views (see extractor/profiling.py).
+# Profiles are written to DIR/<site>/scroll_<n>/ when enabled, sampled, or requested
+# via the HEADER (honoured only when ALLOW_HEADER, which defaults to DEBUG).
+EXTRACTOR_PROFILING = {
+    "ENABLED": False,
+    "SAMPLE_RATE": 0.0,
+    "HEADER": "X-Extractor-Profile",
+    "DIR": "./profiles/",
+    "TOP_N": 25,
+    "SERVER_TIMING": False,
+}
+
+# Thread pool size for the async ingest endpoint (api/extract-async/); None lets
+# Python pick min(32, cpu_count + 4).
+EXTRACTOR_ASYNC_WORKERS = None
+
+# Scroll batches of one bulk request (api/extract/bulk/) processed at the same time on
+# that pool.
+EXTRACTOR_BULK_WINDOW = 4
+
+# Recently processed scroll batches, used to answer re-sent / retried batches without
+# re-processing them (see extractor/idempotency.py). LocMemCache is per process; point
+# "extractor" at a shared backend (e.g. Redis) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'extractor': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'extractor',
+        'OPTIONS': {'MAX_ENTRIES': 4096},
+    },
+}
+
+EXTRACTOR_IDEMPOTENCY = {
+    "ENABLED": True,
+    "CACHE": "extractor",
+    "TIMEOUT": 600,
+}
+
+# Request body decompression (gzip / zstd Content-Encoding, see extractor/middleware.py).
+# MAX_SIZE caps the decompressed body; it defaults to DATA_UPLOAD_MAX_MEMORY_SIZE.
+EXTRACTOR_DECOMPRESSION = {
+    "ENABLED": True,
+    "MAX_SIZE": DATA_UPLOAD_MAX_MEMORY_SIZE,
+}
+
+# Per-scroll history of element tables (see extractor/history.py); a full snapshot is
+# written every SNAPSHOT_EVERY delta records. Prune with `manage.py compact_history`.
+# Off by default: recording a recapture reads the previous state and diffs DataFrames.
+EXTRACTOR_HISTORY = {
+    "ENABLED": False,
+    "SNAPSHOT_EVERY": 20,
+}
+
+# Site-wide element identity index (see extractor/identity.py); bbox coordinates are
+# quantized to BBOX_GRID pixels before hashing. Off by default: it runs under the scroll
+# lock of every ingest request.
+EXTRACTOR_IDENTITY = {
+    "ENABLED": False,
+    "BBOX_GRID": 16,
+}
+
+# Full-text index of element text served by api/search/ (see extractor/search.py). Off
+# by default, as it is written on every ingest request.
+EXTRACTOR_SEARCH = {
+    "ENABLED": False,
+    "DB": "./Outputs/search.sqlite3",
+}
+
+# Element embeddings and their nearest-neighbour index served by api/similar/
+# (see extractor/similar.py).
+EXTRACTOR_SIMILAR = {
+    "ENABLED": False,
+    "DIR": "./Outputs/similar/",
+    "DIM": 128,
+    "NPROBE": 16,
+    "REBUILD_TAIL": 20000,
+    "COMPACT": 0.25,
+    "QUEUE": 256,
+}
+
+# Computed-style capture of the Selenium views (views1.py, views-only-till-body.py):
+# a style_id per element into Outputs/<site>/styles.jsonl (see extractor/styles.py).
+EXTRACTOR_STYLES = {
+    "ENCODE": True,
+    "PROPERTIES": ["background-color", "font-size", "font-style", "color"],
+}
+
+# In-memory per-site element indexes served by api/ground/ (see extractor/grounding.py).
+EXTRACTOR_GROUNDING = {
+    "MAX_SITES": 16,
+    "MAX_ELEMENTS": 2000000,
+    "REFRESH": 1.0,
+    "BAND": 256,
+}
+
+# Built-in segmentation (see extractor/segmentation/). Running the built-in segmenters on
+# every batch is opt-in, as they run under its scroll lock. With STRUCTURAL the structural
+# segmenter runs on every batch. With LLM_FALLBACK a scroll the LLM segmenter is missing
+# for or refuses gets the structural segmentation as its segmented CSV, computed then if
+# STRUCTURAL is off. With VISUAL the
+# visual (screenshot XY-cut) segmenter runs when batches carry element boxes; VISUAL_SCALE
+# is the screenshots' devicePixelRatio. FUSION combines the two when both ran.
+EXTRACTOR_SEGMENTATION = {
+    "STRUCTURAL": False,
+    "MAX_SEGMENT": 40,
+    "MIN_SEGMENT": 3,
+    "BBOX_GAP": 24,
+    "LLM_FALLBACK": True,
+    "VISUAL": False,
+    "VISUAL_DOWNSAMPLE": 2,
+    "VISUAL_MIN_GAP": 12,
+    "VISUAL_SCALE": 1.0,
+    "FUSION": False,
+    "FUSION_STRUCTURAL_WEIGHT": 1.0,
+    "FUSION_VISUAL_WEIGHT": 1.0,
+    "FUSION_THRESHOLD": 2.0,
+    "PROMPT_BUDGET": 8000,
+    "PROMPT_TEXT_CHARS": 80,
+    "PROMPT_GRID": 8,
+    # OpenAI-compatible chat completions URL of the segmentation model, e.g.
+    # "http://127.0.0.1:8765/v1/chat/completions" for benchmarks/fake_model.py
+    "LLM_URL": None,
+    "LLM_CONCURRENCY": 4,
+    "LLM_WORKERS": 2,
+    "LLM_QUEUE": 32,
+    "WINDOW_OVERLAP": 16,
+    # Local hashed-embedding + clustering backend, for nodes without a model endpoint
+    "EMBEDDING": False,
+    "EMBEDDING_WORKERS": 2,
+    "EMBEDDING_QUEUE": 32,
+}
+
+# Failed background work of the extractor (segmentation jobs, index builds, warm-up) is
+# logged with its traceback under the "extractor" logger.
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "extractor": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
+# Worker start-up (see extractor/startup.py). pandas, PIL and the index / segmentation
+# modules are imported on first use; WARM_UP imports them when the WSGI / ASGI
+# application is created instead, on a background thread when BACKGROUND is set.
+EXTRACTOR_STARTUP = {
+    "WARM_UP": False,
+    "BACKGROUND": True,
+}
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web_extractor.settings')
 
 application = get_wsgi_application()
+
+# Optionally import the extractor's lazily loaded modules now (EXTRACTOR_STARTUP)
+from extractor.startup import maybe_warm_up  # noqa: E402
+maybe_warm_up()